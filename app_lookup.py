@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# app_lookup.py
+"""
+Author          :   Alexander Shelton
+Date            :   October 2024
+Name            :   Database Application
+Description     :   Checks a file of app signature hashes (DigSig) or app IDs against in450c
+                    in a single query and writes the matching rows as CSV.
+"""
+# ----- Imports ----- #
+import os
+import csv
+import sys
+import time
+import getpass
+import argparse
+from contextlib import closing
+from business_layer import BusinessLayer, COLUMN_NAMES, LOOKUP_COLUMNS
+
+def read_values(source, column):
+    """
+    Reads the values to look up, one per line. Blank lines and lines starting with '#'
+    are skipped. Signatures are hex digests and are stored in lower case, so DigSig
+    values are lowered; app IDs are kept as written.
+
+    Parameters:
+        source : (file)
+            The open file to read.
+        column : (str)
+            The column the values are looked up in, one of `LOOKUP_COLUMNS`.
+
+    Returns:
+        (list of str):
+            The values, in file order.
+    """
+    values = []
+    for line in source:
+        value = line.strip()
+        if not value or value.startswith('#'):
+            continue
+        values.append(value.lower() if column == 'digsig' else value)
+    return values
+
+def parse_args(argv=None):
+    """
+    Parses the command line of the `lookup_apps` console script.
+    """
+    parser = argparse.ArgumentParser(
+        prog='lookup_apps',
+        description='Look up a file of app signatures or app IDs in in450c and write the matching rows as CSV.'
+    )
+    parser.add_argument('file', help="file with one value per line, or - for standard input")
+    parser.add_argument('--by', choices=sorted(LOOKUP_COLUMNS), default='digsig', help='column to match (default: digsig)')
+    parser.add_argument('--output', help='where the matching rows are written (default: standard output)')
+    parser.add_argument('--missing', help='also write the values that matched no row to this file')
+    parser.add_argument('--user', default=os.getenv('DB_USER'), help='database role (default: $DB_USER)')
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    """
+    Entry point of the `lookup_apps` console script. Writes the in450c rows matching the
+    values in the file and reports, on standard error, how many values matched.
+    """
+    args = parse_args(argv)
+    if args.file == '-':
+        values = read_values(sys.stdin, args.by)
+    else:
+        with open(args.file, encoding='utf-8') as source:
+            values = read_values(source, args.by)
+
+    user = args.user or input('Username: ')
+    password = os.getenv('DB_PASSWORD') or getpass.getpass('Password: ')
+
+    started = time.perf_counter()
+    position = COLUMN_NAMES['in450c'].index(LOOKUP_COLUMNS[args.by].lower())
+    found = set()
+    rows = 0
+    layer = BusinessLayer(user, password)
+    output = open(args.output, 'w', newline='', encoding='utf-8') if args.output else sys.stdout
+    try:
+        writer = csv.writer(output)
+        writer.writerow(COLUMN_NAMES['in450c'])
+        with closing(layer.lookup_in450c(args.by, values)) as batches:
+            for batch in batches:
+                writer.writerows(batch)
+                found.update(row[position] for row in batch)
+                rows += len(batch)
+    except Exception as e:
+        print(f"Lookup failed: {e}", file=sys.stderr)
+        return 1
+    finally:
+        if output is not sys.stdout:
+            output.close()
+        layer.close_connection()
+
+    wanted = set(values)
+    missing = [value for value in dict.fromkeys(values) if value not in found]
+    if args.missing:
+        with open(args.missing, 'w', encoding='utf-8') as target:
+            target.writelines(f"{value}\n" for value in missing)
+    print(f"{len(wanted) - len(missing):,} of {len(wanted):,} {args.by} values matched {rows:,} rows "
+          f"in {time.perf_counter() - started:.2f} s", file=sys.stderr)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
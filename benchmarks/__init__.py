@@ -0,0 +1,10 @@
+#!/usr/bin/env python
+# benchmarks/__init__.py
+"""
+Author          :   Alexander Shelton
+Date            :   October 2024
+Name            :   Database Application
+Description     :   Benchmarks of the application against synthetic IN450 data at scale.
+
+Run them with `python -m benchmarks.run --rows 1m`, see benchmarks/run.py.
+"""
@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+# benchmarks/generator.py
+"""
+Author          :   Alexander Shelton
+Date            :   October 2024
+Name            :   Database Application
+Description     :   Deterministic generator of synthetic IN450 CSV files matching sql/schema.sql.
+"""
+# ----- Imports ----- #
+import os
+import sys
+import csv
+import gzip
+import random
+import hashlib
+import argparse
+import itertools
+from bulk_loader import TABLE_SPECS
+
+# Named dataset sizes, in in450a rows
+SCALES = {'1m': 1_000_000, '10m': 10_000_000, '50m': 50_000_000}
+
+# The shipped files hold ten packets per person and per app; the synthetic ones keep that ratio
+RATIOS = {'in450a': 1, 'in450b': 10, 'in450c': 10}
+
+# Rows drawn from the random generator at a time
+BLOCK = 10000
+
+# Protocols of the capture with their relative frequency and packet length range
+PROTOCOLS = [
+    ('TCP', 40, 54, 1514), ('TLSv1.2', 25, 60, 1514), ('UDP', 10, 60, 1400), ('QUIC', 10, 60, 1392),
+    ('DNS', 6, 70, 300), ('ARP', 3, 42, 60), ('ICMP', 2, 74, 98), ('HTTP', 2, 200, 1200),
+    ('SSDP', 1, 160, 220), ('MDNS', 1, 80, 400),
+]
+
+FIRST_NAMES = [
+    'Talia', 'Mychal', 'Ardis', 'Benny', 'Corina', 'Dulcie', 'Ezra', 'Faye', 'Gideon', 'Hana',
+    'Ivor', 'Jolene', 'Kip', 'Lorna', 'Milo', 'Nell', 'Orrin', 'Petra', 'Quinn', 'Rosa',
+]
+LAST_NAMES = [
+    'Finnan', 'Rockcliffe', 'Abbey', 'Barstow', 'Coggin', 'Dunleavy', 'Eckert', 'Fairweather',
+    'Gallo', 'Hurst', 'Ingham', 'Jessop', 'Kilby', 'Lowther', 'Mabey', 'Nuttall',
+]
+DOMAINS = ['fastcompany.com', 'cornell.edu', 'example.org', 'mail.net', 'webnode.com', 'ftc.gov']
+COMPANIES = ['gov.ftc', 'com.alibaba', 'org.apache', 'net.example', 'com.google', 'edu.cornell']
+PRODUCTS = ['Fixflex', 'Cardguard', 'Zathin', 'Otcom', 'Tresom', 'Bitwolf', 'Stronghold', 'Voyatouch']
+
+def _address(rng):
+    """
+    Returns a random public-looking IPv4 address.
+    """
+    return f"{rng.randint(1, 223)}.{rng.randint(0, 255)}.{rng.randint(0, 255)}.{rng.randint(1, 254)}"
+
+def _info(rng, protocol, source, destination, length):
+    """
+    Returns an Info column in the style Wireshark writes for `protocol`.
+    """
+    if protocol == 'TCP':
+        return (f"{rng.randint(49152, 65535)}  >  443 [ACK] Seq={rng.randint(1, 10 ** 6)} "
+                f"Ack={rng.randint(1, 10 ** 6)} Win=2048 Len={max(length - 66, 0)}")
+    if protocol == 'UDP':
+        return f"{rng.randint(49152, 65535)}  >  {rng.choice((53, 123, 443, 5353))} Len={max(length - 42, 0)}"
+    if protocol == 'DNS':
+        return f"Standard query 0x{rng.randint(0, 0xffff):04x} A {rng.choice(PRODUCTS).lower()}.{rng.choice(DOMAINS)}"
+    if protocol == 'ARP':
+        return f"Who has {destination}? Tell {source}"
+    if protocol == 'ICMP':
+        return f"Echo (ping) request  id=0x0001, seq={rng.randint(1, 65535)}/256, ttl=64"
+    if protocol == 'HTTP':
+        return f"GET /{rng.choice(PRODUCTS).lower()}/index.html HTTP/1.1"
+    if protocol == 'TLSv1.2':
+        return 'Application Data'
+    if protocol == 'QUIC':
+        return 'Protected Payload (KP0)'
+    return "M-SEARCH * HTTP/1.1" if protocol == 'SSDP' else 'Standard query response'
+
+def in450a_rows(count, seed=0):
+    """
+    Generates packet capture rows: increasing timestamps, a few local hosts talking to a
+    skewed pool of remote ones, protocols and lengths in realistic proportions.
+
+    Yields:
+        (list of str):
+            Time, Source, Destination, Protocol, Length and Info of one packet.
+    """
+    rng = random.Random(f"in450a:{seed}")
+    local = [f"192.168.1.{host}" for host in range(1, 255)]
+    remote = [_address(rng) for _ in range(20000)]
+    hosts = local + remote
+    # Zipf-like weights, so a handful of addresses dominate the top talkers like in a real capture
+    weights = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(hosts))))
+    protocols = [name for name, _, _, _ in PROTOCOLS]
+    ranges = {name: (low, high) for name, _, low, high in PROTOCOLS}
+    frequencies = list(itertools.accumulate(weight for _, weight, _, _ in PROTOCOLS))
+    time = 0.0
+
+    for start in range(0, count, BLOCK):
+        size = min(BLOCK, count - start)
+        sources = rng.choices(hosts, cum_weights=weights, k=size)
+        destinations = rng.choices(hosts, cum_weights=weights, k=size)
+        chosen = rng.choices(protocols, cum_weights=frequencies, k=size)
+        for source, destination, protocol in zip(sources, destinations, chosen):
+            time += rng.expovariate(2000.0)
+            length = rng.randint(*ranges[protocol])
+            yield [f"{time:.6f}", source, destination, protocol, str(length),
+                   _info(rng, protocol, source, destination, length)]
+
+def in450b_rows(count, seed=0):
+    """
+    Generates person rows with a unique email address each.
+
+    Yields:
+        (list of str):
+            first_name, last_name, email, source and destination of one person.
+    """
+    rng = random.Random(f"in450b:{seed}")
+    for number in range(count):
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        email = f"{first[0].lower()}{last.lower()}{number}@{rng.choice(DOMAINS)}"
+        yield [first, last, email, _address(rng), _address(rng)]
+
+def in450c_rows(count, seed=0):
+    """
+    Generates app rows with a unique SHA-256 digital signature each.
+
+    Yields:
+        (list of str):
+            AppID, AppName, AppVersion, source, destination and DigSig of one app.
+    """
+    rng = random.Random(f"in450c:{seed}")
+    for number in range(count):
+        product = rng.choice(PRODUCTS)
+        yield [f"{rng.choice(COMPANIES)}.{product}{number}", product, f"{rng.randint(0, 9)}.{rng.randint(0, 9)}",
+               _address(rng), _address(rng), hashlib.sha256(f"{seed}:{number}".encode()).hexdigest()]
+
+GENERATORS = {'in450a': in450a_rows, 'in450b': in450b_rows, 'in450c': in450c_rows}
+
+def parse_rows(value):
+    """
+    Converts a dataset size such as '10m' or '250000' to a number of in450a rows.
+    """
+    return SCALES[value.lower()] if value.lower() in SCALES else int(value)
+
+def table_rows(rows):
+    """
+    Returns the number of rows of each table in a dataset of `rows` packets.
+    """
+    return {table: max(rows // ratio, 1) for table, ratio in RATIOS.items()}
+
+def write_csv(table, count, path, seed=0):
+    """
+    Writes `count` generated rows of `table` to a CSV file with a header line, gzip
+    compressed if the path ends in '.gz'. The file is written under a temporary name
+    and renamed when complete, so an interrupted run never leaves a truncated dataset.
+    """
+    partial = f"{path}.partial"
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(partial, 'wt', newline='', encoding='utf-8') as target:
+        writer = csv.writer(target)
+        writer.writerow([name for name, _ in TABLE_SPECS[table]])
+        writer.writerows(GENERATORS[table](count, seed))
+    os.replace(partial, path)
+    return path
+
+def generate_dataset(rows, directory, seed=0, compress=False):
+    """
+    Writes the three CSV files of a dataset of `rows` packets to `directory`, reusing
+    files generated by an earlier run with the same size and seed.
+
+    Returns:
+        (dict):
+            The path of the CSV file of each table.
+    """
+    os.makedirs(directory, exist_ok=True)
+    paths = {}
+    for table, count in table_rows(rows).items():
+        path = os.path.join(directory, f"{table.upper()}-{count}-seed{seed}.csv{'.gz' if compress else ''}")
+        if not os.path.exists(path):
+            write_csv(table, count, path, seed)
+        paths[table] = path
+    return paths
+
+def main(argv=None):
+    """
+    Writes a synthetic dataset, e.g. `python -m benchmarks.generator --rows 10m --out /tmp/in450`.
+    """
+    parser = argparse.ArgumentParser(prog='benchmarks.generator', description=main.__doc__.strip())
+    parser.add_argument('--rows', default='1m', help="in450a rows: 1m, 10m, 50m or a number (default: 1m)")
+    parser.add_argument('--seed', type=int, default=0, help='the same seed always produces the same files')
+    parser.add_argument('--out', default='.', help='directory to write the CSV files to')
+    parser.add_argument('--gzip', action='store_true', help='gzip the files')
+    args = parser.parse_args(argv)
+    for table, path in generate_dataset(parse_rows(args.rows), args.out, args.seed, args.gzip).items():
+        print(f"{table}: {path}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,219 @@
+#!/usr/bin/env python
+# benchmarks/harness.py
+"""
+Author          :   Alexander Shelton
+Date            :   October 2024
+Name            :   Database Application
+Description     :   Timing, memory and baseline bookkeeping for the benchmarks, plus the
+                    throwaway PostgreSQL server and headless display they run against.
+"""
+# ----- Imports ----- #
+import os
+import json
+import time
+import shutil
+import socket
+import resource
+import tempfile
+import subprocess
+from contextlib import contextmanager
+
+# ----- Measurements ----- #
+def percentile(values, q):
+    """
+    Returns the `q`th percentile (0-100) of `values`, interpolating between the two
+    nearest measurements.
+    """
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+def peak_rss_mb():
+    """
+    Returns the peak resident set size of this process so far, in MiB.
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 / 1024 if os.uname().sysname == 'Darwin' else peak / 1024     # Bytes on macOS, KiB elsewhere
+
+class Recorder:
+    """
+    Times benchmarks and collects their results.
+
+    Attributes:
+        results : (dict)
+            The result of every benchmark run so far, by name.
+    """
+    def __init__(self):
+        """
+        Initializes an empty Recorder.
+        """
+        self.results = {}
+
+    def measure(self, name, work, inputs=(None,), repeat=1):
+        """
+        Runs `work` once per input, `repeat` times over, and records its latency
+        percentiles, its throughput and the peak RSS of the process afterwards. The peak
+        only ever grows, so compare it between runs of the same benchmark order.
+
+        Parameters:
+            name : (str)
+                The name the result is recorded under.
+            work : (callable)
+                Called as work(input) and returns the number of rows it handled, or None.
+            inputs : (iterable)
+                The arguments to call `work` with, e.g. the keys of pages to fetch.
+            repeat : (int)
+                How many times to go through `inputs`.
+
+        Returns:
+            (dict):
+                The recorded result.
+        """
+        latencies = []
+        rows = 0
+        for _ in range(repeat):
+            for value in inputs:
+                started = time.perf_counter()
+                handled = work(value)
+                latencies.append(time.perf_counter() - started)
+                rows += handled or 0
+        return self.record(name, latencies, rows)
+
+    def record(self, name, latencies, rows=0):
+        """
+        Records latencies measured elsewhere, e.g. by another process, like `measure` does.
+
+        Parameters:
+            name : (str)
+                The name the result is recorded under.
+            latencies : (list of float)
+                The seconds each call took.
+            rows : (int)
+                The number of rows all calls handled together.
+
+        Returns:
+            (dict):
+                The recorded result.
+        """
+        elapsed = sum(latencies)
+        result = {
+            'calls': len(latencies),
+            'p50_ms': percentile(latencies, 50) * 1000,
+            'p95_ms': percentile(latencies, 95) * 1000,
+            'p99_ms': percentile(latencies, 99) * 1000,
+            'max_ms': max(latencies) * 1000,
+            'rows': rows,
+            'rows_per_s': rows / elapsed if rows and elapsed else None,
+            'peak_rss_mb': peak_rss_mb(),
+        }
+        self.results[name] = result
+        print(f"{name:<40} p50 {result['p50_ms']:>10.2f} ms  p95 {result['p95_ms']:>10.2f} ms  "
+              f"{result['rows_per_s'] or 0:>12,.0f} rows/s  rss {result['peak_rss_mb']:>8.1f} MiB", flush=True)
+        return result
+
+# ----- Baselines ----- #
+def save_results(results, path, metadata):
+    """
+    Writes benchmark results and the settings they were measured with to a JSON file.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as target:
+        json.dump({'metadata': metadata, 'results': results}, target, indent=2, sort_keys=True)
+
+def load_results(path):
+    """
+    Reads the results written by `save_results`, or returns None if there are none.
+    """
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8') as source:
+        return json.load(source)
+
+def compare(results, baseline, tolerance):
+    """
+    Compares results with a baseline. A benchmark regressed if its median latency grew,
+    or its throughput dropped, by more than `tolerance` (e.g. 0.2 for 20%).
+
+    Returns:
+        (list of str):
+            A description of every regression.
+    """
+    regressions = []
+    for name, result in results.items():
+        before = baseline.get(name)
+        if before is None:
+            continue
+        if result['p50_ms'] > before['p50_ms'] * (1 + tolerance):
+            regressions.append(f"{name}: p50 {before['p50_ms']:.2f} ms -> {result['p50_ms']:.2f} ms")
+        if before['rows_per_s'] and result['rows_per_s'] and result['rows_per_s'] < before['rows_per_s'] / (1 + tolerance):
+            regressions.append(f"{name}: {before['rows_per_s']:,.0f} -> {result['rows_per_s']:,.0f} rows/s")
+    return regressions
+
+# ----- Environment ----- #
+def _free_port():
+    """
+    Returns a TCP port nothing is listening on right now.
+    """
+    with socket.socket() as probe:
+        probe.bind(('localhost', 0))
+        return probe.getsockname()[1]
+
+@contextmanager
+def throwaway_postgres():
+    """
+    Runs a private PostgreSQL server in a temporary directory for the duration of the
+    block and points the DB_* environment variables at it. Needs initdb and pg_ctl on the
+    PATH or in $PG_BIN. The server and all its data are deleted afterwards.
+
+    Yields:
+        (str):
+            The superuser to connect as, without a password.
+    """
+    bin_dir = os.getenv('PG_BIN', '')
+    initdb, pg_ctl = (os.path.join(bin_dir, name) if bin_dir else shutil.which(name) for name in ('initdb', 'pg_ctl'))
+    if not all(path and os.path.exists(path) for path in (initdb, pg_ctl)):
+        raise RuntimeError("A throwaway server needs initdb and pg_ctl on the PATH or in $PG_BIN")
+
+    directory = tempfile.mkdtemp(prefix='in450-bench-')
+    data = os.path.join(directory, 'data')
+    port = _free_port()
+    try:
+        subprocess.run([initdb, '-D', data, '-U', 'postgres', '--auth=trust', '-E', 'UTF8'],
+                       check=True, stdout=subprocess.DEVNULL)
+        subprocess.run([pg_ctl, '-D', data, '-l', os.path.join(directory, 'server.log'), '-w',
+                        '-o', f"-p {port} -k {directory} -c listen_addresses=localhost", 'start'], check=True)
+        os.environ.update(DB_HOST='localhost', DB_PORT=str(port), DB_NAME='postgres')
+        yield 'postgres'
+    finally:
+        subprocess.run([pg_ctl, '-D', data, '-m', 'fast', 'stop'], stdout=subprocess.DEVNULL)
+        shutil.rmtree(directory, ignore_errors=True)
+
+@contextmanager
+def headless_display():
+    """
+    Makes sure Tk has a display for the block, starting an Xvfb virtual one when there
+    is none.
+
+    Yields:
+        (bool):
+            Whether a display is available.
+    """
+    if os.getenv('DISPLAY'):
+        yield True
+        return
+    xvfb = shutil.which('Xvfb')
+    if xvfb is None:
+        yield False
+        return
+    display = f":{_free_port() % 1000 + 100}"
+    server = subprocess.Popen([xvfb, display, '-nolisten', 'tcp'], stderr=subprocess.DEVNULL)
+    time.sleep(1)                                           # Give the server time to accept connections
+    os.environ['DISPLAY'] = display
+    try:
+        yield server.poll() is None
+    finally:
+        del os.environ['DISPLAY']
+        server.terminate()
+        server.wait()
@@ -0,0 +1,352 @@
+#!/usr/bin/env python
+# benchmarks/run.py
+"""
+Author          :   Alexander Shelton
+Date            :   October 2024
+Name            :   Database Application
+Description     :   Benchmarks bulk loading, the BusinessLayer queries, Info searches, exports
+                    and the Treeview against a synthetic dataset, and compares them with a baseline.
+
+Usage:
+    python -m benchmarks.run --rows 1m --throwaway              # private server, deleted afterwards
+    python -m benchmarks.run --rows 10m --save-baseline         # record the baseline to compare against
+"""
+# ----- Imports ----- #
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import subprocess
+import psycopg2
+from bulk_loader import load_table
+from business_layer import (BusinessLayer, QueryCache, COLUMN_NAMES, LOOKUP_ARRAY_MAX, connection_args,
+                            raise_error)
+from benchmarks.generator import generate_dataset, parse_rows
+from benchmarks.harness import (Recorder, compare, headless_display, load_results, save_results,
+                                throwaway_postgres)
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SCHEMA = os.path.join(os.path.dirname(BENCH_DIR), 'sql', 'schema.sql')
+
+# Benchmarks comparing with a baseline whose name matches the dataset size
+BASELINE_DIR = os.path.join(BENCH_DIR, 'baselines')
+
+# get_in450a_data fetches the whole table into memory, so it is skipped above this many rows
+MAX_FETCHALL_ROWS = 1_000_000
+
+# Rows handed to Application.display_data at a time
+DISPLAY_ROWS = (1000, 10000, 100000)
+
+PAGE_SIZE = 500
+PAGE_SAMPLES = 50
+
+# Searches of in450a's Info, each timed through its index and as a sequential scan
+SEARCHES = ('words=ACK', 'words="standard query"', 'info=index.html', 'info=ping')
+
+# Fresh application processes started to time the startup
+STARTUP_SAMPLES = 5
+
+def create_schema(user, password):
+    """
+    Recreates the tables, indexes, views and functions of sql/schema.sql.
+    """
+    with open(SCHEMA, encoding='utf-8') as source:
+        schema = source.read()
+    conn = psycopg2.connect(**connection_args(user, password))
+    try:
+        with conn, conn.cursor() as cursor:
+            cursor.execute(schema)
+    finally:
+        conn.close()
+
+# ----- Suites ----- #
+def bench_load(recorder, paths, user, password):
+    """
+    Times `load_data` on each table, one at a time so the figures do not depend on how
+    many tables share the server.
+    """
+    for table, path in paths.items():
+        recorder.measure(
+            f"load[{table}]",
+            lambda _: load_table(table, path, user, password, truncate=True, reject_dir=tempfile.gettempdir())['loaded']
+        )
+
+def bench_queries(recorder, layer, rows):
+    """
+    Times the BusinessLayer query methods. The cache is off, so every call reaches the server.
+    """
+    from presentation_layer import parse_filters
+
+    def count(result):
+        return len(result) if result is not None else None
+
+    def once(method, *args):
+        return lambda _: method(*args) and None             # Counts and refreshes handle no rows
+
+    def stream(table, filters=None, sort=None):
+        return sum(len(batch) for batch in layer.stream_rows(table, filters, sort))
+
+    recorder.measure('refresh_analytics', once(layer.refresh_analytics))
+    recorder.measure('get_in450a_row_count', once(layer.get_in450a_row_count), repeat=10)
+    recorder.measure('get_in450b_names', lambda _: count(layer.get_in450b_names()), repeat=3)
+    recorder.measure('get_in450c_row_count', once(layer.get_in450c_row_count), repeat=10)
+    if rows <= MAX_FETCHALL_ROWS:
+        recorder.measure('get_in450a_data', lambda _: count(layer.get_in450a_data()))
+    recorder.measure('get_in450b_data', lambda _: count(layer.get_in450b_data()), repeat=3)
+    recorder.measure('get_in450c_data', lambda _: count(layer.get_in450c_data()), repeat=3)
+
+    for table in COLUMN_NAMES:
+        recorder.measure(f"stream_rows[{table}]", lambda _, table=table: stream(table))
+    filters = parse_filters('in450a', 'protocol=TCP length=1000..1500')
+    recorder.measure('stream_rows[in450a filtered]', lambda _: stream('in450a', filters))
+    recorder.measure('get_row_count[in450a filtered]', once(layer.get_row_count, 'in450a', filters), repeat=5)
+    prefix = parse_filters('in450b', 'last_name=fin')
+    recorder.measure('get_row_count[in450b prefix]', once(layer.get_row_count, 'in450b', prefix), repeat=5)
+
+    # One lookup sent as an array and one large enough to go through a temporary table
+    digsigs = [row[-1] for batch in layer.stream_rows('in450c') for row in batch]
+    for size in (1000, LOOKUP_ARRAY_MAX * 5):
+        sample = digsigs[:size]
+        recorder.measure(f"lookup_in450c[{len(sample)} digsig]",
+                         lambda _, sample=sample: sum(len(batch) for batch in layer.lookup_in450c('digsig', sample)), repeat=3)
+
+    for sort in (None, 'time', 'source'):
+        name = sort or 'id'
+        keys = layer.get_page_keys('in450a', PAGE_SIZE, sort=sort)
+        recorder.measure(f"get_page_keys[in450a {name}]", lambda _, sort=sort: count(layer.get_page_keys('in450a', PAGE_SIZE, sort=sort)))
+        sample = random.Random(0).sample(keys, min(PAGE_SAMPLES, len(keys)))
+        recorder.measure(f"get_page_after[in450a {name}]",
+                         lambda key, sort=sort: count(layer.get_page_after('in450a', key, PAGE_SIZE, sort=sort)), sample)
+
+    recorder.measure('get_protocol_stats', lambda _: count(layer.get_protocol_stats()), repeat=10)
+    recorder.measure('get_top_talkers', lambda _: count(layer.get_top_talkers('source')), repeat=10)
+    recorder.measure('get_traffic_over_time', lambda _: count(layer.get_traffic_over_time(60)), repeat=3)
+    for table in ('in450b', 'in450c'):
+        recorder.measure(f"get_traffic_report[{table}]", lambda _, table=table: count(layer.get_traffic_report(table)), repeat=3)
+        recorder.measure(f"get_traffic_report[{table} live]", lambda _, table=table: count(layer.get_traffic_report(table, live=True)))
+
+def bench_columnar(recorder, layer, rows):
+    """
+    Times building a ColumnarResult of in450a and sorting and filtering it on the client,
+    and records its memory use next to the estimated size of the same rows as tuples.
+    """
+    if rows > MAX_FETCHALL_ROWS:
+        print(f"in450a has more than {MAX_FETCHALL_ROWS:,} rows, skipping the columnar benchmarks")
+        return
+    from presentation_layer import parse_filters
+
+    held = []
+
+    def build(_):
+        held[:] = [layer.get_columnar('in450a', itersize=10000)]
+        return len(held[0])
+
+    result = recorder.measure('get_columnar[in450a]', build)
+    report = held[0].memory_report()
+    result.update(columnar_mb=report['columnar_bytes'] / 1048576, tuple_mb=report['tuple_bytes'] / 1048576)
+    print(f"{'':<40} columnar {result['columnar_mb']:,.1f} MiB, as tuples {result['tuple_mb']:,.1f} MiB "
+          f"({report['ratio'] or 0:.1f}x)")
+
+    for sort in ('time', 'source', 'protocol'):
+        recorder.measure(f"columnar.sort[{sort}]", lambda _, sort=sort: len(held[0].sort(sort)), repeat=3)
+    filters = parse_filters('in450a', 'protocol=TCP length=1000..1500 source=192.168.0.0/16')
+    recorder.measure('columnar.filter[in450a]', lambda _: len(held[0].filter(filters)), repeat=3)
+    recorder.measure('columnar.slice[in450a]', lambda _: len(held[0][len(held[0]) // 2:len(held[0]) // 2 + PAGE_SIZE]), repeat=100)
+
+def bench_search(recorder, layer, user, password):
+    """
+    Times counting the matches of each Info search and fetching its first ranked page,
+    once as the planner chooses, which uses the GIN indexes, and once on a session that
+    may not use indexes, which scans every partition.
+    """
+    from presentation_layer import parse_filters
+
+    conn = psycopg2.connect(**connection_args(user, password))
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cursor:
+            def run(query, params):
+                cursor.execute(query, params)
+                return len(cursor.fetchall())
+
+            for scan, setting in (('index', 'on'), ('seqscan', 'off')):
+                cursor.execute(f"SET enable_indexscan = {setting}; SET enable_bitmapscan = {setting};")
+                for text in SEARCHES:
+                    filters = parse_filters('in450a', text)
+                    count = layer.build_count('in450a', filters)
+                    page = layer.build_search_query(filters, PAGE_SIZE)
+                    recorder.measure(f"search_count[{text} {scan}]", lambda _: run(*count) and None, repeat=3)
+                    recorder.measure(f"search_info[{text} {scan}]", lambda _: run(*page), repeat=3)
+    finally:
+        conn.close()
+
+def bench_export(recorder, layer, directory):
+    """
+    Times exporting in450a to each file format.
+    """
+    formats = [('csv', False, '.csv'), ('csv', True, '.csv.gz')]
+    try:
+        import pyarrow                                      # noqa: F401
+        formats.append(('parquet', False, '.parquet'))
+    except ImportError:
+        print("pyarrow is not installed, skipping the Parquet export")
+    for fmt, compress, suffix in formats:
+        path = os.path.join(directory, f"in450a{suffix}")
+        recorder.measure(f"export[{suffix[1:]}]",
+                         lambda _: layer.export('in450a', path, fmt=fmt, compress=compress)['rows'])
+        os.remove(path)
+
+def bench_display(recorder, layer):
+    """
+    Times Application.display_data filling the Treeview, including drawing it.
+    """
+    import tkinter as tk
+    from presentation_layer import Application, COLUMNS
+
+    rows = []
+    for batch in layer.stream_rows('in450a', itersize=10000):
+        rows.extend(batch)
+        if len(rows) >= max(DISPLAY_ROWS):
+            break
+
+    root = tk.Tk()
+    app = Application(root, layer)
+    try:
+        for size in DISPLAY_ROWS:
+            data = rows[:size]
+
+            def display(_):
+                app.display_data(data, COLUMNS['in450a'])
+                root.update()
+                return len(data)
+
+            recorder.measure(f"display_data[{size}]", display, repeat=3)
+    finally:
+        app.runner.shutdown()
+        layer.error_handler = raise_error
+        root.destroy()
+
+def bench_startup(recorder, user, password):
+    """
+    Times starting the application in a fresh interpreter: until the login window is
+    drawn, from submitting the login until the main window is built, and from asking for
+    in450a until its first rows are on screen, plus the whole way from launch to data.
+    """
+    env = dict(os.environ, DB_USER=user, DB_PASSWORD=password)
+    root_dir = os.path.dirname(BENCH_DIR)
+    steps = {'startup.first_window': [], 'startup.login': [], 'startup.first_data': [], 'startup.launch_to_data': []}
+    for _ in range(STARTUP_SAMPLES):
+        launched = time.time()
+        output = subprocess.run([sys.executable, '-m', 'benchmarks.startup'], cwd=root_dir, env=env,
+                                check=True, capture_output=True, text=True).stdout
+        marks = json.loads(output.strip().splitlines()[-1])
+        steps['startup.first_window'].append(marks['window'] - launched)
+        steps['startup.login'].append(marks['app'] - marks['login'])
+        steps['startup.first_data'].append(marks['first_data'] - marks['request'])
+        steps['startup.launch_to_data'].append(marks['first_data'] - launched - (marks['login'] - marks['window']))
+    for name, latencies in steps.items():
+        recorder.record(name, latencies)
+
+# ----- Entry point ----- #
+def parse_args(argv=None):
+    """
+    Parses the command line of the benchmarks.
+    """
+    parser = argparse.ArgumentParser(prog='benchmarks.run', description='Benchmark the application on synthetic data.')
+    parser.add_argument('--rows', default='1m', help="in450a rows: 1m, 10m, 50m or a number (default: 1m)")
+    parser.add_argument('--seed', type=int, default=0, help='seed of the data generator')
+    parser.add_argument('--data-dir', default=os.path.join(tempfile.gettempdir(), 'in450-bench-data'),
+                        help='where generated CSV files are kept between runs')
+    parser.add_argument('--throwaway', action='store_true',
+                        help='run against a private PostgreSQL server that is deleted afterwards')
+    parser.add_argument('--user', default=os.getenv('DB_USER', 'postgres'),
+                        help='superuser of the server to benchmark, whose tables are REPLACED (default: $DB_USER)')
+    parser.add_argument('--suites', default='load,queries,search,columnar,export,gui,startup', help='comma separated suites to run')
+    parser.add_argument('--baseline', help='baseline file to compare with (default: benchmarks/baselines/<rows>.json)')
+    parser.add_argument('--save-baseline', action='store_true', help='store the results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='slowdown counted as a regression (default: 0.2)')
+    parser.add_argument('--output', help='also write the results to this JSON file')
+    return parser.parse_args(argv)
+
+def run(args, user, password):
+    """
+    Generates the dataset, loads it and runs the chosen suites.
+
+    Returns:
+        (dict):
+            The results by benchmark name.
+    """
+    rows = parse_rows(args.rows)
+    suites = set(args.suites.split(','))
+    recorder = Recorder()
+
+    print(f"Generating {rows:,} packets in {args.data_dir}", flush=True)
+    paths = generate_dataset(rows, args.data_dir, args.seed)
+
+    create_schema(user, password)
+    bench_load(recorder, paths, user, password)             # The other suites need the data, so it always loads
+
+    layer = BusinessLayer(user, password, cache=QueryCache(max_bytes=0))
+    try:
+        if 'queries' in suites:
+            bench_queries(recorder, layer, rows)
+        if 'search' in suites:
+            bench_search(recorder, layer, user, password)
+        if 'columnar' in suites:
+            bench_columnar(recorder, layer, rows)
+        if 'export' in suites:
+            with tempfile.TemporaryDirectory() as directory:
+                bench_export(recorder, layer, directory)
+        if suites & {'gui', 'startup'}:
+            with headless_display() as available:
+                if not available:
+                    print("No display and no Xvfb, skipping the GUI benchmarks")
+                if available and 'gui' in suites:
+                    bench_display(recorder, layer)
+                if available and 'startup' in suites:
+                    bench_startup(recorder, user, password)
+    finally:
+        layer.close_connection()
+    return recorder.results
+
+def main(argv=None):
+    """
+    Runs the benchmarks and compares them with the stored baseline.
+
+    Returns:
+        (int):
+            1 if any benchmark regressed beyond the tolerance, 0 otherwise.
+    """
+    args = parse_args(argv)
+    password = os.getenv('DB_PASSWORD', '')
+    if args.throwaway:
+        with throwaway_postgres() as superuser:
+            results = run(args, superuser, '')
+    else:
+        results = run(args, args.user, password)
+
+    rows = parse_rows(args.rows)
+    metadata = {'rows': rows, 'seed': args.seed, 'suites': args.suites}
+    baseline_path = args.baseline or os.path.join(BASELINE_DIR, f"{rows}.json")
+    if args.output:
+        save_results(results, args.output, metadata)
+    if args.save_baseline:
+        save_results(results, baseline_path, metadata)
+        print(f"Baseline saved to {baseline_path}")
+        return 0
+
+    baseline = load_results(baseline_path)
+    if baseline is None:
+        print(f"No baseline at {baseline_path}; run with --save-baseline to record one")
+        return 0
+    regressions = compare(results, baseline['results'], args.tolerance)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    print(f"{len(regressions)} regression(s) against {baseline_path}")
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# benchmarks/startup.py
+"""
+Author          :   Alexander Shelton
+Date            :   October 2024
+Name            :   Database Application
+Description     :   Starts the application in a fresh interpreter, logs in and shows in450a,
+                    printing when each step finished. Run by benchmarks/run.py once per sample.
+
+Usage:
+    DB_USER=in450a DB_PASSWORD=... python -m benchmarks.startup
+"""
+# ----- Imports ----- #
+import time
+STARTED = time.time()                                       # Before the imports being measured
+
+import os
+import sys
+import json
+import tkinter as tk
+
+# Seconds a step may take before the run is abandoned
+STEP_TIMEOUT = 60
+
+def wait_for(root, done):
+    """
+    Runs the Tk event loop until done() is true.
+    """
+    deadline = time.monotonic() + STEP_TIMEOUT
+    while not done():
+        if time.monotonic() > deadline:
+            raise TimeoutError("The application did not get there in time")
+        root.update()
+        time.sleep(0.001)
+
+def main():
+    """
+    Prints, as JSON, the wall-clock time at which the interpreter started running this
+    module ('started'), the login window was drawn ('window'), the login was submitted
+    ('login'), the main window was built ('app'), in450a was requested ('request') and
+    its first rows were on screen ('first_data').
+    """
+    import presentation_layer
+    from presentation_layer import LoginScreen
+
+    # A failed login would otherwise wait for someone to close the error box
+    def fail(title, message):
+        raise SystemExit(f"{title}: {message}")
+
+    presentation_layer.messagebox.showerror = fail
+
+    marks = {'started': STARTED}
+    root = tk.Tk()
+    screen = LoginScreen(root)
+    root.update()
+    marks['window'] = time.time()
+
+    screen.username_entry.insert(0, os.getenv('DB_USER', 'postgres'))
+    screen.password_entry.insert(0, os.getenv('DB_PASSWORD') or 'unused')      # A trust server ignores it
+    marks['login'] = time.time()
+    screen.login()
+    wait_for(root, lambda: screen.app is not None)
+    marks['app'] = time.time()
+
+    app = screen.app
+    marks['request'] = time.time()
+    app.show_table('in450a')
+    wait_for(root, lambda: app.tree.get_children() and any(app.tree.item(item, 'values') for item in app.tree.get_children()))
+    marks['first_data'] = time.time()
+
+    app.runner.shutdown()
+    app.business_layer.close_connection()
+    root.destroy()
+    print(json.dumps(marks))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
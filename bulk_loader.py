@@ -0,0 +1,468 @@
+#!/usr/bin/env python
+# bulk_loader.py
+"""
+Author          :   Alexander Shelton
+Date            :   October 2024
+Name            :   Database Application
+Description     :   Loads the IN450 CSV captures into PostgreSQL with COPY FROM STDIN.
+"""
+# ----- Imports ----- #
+import io
+import os
+import csv
+import sys
+import gzip
+import math
+import time
+import getpass
+import ipaddress
+import argparse
+import psycopg2
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from business_layer import connection_args
+
+# Directory holding the CSV files shipped with the application
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+
+# Number of CSV rows sent to the server per COPY
+CHUNK_SIZE = 50000
+
+# Latest capture time, in seconds from the start of the capture, an in450a row may have.
+# Later rows, e.g. typos, are rejected instead of getting partitions far from all others.
+MAX_CAPTURE_TIME = Decimal(os.getenv('LOAD_MAX_CAPTURE_TIME', str(7 * 24 * 3600)))
+
+# ----- Validators ----- #
+def _numeric(precision, scale):
+    """
+    Returns a validator rejecting values that are not finite numbers (NaN, Infinity) or do
+    not fit a NUMERIC(precision, scale) column once rounded to `scale` decimal places.
+    """
+    limit = Decimal(10) ** (precision - scale)
+    step = Decimal(1).scaleb(-scale)
+    def validate(value):
+        try:
+            number = Decimal(value)
+        except InvalidOperation:
+            return f"not a number: {value!r}"
+        if not number.is_finite():
+            return f"not a finite number: {value!r}"
+        if abs(number) >= limit or abs(number.quantize(step, rounding=ROUND_HALF_UP)) >= limit:
+            return f"too large for NUMERIC({precision}, {scale}): {value!r}"
+    return validate
+
+_capture_number = _numeric(16, 6)
+
+def _capture_time(value):
+    """
+    Returns an error message if `value` is not an in450a capture time: a NUMERIC(16, 6)
+    between 0 and MAX_CAPTURE_TIME.
+    """
+    error = _capture_number(value)
+    if error:
+        return error
+    if not 0 <= Decimal(value) <= MAX_CAPTURE_TIME:
+        return f"outside the capture window 0..{MAX_CAPTURE_TIME}: {value!r}"
+
+def _integer(value):
+    """
+    Returns an error message if `value` is not an integer.
+    """
+    try:
+        int(value)
+    except ValueError:
+        return f"not an integer: {value!r}"
+
+def _varchar(length):
+    """
+    Returns a validator rejecting values longer than `length` characters.
+    """
+    def validate(value):
+        if len(value) > length:
+            return f"longer than {length} characters: {value!r}"
+    return validate
+
+def _text(value):
+    """
+    Accepts any value.
+    """
+
+def _inet(value):
+    """
+    Returns an error message if `value` is not an IPv4 or IPv6 address or network.
+    """
+    try:
+        ipaddress.ip_network(value, strict=False)
+    except ValueError:
+        return f"not an IP address: {value!r}"
+
+def _endpoint(value):
+    """
+    Returns an error message if `value` is neither an IP address nor a link-layer name
+    (e.g. 'Apple_7e:1e:d4' or 'Broadcast') that fits the in450a name columns.
+    """
+    if _inet(value):
+        return _varchar(32)(value)
+
+# Columns of each table, in CSV order, with the validator for their values (see sql/schema.sql)
+TABLE_SPECS = {
+    'in450a': [
+        ('Time', _capture_time), ('Source', _endpoint), ('Destination', _endpoint),
+        ('Protocol', _varchar(10)), ('Length', _integer), ('Info', _text),
+    ],
+    'in450b': [
+        ('first_name', _varchar(50)), ('last_name', _varchar(50)), ('email', _varchar(100)),
+        ('source', _inet), ('destination', _inet),
+    ],
+    'in450c': [
+        ('AppID', _varchar(100)), ('AppName', _varchar(100)), ('AppVersion', _varchar(10)),
+        ('source', _inet), ('destination', _inet), ('DigSig', _varchar(64)),
+    ],
+}
+
+def _split_endpoint(value):
+    """
+    Returns the (address, name) column values of an in450a endpoint.
+    """
+    return ('', value) if value and _inet(value) else (value, '')
+
+def _split_endpoints(fields):
+    """
+    Moves the link-layer endpoints of an in450a row from the INET columns to the name columns.
+    """
+    time, source, destination, *rest = fields
+    return [time, *_split_endpoint(source), *_split_endpoint(destination), *rest]
+
+# Tables whose rows are reshaped on their way from the CSV file to the COPY:
+# table -> (columns of the COPY, function turning the CSV fields into their values)
+COPY_LAYOUTS = {
+    'in450a': (
+        ['Time', 'Source', 'SourceName', 'Destination', 'DestinationName', 'Protocol', 'Length', 'Info'],
+        _split_endpoints,
+    ),
+}
+
+# Partitioned tables: table -> (position of the partition key in the CSV rows, width of a
+# partition). The partitions a chunk falls into are created with <table>_create_partitions()
+# before it is copied.
+PARTITION_KEYS = {'in450a': (0, 3600)}
+
+# ----- Rejects ----- #
+class RejectFile:
+    """
+    Collects the rows that could not be loaded, together with their line number and the
+    reason, in a CSV file that is only created once the first row is rejected.
+
+    Attributes:
+        path : (str)
+            Where the rejected rows are written.
+        count : (int)
+            The number of rows rejected so far.
+    """
+    def __init__(self, path):
+        """
+        Initializes the RejectFile without creating the file.
+
+        Parameters:
+            path : (str)
+                Where the rejected rows are written.
+        """
+        self.path = path
+        self.count = 0
+        self._file = None
+        self._writer = None
+
+    def add(self, line, fields, reason):
+        """
+        Records a rejected row.
+
+        Parameters:
+            line : (int)
+                The line of the row in the source file.
+            fields : (list of str)
+                The fields of the row as read from the source file.
+            reason : (str)
+                Why the row was rejected.
+        """
+        if self._file is None:
+            self._file = open(self.path, 'w', newline='', encoding='utf-8')
+            self._writer = csv.writer(self._file)
+            self._writer.writerow(['line', 'error', 'fields...'])
+        self._writer.writerow([line, reason, *fields])
+        self.count += 1
+
+    def close(self):
+        """
+        Closes the file if any row was rejected.
+        """
+        if self._file is not None:
+            self._file.close()
+
+# ----- Loading ----- #
+def open_csv(path):
+    """
+    Opens a CSV file for reading, decompressing it on the fly if it ends in '.gz'.
+    """
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', newline='', encoding='utf-8')
+    return open(path, newline='', encoding='utf-8')
+
+def table_for(path):
+    """
+    Derives the table a file belongs to from its name, e.g. 'IN450A.csv.gz' -> 'in450a'.
+    """
+    name = os.path.basename(path).lower()
+    for suffix in ('.gz', '.csv'):
+        if name.endswith(suffix):
+            name = name[:-len(suffix)]
+    if name not in TABLE_SPECS:
+        raise ValueError(f"Cannot tell which table {path} belongs to; name it TABLE=PATH")
+    return name
+
+def read_chunks(reader, spec, rejects, chunk_size):
+    """
+    Reads validated rows from a CSV reader in chunks. Rows with the wrong number of
+    fields or invalid values are sent to `rejects` instead.
+
+    Yields:
+        (list of tuple):
+            Chunks of (line number, fields) pairs.
+    """
+    chunk = []
+    for fields in reader:
+        if not fields:
+            continue
+        line = reader.line_num
+        if len(fields) != len(spec):
+            rejects.add(line, fields, f"expected {len(spec)} fields, got {len(fields)}")
+            continue
+        error = None
+        for value, (_, validate) in zip(fields, spec):
+            error = value and validate(value)                   # Empty fields load as NULL
+            if error:
+                break
+        if error:
+            rejects.add(line, fields, error)
+            continue
+        chunk.append((line, fields))
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def partition_buckets(table, chunk):
+    """
+    Returns the partitions of `table` the rows of `chunk` fall into, as the sorted distinct
+    floor(key / width) of their partition keys, or an empty list for other tables.
+    """
+    if table not in PARTITION_KEYS:
+        return []
+    position, width = PARTITION_KEYS[table]
+    return sorted({math.floor(Decimal(fields[position]) / width) for _, fields in chunk if fields[position]})
+
+def create_partitions(cursor, table, chunk):
+    """
+    Makes sure the partitions of `table` that the rows of `chunk` fall into exist, since
+    the server refuses rows that no partition accepts. Does nothing for other tables.
+    """
+    buckets = partition_buckets(table, chunk)
+    if buckets:
+        cursor.execute(f"SELECT {table}_create_partitions(%s::bigint[], %s);", (buckets, PARTITION_KEYS[table][1]))
+
+def copy_chunk(cursor, statement, chunk, rejects, transform=None):
+    """
+    COPYs a chunk of rows inside a savepoint. If the server refuses the chunk, it is
+    split in half until the offending rows are isolated and sent to `rejects`, so a
+    bad row costs a few extra round trips instead of the whole load.
+
+    Parameters:
+        transform : (callable)
+            Turns the fields of a row into the values of the COPY columns, see `COPY_LAYOUTS`.
+            Rejected rows are still recorded as they were read.
+
+    Returns:
+        (int):
+            The number of rows loaded.
+    """
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(transform(fields) if transform else fields for _, fields in chunk)
+    buffer.seek(0)
+
+    cursor.execute("SAVEPOINT chunk;")
+    try:
+        cursor.copy_expert(statement, buffer)
+    except (psycopg2.DataError, psycopg2.IntegrityError) as e:
+        cursor.execute("ROLLBACK TO SAVEPOINT chunk;")
+        if len(chunk) == 1:
+            line, fields = chunk[0]
+            rejects.add(line, fields, str(e).strip().splitlines()[0])
+            return 0
+        middle = len(chunk) // 2
+        return (copy_chunk(cursor, statement, chunk[:middle], rejects, transform)
+                + copy_chunk(cursor, statement, chunk[middle:], rejects, transform))
+    cursor.execute("RELEASE SAVEPOINT chunk;")
+    return len(chunk)
+
+def secondary_indexes(cursor, table):
+    """
+    Returns the (name, definition) of the indexes on `table` that do not back a constraint
+    and can therefore be dropped and rebuilt around a load.
+    """
+    cursor.execute(
+        """
+        SELECT i.relname, pg_get_indexdef(i.oid)
+        FROM pg_index x
+        JOIN pg_class i ON i.oid = x.indexrelid
+        WHERE x.indrelid = %s::regclass
+          AND NOT EXISTS (SELECT 1 FROM pg_constraint c WHERE c.conindid = x.indexrelid);
+        """,
+        (table,)
+    )
+    return cursor.fetchall()
+
+def load_table(table, path, user, password, truncate=False, rebuild_indexes=False,
+               reject_dir='.', chunk_size=CHUNK_SIZE):
+    """
+    Loads one CSV file into one table on its own connection, in a single transaction.
+    Runs in a worker process so several tables load in parallel.
+
+    The partitions a chunk needs are created beforehand on a second connection, each in a
+    short transaction of its own, so the load does not lock queries out of the table until
+    it commits. When the load truncates the table or drops its indexes it holds an
+    exclusive lock anyway, and creates them in its own transaction, which the second
+    connection would otherwise wait on. Partitions created for a load that then fails are
+    left behind empty.
+
+    Parameters:
+        table : (str)
+            The table to load, one of `TABLE_SPECS`.
+        path : (str)
+            The CSV file, optionally gzip compressed, with a header line.
+        user, password : (str)
+            The credentials to connect with.
+        truncate : (bool)
+            Empty the table before loading.
+        rebuild_indexes : (bool)
+            Drop the table's secondary indexes before loading and rebuild them afterwards.
+        reject_dir : (str)
+            The directory the reject file is written to.
+        chunk_size : (int)
+            The number of rows per COPY.
+
+    Returns:
+        (dict):
+            The table, rows loaded, rows rejected, reject file and elapsed seconds.
+    """
+    spec = TABLE_SPECS[table]
+    columns, transform = COPY_LAYOUTS.get(table, ([name for name, _ in spec], None))
+    statement = f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)"
+    rejects = RejectFile(os.path.join(reject_dir, f"{table}.rejects.csv"))
+    started = time.perf_counter()
+    loaded = 0
+
+    conn = psycopg2.connect(**connection_args(user, password))
+    ddl = None
+    try:
+        with conn, conn.cursor() as cursor, open_csv(path) as source:
+            partition_cursor = cursor
+            if table in PARTITION_KEYS and not truncate and not rebuild_indexes:
+                ddl = psycopg2.connect(**connection_args(user, password))
+                ddl.autocommit = True
+                partition_cursor = ddl.cursor()
+            if truncate:
+                cursor.execute(f"TRUNCATE {table};")
+
+            indexes = secondary_indexes(cursor, table) if rebuild_indexes else []
+            for name, _ in indexes:
+                cursor.execute(f'DROP INDEX "{name}";')
+
+            reader = csv.reader(source)
+            next(reader, None)                                  # Skip the header line
+            for chunk in read_chunks(reader, spec, rejects, chunk_size):
+                create_partitions(partition_cursor, table, chunk)
+                loaded += copy_chunk(cursor, statement, chunk, rejects, transform)
+
+            for _, definition in indexes:
+                cursor.execute(definition)
+    finally:
+        conn.close()
+        if ddl is not None:
+            ddl.close()
+        rejects.close()
+
+    return {
+        'table': table,
+        'loaded': loaded,
+        'rejected': rejects.count,
+        'rejects': rejects.path if rejects.count else None,
+        'seconds': time.perf_counter() - started,
+    }
+
+def parse_args(argv=None):
+    """
+    Parses the command line of `load_data`.
+    """
+    parser = argparse.ArgumentParser(
+        prog='load_data',
+        description='Load IN450 CSV captures (optionally gzip compressed) into PostgreSQL.'
+    )
+    parser.add_argument(
+        'files', nargs='*',
+        help="CSV files to load, as PATH (table taken from the file name, e.g. IN450A.csv.gz) "
+             "or TABLE=PATH. Defaults to the three files in the data directory."
+    )
+    parser.add_argument('--user', default=os.getenv('DB_USER'), help='database role (default: $DB_USER)')
+    parser.add_argument('--truncate', action='store_true', help='empty each table before loading it')
+    parser.add_argument('--rebuild-indexes', action='store_true',
+                        help='drop secondary indexes before the load and rebuild them afterwards')
+    parser.add_argument('--reject-dir', default='.', help='where rejected rows are written')
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help='rows per COPY')
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    """
+    Entry point of the `load_data` console script. Loads every file in parallel, one
+    process and connection per table, and reports the throughput of each.
+    """
+    args = parse_args(argv)
+    files = args.files or [os.path.join(DATA_DIR, f"{table.upper()}.csv") for table in TABLE_SPECS]
+    jobs = {}
+    for item in files:
+        table, _, path = item.partition('=') if '=' in item else (table_for(item), '', item)
+        if table not in TABLE_SPECS:
+            sys.exit(f"Unknown table: {table}")
+        jobs[table] = path
+
+    user = args.user or input('Username: ')
+    password = os.getenv('DB_PASSWORD') or getpass.getpass('Password: ')
+
+    started = time.perf_counter()
+    total = 0
+    failed = False
+    with ProcessPoolExecutor(max_workers=len(jobs)) as pool:
+        futures = {
+            pool.submit(load_table, table, path, user, password, args.truncate,
+                        args.rebuild_indexes, args.reject_dir, args.chunk_size): table
+            for table, path in jobs.items()
+        }
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except Exception as e:
+                print(f"{futures[future]}: load failed: {e}", file=sys.stderr)
+                failed = True
+                continue
+            total += result['loaded']
+            rate = result['loaded'] / result['seconds'] if result['seconds'] else 0
+            print(f"{result['table']}: {result['loaded']:,} rows loaded, {result['rejected']:,} rejected "
+                  f"in {result['seconds']:.2f} s ({rate:,.0f} rows/s)")
+            if result['rejects']:
+                print(f"    rejected rows written to {result['rejects']}")
+
+    elapsed = time.perf_counter() - started
+    print(f"Total: {total:,} rows in {elapsed:.2f} s ({total / elapsed if elapsed else 0:,.0f} rows/s)")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
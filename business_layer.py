@@ -6,116 +6,2120 @@ Date            :   October 2024
 Name            :   Database Application
 Description     :   An application for users to view data from a database based on their permissions.    
 """
+import io
 import os
+import re
+import csv
+import sys
+import gzip
+import json
+import math
+import time
+import uuid
+import select
+import socket
+import hashlib
 import logging
+import weakref
+import ipaddress
+import itertools
+import threading
 import psycopg2
-from tkinter import messagebox
+from decimal import Decimal
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from psycopg2 import sql, extensions
+from psycopg2.errors import UndefinedTable
+from psycopg2.pool import ThreadedConnectionPool
 # Configure logging
 logging.basicConfig(filename='app_errors.log', level=logging.ERROR, 
                     format='%(asctime)s %(levelname)s %(message)s')
+
+# Number of rows a server-side cursor pulls from PostgreSQL per network round trip
+DEFAULT_ITERSIZE = int(os.getenv('DB_ITERSIZE', '2000'))
+
+# Tables whose columns and filters are declared here. Other tables listed in the app_tables
+# registry of sql/schema.sql get columns and filters derived from their column types when a
+# role that may read them discovers them, see `discover_tables`.
+TABLES = ('in450a', 'in450b', 'in450c')
+
+# Data columns of each table, in display order. Every table also has an `id` primary key
+# that keyset pagination uses to break ties between equal sort values.
+COLUMN_NAMES = {
+    'in450a': ('time', 'source', 'destination', 'protocol', 'length', 'info'),
+    'in450b': ('first_name', 'last_name', 'email', 'source', 'destination'),
+    'in450c': ('appid', 'appname', 'appversion', 'source', 'destination', 'digsig'),
+}
+
+# Data columns that are read through an expression rather than as stored. in450a keeps the
+# link-layer names of endpoints that have no IP address (ARP frames) in separate columns,
+# which are shown in place of the missing address. abbrev() prints addresses as psycopg2
+# receives them, without a /32 or /128 netmask.
+COLUMN_EXPRESSIONS = {
+    'in450a': {
+        'source': "COALESCE(abbrev(Source), SourceName)",
+        'destination': "COALESCE(abbrev(Destination), DestinationName)",
+    },
+}
+
+# Filters each table can be searched by: filter name -> (column, kind, value type).
+#   equals : the column equals the value
+#   ip     : the INET column holds an address inside the given IP address or CIDR network
+#   endpoint : either of the INET columns holds an address inside one of the given comma
+#            separated IP addresses or CIDR networks
+#   range  : the column lies between the (low, high) pair of the value; either may be None
+#   prefix : the column starts with the value, ignoring case
+#   contains : the column contains the value anywhere, ignoring case
+#   words  : the column contains the words of the value, which is written like a web search
+#            ('"quoted phrase"', 'or', '-word'); matches the <column>Tokens tsvector column
+FILTERS = {
+    'in450a': {
+        'protocol': ('Protocol', 'equals', str),
+        'source': ('Source', 'ip', str),
+        'destination': ('Destination', 'ip', str),
+        'time': ('Time', 'range', Decimal),
+        'length': ('Length', 'range', int),
+        'info': ('Info', 'contains', str),
+        'words': ('Info', 'words', str),
+        'host': (('Source', 'Destination'), 'endpoint', str),
+    },
+    'in450b': {
+        'first_name': ('first_name', 'prefix', str),
+        'last_name': ('last_name', 'prefix', str),
+        'email': ('email', 'prefix', str),
+        'source': ('source', 'ip', str),
+        'destination': ('destination', 'ip', str),
+    },
+    'in450c': {
+        'app_id': ('AppID', 'prefix', str),
+        'app_name': ('AppName', 'prefix', str),
+        'source': ('source', 'ip', str),
+        'destination': ('destination', 'ip', str),
+    },
+}
+
+# Tables whose rows can be correlated with the in450a traffic through their addresses
+CORRELATED_TABLES = ('in450b', 'in450c')
+
+# Columns get_traffic_report() adds after the data columns of each row
+TRAFFIC_REPORT_COLUMNS = ('source_packets', 'source_bytes', 'destination_packets', 'destination_bytes',
+                          'first_seen', 'last_seen')
+
+# in450c columns lookup_in450c() can match a collection of values against: name -> column
+LOOKUP_COLUMNS = {'digsig': 'DigSig', 'app_id': 'AppID'}
+
+# lookup_in450c() sends up to this many values as one array parameter. Larger collections
+# are copied into a temporary table first, which the planner can analyze and hash join.
+LOOKUP_ARRAY_MAX = 10000
+
+# Filters whose matches search_info() ranks by relevance, strongest first
+RANKED_FILTERS = ('words', 'info')
+
+# How the columns of a discovered table are searched, by their information_schema data
+# type: data type -> (filter kind, value type). Columns of other types cannot be searched.
+DATA_TYPE_FILTERS = {
+    'inet': ('ip', str),
+    'smallint': ('range', int),
+    'integer': ('range', int),
+    'bigint': ('range', int),
+    'numeric': ('range', Decimal),
+    'real': ('range', float),
+    'double precision': ('range', float),
+    'text': ('prefix', str),
+    'character varying': ('prefix', str),
+    'character': ('prefix', str),
+}
+
+# The tables of the app_tables registry that exist, whether the current role may read them,
+# and their columns with their data types, in registry order. The id key and the columns the
+# server generates (e.g. in450a's InfoTokens) are left out. {source} is the registry.
+REGISTRY_QUERY = """
+    SELECT r.name, r.label, has_table_privilege(c.oid, 'SELECT'),
+           COALESCE((SELECT json_agg(json_build_array(i.column_name, i.data_type, i.numeric_scale)
+                                     ORDER BY i.ordinal_position)
+                     FROM information_schema.columns i
+                     WHERE i.table_schema = n.nspname AND i.table_name = c.relname
+                       AND i.column_name <> 'id' AND i.is_generated = 'NEVER'
+                       AND i.data_type <> 'tsvector'), '[]')
+    FROM {source} r
+    JOIN pg_class c ON c.oid = to_regclass(r.name)
+    JOIN pg_namespace n ON n.oid = c.relnamespace
+    ORDER BY r.position, r.name;
+"""
+
+# Stands in for the app_tables registry in a database whose schema predates it
+DECLARED_REGISTRY = "(SELECT t AS name, t AS label, p AS position FROM unnest(%s::text[]) WITH ORDINALITY AS d(t, p))"
+
+# Prepared statements each pooled connection keeps; reaching it deallocates them all
+PREPARED_MAX = 200
+
+# The placeholders of a psycopg2 query, and its escaped percent signs
+PLACEHOLDER = re.compile(r'%[%s]')
+
+# Marks search_info() puts around the matches in Info
+MATCH_START, MATCH_END = '\u00ab', '\u00bb'
+
+# Maximum number of connections the pool opens, i.e. how many queries can run at once
+POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '4'))
+
+# How many times a query is retried after the connection drops, and the first retry delay
+# in seconds (doubled on every further attempt, up to MAX_BACKOFF)
+RECONNECT_ATTEMPTS = int(os.getenv('DB_RECONNECT_ATTEMPTS', '5'))
+RECONNECT_BACKOFF = 0.5
+MAX_BACKOFF = 8.0
+
+# Connections idle for longer than this many seconds are pinged before they are reused
+HEALTH_CHECK_INTERVAL = 30.0
+
+# Seconds `preconnect` waits for the server to accept a TCP connection
+PRECONNECT_TIMEOUT = 2.0
+
+# Addresses `preconnect` resolved, by (host, port), which libpq connects the login to directly
+_resolved = {}
+
+# Upper bound on the memory held by cached query results, in bytes (0 disables the cache),
+# and how many seconds a cached result may be served before it is fetched again
+CACHE_MAX_BYTES = int(os.getenv('DB_CACHE_BYTES', str(64 * 1024 * 1024)))
+CACHE_TTL = float(os.getenv('DB_CACHE_TTL', '300'))
+
+# Channel the table triggers in sql/schema.sql notify with the name of the changed table
+NOTIFY_CHANNEL = 'table_changed'
+
+# Name refresh_in450a_analytics() notifies with, and that cached analytics are filed under
+ANALYTICS = 'in450a_analytics'
+
+# Queries taking longer than this many milliseconds are written to the slow query log
+SLOW_QUERY_MS = float(os.getenv('DB_SLOW_QUERY_MS', '500'))
+
+# JSON-lines file slow queries are appended to
+SLOW_QUERY_LOG = os.getenv('DB_SLOW_QUERY_LOG', 'slow_queries.jsonl')
+
+# Capture the EXPLAIN (ANALYZE, BUFFERS) plan of every slow query. This runs the query a
+# second time, in a read-only transaction, so it is off unless DB_EXPLAIN_SLOW=1
+EXPLAIN_SLOW = os.getenv('DB_EXPLAIN_SLOW', '0') == '1'
+
+# Number of recent queries kept for the diagnostics panel
+STATS_HISTORY = 500
+
+# Upper bounds in milliseconds of the latency histogram buckets; the last one is open ended
+LATENCY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, float('inf'))
+
+# Rows sampled to estimate the size of a result
+SIZE_SAMPLE = 100
+
+def raise_error(title, message):
+    """
+    The default BusinessLayer error handler: raises the error instead of showing it, so
+    the BusinessLayer can be used without a user interface.
+    """
+    raise Exception(message)
+
+def registry_query(declared=False):
+    """
+    Returns the query discovering the registered tables, see `REGISTRY_QUERY`, and its
+    parameters.
+
+    Parameters:
+        declared : (bool)
+            List the tables declared in `TABLES` instead of those of the app_tables
+            registry, for a database whose schema predates it.
+
+    Returns:
+        (tuple):
+            The query and its parameters.
+    """
+    if declared:
+        return REGISTRY_QUERY.format(source=DECLARED_REGISTRY), (list(TABLES),)
+    return REGISTRY_QUERY.format(source='app_tables'), None
+
+def discover_tables(rows):
+    """
+    Builds the registry of one role from the rows of `registry_query`. Declared tables keep
+    the columns and filters of `COLUMN_NAMES` and `FILTERS`. Any other table gets the
+    stored columns the role can see, and a filter per searchable column, named after the
+    column and chosen by `DATA_TYPE_FILTERS`, so a new capture table only needs to be
+    created, granted and listed in app_tables. information_schema only lists the columns a
+    role has privileges on, so each role keeps its own registry.
+
+    Parameters:
+        rows : (list of tuple)
+            The (name, label, readable, columns) rows of the registry query.
+
+    Returns:
+        (dict):
+            Table -> {'label', 'readable', 'columns', 'filters', 'types'}, in registry
+            order. 'types' maps each stored column to its (data type, numeric scale).
+    """
+    registry = {}
+    for table, label, readable, columns in rows:
+        if table in TABLES:
+            names, filters = COLUMN_NAMES[table], FILTERS[table]
+        else:
+            names = tuple(name for name, _, _ in columns)
+            filters = {
+                name: (name, *DATA_TYPE_FILTERS[data_type])
+                for name, data_type, _ in columns if data_type in DATA_TYPE_FILTERS
+            }
+        registry[table] = {
+            'label': label,
+            'readable': readable,
+            'columns': names,
+            'filters': filters,
+            'types': {name: (data_type, scale) for name, data_type, scale in columns},
+        }
+    return registry
+
+def table_columns(table, registry=None):
+    """
+    Returns the data columns of `table` in display order: those declared in `COLUMN_NAMES`,
+    or those discovered for it in `registry`, see `discover_tables`.
+
+    Raises:
+        ValueError: If the table is neither declared nor readable with columns in `registry`.
+    """
+    if table in TABLES:
+        return COLUMN_NAMES[table]
+    info = (registry or {}).get(table)
+    if info is None or not info['readable'] or not info['columns']:
+        raise ValueError(f"Unknown table: {table}")
+    return info['columns']
+
+def table_filters(table, registry=None):
+    """
+    Returns the filters `table` can be searched by: those declared in `FILTERS`, or those
+    derived for it in `registry`, see `discover_tables`.
+
+    Raises:
+        ValueError: If the table is neither declared nor readable with columns in `registry`.
+    """
+    table_columns(table, registry)
+    return FILTERS[table] if table in TABLES else registry[table]['filters']
+
+def range_bound(name, convert, value):
+    """
+    Converts one end of the range filter `name` with `convert`, keeping None for an open end.
+
+    Raises:
+        ValueError: If the value is not a finite number of the column's type.
+    """
+    if value is None:
+        return None
+    try:
+        bound = convert(value)
+    except (ValueError, TypeError, ArithmeticError):      # decimal.InvalidOperation is an ArithmeticError
+        raise ValueError(f"The {name} filter needs numbers, got {value!r}")
+    if isinstance(bound, Decimal) and not bound.is_finite() or isinstance(bound, float) and not math.isfinite(bound):
+        raise ValueError(f"The {name} filter needs finite numbers, got {value!r}")
+    return bound
+
+def make_filters(table, pairs, registry=None):
+    """
+    Turns (name, value) pairs, as typed in the search bar or passed in a URL query string,
+    into BusinessLayer search filters. Range filters take `low..high` with either end
+    optional, or a single exact value, and their ends are converted to the column's type
+    here, so a bad number is reported before any query runs.
+
+    Parameters:
+        table : (str)
+            The table being searched.
+        pairs : (iterable of tuple)
+            The (name, value) of each filter.
+        registry : (dict)
+            The registry of the searching role, for tables that are not declared.
+
+    Returns:
+        (dict):
+            Filter name -> value, as accepted by the BusinessLayer.
+
+    Raises:
+        ValueError: If a filter is unknown, has no value or a range end is not a number.
+    """
+    known = table_filters(table, registry)
+    filters = {}
+    for name, value in pairs:
+        if name not in known:
+            raise ValueError(f"{table} can be filtered by: {', '.join(known)}")
+        if not value:
+            raise ValueError(f"The {name} filter needs a value")
+        if known[name][1] == 'range':
+            low, dots, high = value.partition('..')
+            low, high = (low or None, high or None) if dots else (value, value)
+            value = (range_bound(name, known[name][2], low), range_bound(name, known[name][2], high))
+        filters[name] = value
+    return filters
+
+def related_traffic_filters(table, row):
+    """
+    Returns the in450a search filters selecting the packets sent or received by the
+    addresses of a row of in450b or in450c.
+
+    Parameters:
+        table : (str)
+            The table the row comes from, one of `CORRELATED_TABLES`.
+        row : (sequence)
+            The data columns of the row, in the order of `COLUMN_NAMES[table]`.
+
+    Returns:
+        (dict):
+            The in450a filters.
+
+    Raises:
+        ValueError: If the table has no related traffic or the row has no IP address.
+    """
+    if table not in CORRELATED_TABLES:
+        raise ValueError(f"{table} rows cannot be correlated with in450a")
+    values = dict(zip(COLUMN_NAMES[table], row))
+    addresses = []
+    for column in ('source', 'destination'):
+        try:
+            addresses.append(str(ipaddress.ip_address(str(values.get(column)))))
+        except ValueError:                                  # Missing, or shown as text such as 'None'
+            pass
+    if not addresses:
+        raise ValueError("The row has no IP address")
+    return {'host': ','.join(dict.fromkeys(addresses))}
+
+def escape_like(value):
+    """
+    Escapes the LIKE wildcards in a value, so it matches only itself in a LIKE pattern.
+    """
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+def escape_regex(value):
+    """
+    Escapes a value for a PostgreSQL regular expression, so it matches only itself.
+    """
+    return ''.join(char if char.isalnum() or char.isspace() else '\\' + char for char in value)
+
+def connection_args(user, password, preresolved=False):
+    """
+    Builds the psycopg2 connection arguments for a user, reading the server location
+    from environment variables.
+
+    Parameters:
+        user : (str)
+            The database role to log in as.
+        password : (str)
+            The password of the role.
+        preresolved : (bool)
+            Connect to the address `preconnect` resolved, if any, instead of looking the
+            host up again. Only meant for the login connection: an address kept for longer
+            would outlive a failover or DNS change.
+
+    Returns:
+        (dict):
+            Keyword arguments for psycopg2.connect.
+    """
+    args = dict(
+        user=user,
+        password=password,
+        host=os.getenv('DB_HOST', 'localhost'),
+        port=os.getenv('DB_PORT', '5432'),
+        database=os.getenv('DB_NAME', 'postgres'),
+    )
+    address = _resolved.get((args['host'], args['port'])) if preresolved else None
+    if address is not None:
+        args['hostaddr'] = address                          # libpq skips the DNS lookup; host still checks TLS
+    return args
+
+def preconnect(timeout=PRECONNECT_TIMEOUT):
+    """
+    Does the part of connecting to the server that needs no credentials, so it can run
+    while the user is still typing them: resolves the server's address, which
+    `connection_args` then hands to libpq, and opens a TCP connection to check that the
+    server answers. libpq authenticates on a connection of its own, so the PostgreSQL and
+    TLS handshakes still happen at login, but without the DNS lookup.
+
+    Parameters:
+        timeout : (float)
+            Seconds to wait for the server to accept the connection.
+
+    Returns:
+        (float):
+            Seconds the TCP connection took, or None if the server could not be reached.
+    """
+    host, port = os.getenv('DB_HOST', 'localhost'), os.getenv('DB_PORT', '5432')
+    if host.startswith('/'):                                # A Unix socket directory has nothing to resolve
+        return None
+    error = None
+    try:
+        # Try each address like libpq does, e.g. localhost may resolve to ::1 and 127.0.0.1
+        for family, kind, proto, _, address in socket.getaddrinfo(host, int(port), type=socket.SOCK_STREAM):
+            started = time.perf_counter()
+            try:
+                with socket.socket(family, kind, proto) as probe:
+                    probe.settimeout(timeout)
+                    probe.connect(address)
+            except OSError as e:
+                error = e
+                continue
+            _resolved[(host, port)] = address[0]
+            return time.perf_counter() - started
+    except (OSError, ValueError) as e:
+        error = e
+    logging.error(f"Could not reach the database server at {host}:{port}: {error}")
+    return None
+# Arrow type of each PostgreSQL type OID in a Parquet export; other types are exported as strings
+ARROW_TYPES = {
+    16: 'bool_',                                            # boolean
+    20: 'int64', 21: 'int16', 23: 'int32',                  # bigint, smallint, integer
+    700: 'float32', 701: 'float64', 1700: 'float64',        # real, double precision, numeric
+}
+
+# Seconds between two progress reports of an export
+EXPORT_PROGRESS_INTERVAL = 0.25
+
+# Bytes of CSV the Parquet writer parses into one record batch
+EXPORT_BLOCK_SIZE = 4 * 1024 * 1024
+
+# ----- Export ----- #
+class ExportWriter:
+    """
+    File-like object that COPY ... TO STDOUT writes into. Forwards the data to the real
+    output file while counting bytes and lines, and reports them to a progress callback.
+
+    Attributes:
+        target : (file)
+            The binary file the data is forwarded to.
+        progress : (callable)
+            Called as progress(bytes, rows) at most every `EXPORT_PROGRESS_INTERVAL`
+            seconds. Raising from it aborts the COPY.
+        bytes : (int)
+            The number of bytes written so far.
+        rows : (int)
+            The number of lines written so far, including the header.
+        first : (float)
+            The perf_counter() time the first data arrived, or None before that.
+    """
+    def __init__(self, target, progress=None):
+        """
+        Initializes the ExportWriter.
+
+        Parameters:
+            target : (file)
+                The binary file the data is forwarded to.
+            progress : (callable)
+                Called as progress(bytes, rows) while the data is written.
+        """
+        self.target = target
+        self.progress = progress
+        self.bytes = 0
+        self.rows = 0
+        self.first = None
+        self._reported = time.monotonic()
+
+    def write(self, data):
+        """
+        Forwards one chunk of COPY output to the target.
+        """
+        if self.first is None:
+            self.first = time.perf_counter()
+        self.target.write(data)
+        self.bytes += len(data)
+        self.rows += data.count(b'\n')
+        if self.progress is not None and time.monotonic() - self._reported >= EXPORT_PROGRESS_INTERVAL:
+            self._reported = time.monotonic()
+            self.progress(self.bytes, self.rows)
+        return len(data)
+
+# ----- QueryCache ----- #
+class QueryCache:
+    """
+    A thread-safe, size-bounded cache of query results with least recently used eviction
+    and a time to live. Each entry records the tables it was read from so it can be
+    dropped as soon as one of them changes.
+
+    Keys include the connected role, so one cache can safely be shared between
+    BusinessLayer instances logged in as different users.
+
+    Attributes:
+        max_bytes : (int)
+            The approximate memory budget for all cached results.
+        ttl : (float)
+            The number of seconds an entry stays valid.
+        entries : (OrderedDict)
+            Maps a key to its (value, size, expiry time, tables), oldest use first.
+        versions : (dict)
+            Per-table counter bumped on every invalidation, used to refuse results that
+            were read while the table was changing.
+        epoch : (int)
+            Counter bumped when the whole cache is invalidated.
+        stats : (dict)
+            Hit, miss, eviction, expiration and invalidation counters.
+    """
+    def __init__(self, max_bytes=CACHE_MAX_BYTES, ttl=CACHE_TTL):
+        """
+        Initializes an empty QueryCache.
+
+        Parameters:
+            max_bytes : (int)
+                The approximate memory budget for all cached results.
+            ttl : (float)
+                The number of seconds an entry stays valid.
+        """
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.versions = {}
+        self.epoch = 0
+        self.size = 0
+        self.stats = dict.fromkeys(('hits', 'misses', 'evictions', 'expirations', 'invalidations'), 0)
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def result_size(value):
+        """
+        Estimates the memory used by a query result: a row, or a list of rows.
+        """
+        def row_size(row):
+            return sys.getsizeof(row) + sum(sys.getsizeof(field) for field in row)
+
+        if isinstance(value, list):
+            return sys.getsizeof(value) + sum(row_size(row) for row in value)
+        return row_size(value)
+
+    def get(self, key):
+        """
+        Looks up a cached result.
+
+        Returns:
+            (tuple):
+                (True, value) on a hit, (False, None) on a miss or an expired entry.
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[2] < time.monotonic():
+                self._remove(key)
+                self.stats['expirations'] += 1
+                entry = None
+            if entry is None:
+                self.stats['misses'] += 1
+                return False, None
+            self.entries.move_to_end(key)
+            self.stats['hits'] += 1
+            return True, entry[0]
+
+    def version(self, tables):
+        """
+        Returns the invalidation counters of `tables`, to be passed back to `put`.
+        """
+        with self.lock:
+            return self._version(tables)
+
+    def _version(self, tables):
+        """
+        Returns the cache epoch followed by the counters of `tables`. The lock must be held.
+        """
+        return (self.epoch,) + tuple(self.versions.get(table, 0) for table in tables)
+
+    def put(self, key, value, tables, version):
+        """
+        Caches a result read from `tables`, evicting the least recently used entries to
+        stay within `max_bytes`. The result is dropped if one of the tables was
+        invalidated since `version` was taken, or if it is larger than the whole budget.
+        """
+        size = self.result_size(value)
+        with self.lock:
+            if size > self.max_bytes or version != self._version(tables):
+                return
+            if key in self.entries:
+                self._remove(key)
+            while self.size + size > self.max_bytes:
+                self._remove(next(iter(self.entries)))
+                self.stats['evictions'] += 1
+            self.entries[key] = (value, size, time.monotonic() + self.ttl, tuple(tables))
+            self.size += size
+
+    def invalidate(self, table=None):
+        """
+        Drops every entry read from `table`, or the whole cache when no table is given.
+        """
+        with self.lock:
+            if table is None:
+                self.epoch += 1
+                keys = list(self.entries)
+            else:
+                self.versions[table] = self.versions.get(table, 0) + 1
+                keys = [key for key, entry in self.entries.items() if table in entry[3]]
+            for key in keys:
+                self._remove(key)
+            self.stats['invalidations'] += len(keys)
+
+    def _remove(self, key):
+        """
+        Removes an entry and releases its size. The lock must be held.
+        """
+        self.size -= self.entries.pop(key)[1]
+
+    def statistics(self):
+        """
+        Returns the hit/miss counters together with the current size of the cache.
+
+        Returns:
+            (dict):
+                The counters, 'hit_rate', 'entries' and 'bytes'.
+        """
+        with self.lock:
+            lookups = self.stats['hits'] + self.stats['misses']
+            return dict(
+                self.stats,
+                hit_rate=self.stats['hits'] / lookups if lookups else 0.0,
+                entries=len(self.entries),
+                bytes=self.size,
+            )
+# ----- QueryStats ----- #
+class QueryStats:
+    """
+    Timings of the queries run by a BusinessLayer: the most recent calls and a latency
+    histogram per method. Calls slower than a threshold are appended to a JSON-lines
+    slow query log, with their plan when EXPLAIN capture is on.
+
+    Attributes:
+        recent : (deque)
+            The last `STATS_HISTORY` calls, newest last, as dicts.
+        histograms : (dict)
+            Method name -> number of calls per `LATENCY_BUCKETS` bucket.
+        slow_ms : (float)
+            The threshold in milliseconds above which a call counts as slow.
+        log_path : (str)
+            The slow query log, or None to not write one.
+        explain : (bool)
+            Whether the plan of slow queries is captured.
+    """
+    def __init__(self, slow_ms=SLOW_QUERY_MS, log_path=SLOW_QUERY_LOG, explain=EXPLAIN_SLOW, history=STATS_HISTORY):
+        """
+        Initializes empty QueryStats.
+
+        Parameters:
+            slow_ms : (float)
+                The threshold in milliseconds above which a call counts as slow.
+            log_path : (str)
+                The slow query log, or None to not write one.
+            explain : (bool)
+                Whether the plan of slow queries is captured.
+            history : (int)
+                The number of recent calls kept.
+        """
+        self.slow_ms = slow_ms
+        self.log_path = log_path
+        self.explain = explain
+        self.recent = deque(maxlen=history)
+        self.histograms = {}
+        self.lock = threading.Lock()
+        self._log_lock = threading.Lock()
+
+    @staticmethod
+    def result_bytes(rows, count=None):
+        """
+        Estimates the bytes a result took on the wire from the text length of its values,
+        measuring only the first `SIZE_SAMPLE` rows so big results stay cheap to record.
+
+        Parameters:
+            rows : (list of tuple)
+                The fetched rows.
+            count : (int)
+                The total number of rows `rows` stands for, when it is a sample.
+        """
+        if not rows:
+            return 0
+        sample = rows[:SIZE_SAMPLE]
+        size = sum(len(str(value)) for row in sample for value in row if value is not None)
+        return size * (count if count is not None else len(rows)) // len(sample)
+
+    def record(self, name, execute, fetch, rows, nbytes, cached=False):
+        """
+        Records one call.
+
+        Parameters:
+            name : (str)
+                The BusinessLayer method that ran the query.
+            execute : (float)
+                Seconds until the server answered.
+            fetch : (float)
+                Seconds spent transferring and decoding the result.
+            rows : (int)
+                The number of rows returned.
+            nbytes : (int)
+                The estimated size of the result.
+            cached : (bool)
+                Whether the result came from the QueryCache.
+
+        Returns:
+            (dict):
+                The recorded call, with its total time in milliseconds.
+        """
+        total = (execute + fetch) * 1000
+        entry = {
+            'time': time.time(), 'name': name, 'total_ms': total, 'execute_ms': execute * 1000,
+            'fetch_ms': fetch * 1000, 'rows': rows, 'bytes': nbytes, 'cached': cached,
+        }
+        bucket = next(index for index, bound in enumerate(LATENCY_BUCKETS) if total <= bound)
+        with self.lock:
+            self.recent.append(entry)
+            counts = self.histograms.setdefault(name, [0] * len(LATENCY_BUCKETS))
+            counts[bucket] += 1
+        return entry
+
+    def is_slow(self, entry):
+        """
+        Returns whether a recorded call goes to the slow query log.
+        """
+        return self.log_path is not None and not entry['cached'] and entry['total_ms'] >= self.slow_ms
+
+    def log_slow(self, entry, query, user, plan=None):
+        """
+        Appends a slow call to the slow query log as one JSON object per line.
+
+        Parameters:
+            entry : (dict)
+                The call as returned by `record`.
+            query : (str)
+                The statement with its parameters filled in.
+            user : (str)
+                The role that ran it.
+            plan : (list)
+                The JSON plan from EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON), if captured.
+        """
+        record = dict(entry, timestamp=time.strftime('%Y-%m-%dT%H:%M:%S%z', time.localtime(entry['time'])),
+                      user=user, query=query)
+        del record['time']
+        if plan is not None:
+            record['plan'] = plan
+        try:
+            with self._log_lock, open(self.log_path, 'a', encoding='utf-8') as log:
+                log.write(json.dumps(record, default=str) + '\n')
+        except OSError as e:
+            logging.error(f"Failed to write the slow query log: {str(e)}")
+
+    def snapshot(self):
+        """
+        Returns copies of the recent calls and histograms, safe to read on another thread.
+
+        Returns:
+            (tuple):
+                (list of recent calls, dict of histograms).
+        """
+        with self.lock:
+            return list(self.recent), {name: list(counts) for name, counts in self.histograms.items()}
+
+    def clear(self):
+        """
+        Forgets every recorded call.
+        """
+        with self.lock:
+            self.recent.clear()
+            self.histograms.clear()
+
 # ----- BusinessLayer ----- #
 class BusinessLayer:
     """
     Provides methods to interact with a PostgreSQL database, including fetching data
     and closing the database connection.
 
+    Every operation borrows a connection from a thread-safe pool and uses its own cursor,
+    so queries from several threads run side by side on separate connections. Failed
+    statements are rolled back, dead connections are replaced, and a query that loses its
+    connection is retried with exponential backoff.
+
     Attributes:
-        conn : psycopg2.connection
-            The connection object to the PostgreSQL database.
-        cursor : psycopg2.cursor
-            The cursor object used for executing database queries.
+        pool : (ThreadedConnectionPool)
+            The pool of connections to the PostgreSQL database.
+        pool_size : (int)
+            The maximum number of connections in the pool.
+        cache : (QueryCache)
+            Cached results of the `get_*` methods, invalidated through LISTEN/NOTIFY.
+        error_handler : (callable)
+            Called as error_handler(title, message) to report a failed query, after which
+            the `get_*` method returns None. Raises the error by default; the GUI replaces
+            it with one that shows an error dialog.
+        stats : (QueryStats)
+            Timings of every query, feeding the slow query log and diagnostics panel.
+        registry : (dict)
+            The registered tables, whether the user may read them and their columns, see
+            `load_registry`, or None until it is loaded.
+        metadata : (dict)
+            The registry with the estimated size of each table, see `prefetch_metadata`.
     """
-    def __init__(self, user, password):
+    def __init__(self, user, password, pool_size=POOL_SIZE, cache=None, stats=None):
         """
         Initializes a new instance of BusinessLayer.
         Attempts to connect to a PostgreSQL database using environment variables.
         Raises an exception if the connection fails.
         """
         self.user = user
+        self.pool_size = pool_size
+        self.cache = cache if cache is not None else QueryCache()
+        self.stats = stats if stats is not None else QueryStats()
+        self.error_handler = raise_error
+        self._slots = threading.BoundedSemaphore(pool_size)     # Blocks instead of exhausting the pool
+        self._active = {}                                       # Thread id -> connections in use
+        self._last_used = {}                                    # Connection id -> time it was returned
+        self._stop = threading.Event()
+        self._series = {}                                       # Bucket size -> {bucket: (packets, bytes)}
+        self._series_lock = threading.Lock()
+        self.registry = None                                    # Table -> what load_registry found
+        self.metadata = {}                                      # Table -> what prefetch_metadata found
+        self._statements = weakref.WeakKeyDictionary()          # Connection -> names it has PREPAREd
+        self._watchers = {}                                     # Table -> callbacks registered with watch()
+        self._listener = None
+        self._listener_lock = threading.Lock()
+
+        # Secure credentials using environment variables
+        self._connect_args = connection_args(user, password)
         try:
-            # Secure credentials using environment variables
-            self.conn = psycopg2.connect(
-                user=self.user,
-                password=password,
-                host=os.getenv('DB_HOST', 'localhost'),
-                port=os.getenv('DB_PORT', '5432'),
-                database=os.getenv('DB_NAME', 'postgres'),
-            )
-            self.cursor = self.conn.cursor()
+            # Bad credentials fail the login on a single connection to the address
+            # preconnect resolved while the user typed
+            psycopg2.connect(**connection_args(user, password, preresolved=True)).close()
+            # The pool looks the host up again and keeps every connection it opens, so
+            # concurrent queries reuse them instead of reconnecting
+            self.pool = ThreadedConnectionPool(pool_size, pool_size, **self._connect_args)
         except Exception as e:
             logging.error(f"Error connecting to the database: {str(e)}")
             raise Exception("Database connection failed. Please check the logs.")
 
-    def get_in450a_data(self):
+        if self.cache.max_bytes:
+            self._start_listener()
+
+    def _start_listener(self):
+        """
+        Starts the thread running `_listen`, unless it already runs.
+        """
+        with self._listener_lock:
+            if self._listener is None:
+                self._listener = threading.Thread(target=self._listen, name='cache-listener', daemon=True)
+                self._listener.start()
+
+    def _listen(self):
+        """
+        Runs on a background thread for the lifetime of the BusinessLayer. Keeps a
+        dedicated connection LISTENing on NOTIFY_CHANNEL, drops the cached results of
+        every table the triggers report as changed, see `invalidate_cache`, and tells the
+        table's watchers. The whole cache is dropped, and every watcher told, whenever the
+        listener (re)connects, since notifications may have been missed meanwhile.
+        """
+        attempt = 0
+        while not self._stop.is_set():
+            conn = None
+            try:
+                conn = psycopg2.connect(**self._connect_args)
+                conn.autocommit = True
+                with conn.cursor() as cursor:
+                    cursor.execute(f"LISTEN {NOTIFY_CHANNEL};")
+                self.invalidate_cache()
+                self._notify_watchers()
+                attempt = 0
+                while not self._stop.is_set():
+                    if select.select([conn], [], [], 1.0) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        table = conn.notifies.pop(0).payload
+                        self.invalidate_cache(table)
+                        self._notify_watchers(table)
+            except psycopg2.Error as e:
+                logging.error(f"Cache invalidation listener lost its connection: {str(e)}")
+                self.invalidate_cache()
+                self._stop.wait(min(RECONNECT_BACKOFF * 2 ** attempt, MAX_BACKOFF))
+                attempt += 1
+            finally:
+                if conn is not None:
+                    conn.close()
+
+    def watch(self, table, callback):
+        """
+        Calls callback(table) whenever the triggers of sql/schema.sql report a change to
+        `table`, and after the listener reconnected. The callback runs on the listener
+        thread, so it should only hand the news on, e.g. by setting an event.
+
+        Parameters:
+            table : (str)
+                The table to watch.
+            callback : (callable)
+                Called with the name of the table.
+        """
+        with self._listener_lock:
+            self._watchers.setdefault(table, []).append(callback)
+        self._start_listener()
+
+    def unwatch(self, table, callback):
+        """
+        Stops calling a callback registered with `watch`.
+        """
+        with self._listener_lock:
+            callbacks = self._watchers.get(table, [])
+            if callback in callbacks:
+                callbacks.remove(callback)
+
+    def _notify_watchers(self, table=None):
+        """
+        Calls the watchers of `table`, or of every table when none is given.
+        """
+        with self._listener_lock:
+            watched = [(name, list(callbacks)) for name, callbacks in self._watchers.items()
+                       if table is None or name == table]
+        for name, callbacks in watched:
+            for callback in callbacks:
+                try:
+                    callback(name)
+                except Exception as e:
+                    logging.error(f"A watcher of {name} failed: {e}")
+
+    @staticmethod
+    def _is_disconnect(error):
+        """
+        Returns whether `error` means the connection was lost rather than the query failing.
+        Errors reported by the server carry a SQLSTATE code; lost connections do not.
+        """
+        return (
+            isinstance(error, (psycopg2.OperationalError, psycopg2.InterfaceError))
+            and not isinstance(error, extensions.QueryCanceledError)
+            and error.pgcode is None
+        )
+
+    def _checkout(self):
+        """
+        Borrows a healthy connection from the pool, reconnecting with backoff while the
+        server cannot be reached.
+
+        Returns:
+            (psycopg2.connection):
+                A connection that is not in a transaction.
+        """
+        for attempt in range(RECONNECT_ATTEMPTS):
+            try:
+                conn = self.pool.getconn()
+            except psycopg2.OperationalError as e:
+                if attempt == RECONNECT_ATTEMPTS - 1:
+                    raise
+                logging.error(f"Could not reach the database, retrying: {str(e)}")
+                time.sleep(min(RECONNECT_BACKOFF * 2 ** attempt, MAX_BACKOFF))
+                continue
+
+            # Connections that sat idle for a while may have been dropped by the server or
+            # a firewall, so make sure they still answer before handing them out
+            idle = time.monotonic() - self._last_used.get(id(conn), time.monotonic())
+            if not conn.closed and idle > HEALTH_CHECK_INTERVAL:
+                try:
+                    with conn.cursor() as cursor:
+                        cursor.execute("SELECT 1;")
+                    conn.rollback()
+                except psycopg2.Error as e:
+                    logging.error(f"Discarding a dead pooled connection: {str(e)}")
+                    conn.close()
+            if conn.closed:
+                self._last_used.pop(id(conn), None)
+                self.pool.putconn(conn, close=True)
+                continue
+            return conn
+        raise psycopg2.OperationalError("Could not get a working connection from the pool.")
+
+    @contextmanager
+    def _connection(self):
+        """
+        Lends a pooled connection to the calling thread for one operation. The transaction
+        is committed if the operation succeeds and rolled back if it fails.
+
+        Yields:
+            (psycopg2.connection):
+                The borrowed connection.
+        """
+        self._slots.acquire()
+        try:
+            conn = self._checkout()
+        except BaseException:
+            self._slots.release()
+            raise
+        thread = threading.get_ident()
+        self._active.setdefault(thread, []).append(conn)
+        try:
+            yield conn
+            conn.commit()
+        except BaseException:
+            if not conn.closed:
+                try:
+                    conn.rollback()
+                except psycopg2.Error:
+                    pass
+            raise
+        finally:
+            self._active[thread].remove(conn)
+            if not self._active[thread]:
+                del self._active[thread]
+            if conn.closed:
+                self._last_used.pop(id(conn), None)
+            else:
+                self._last_used[id(conn)] = time.monotonic()
+            self.pool.putconn(conn, close=bool(conn.closed))
+            self._slots.release()
+
+    def _query(self, query, params=None, one=False, tables=None, prepared=False, *, name):
+        """
+        Runs a query on a pooled connection with its own cursor and fetches the result.
+        If the connection drops the query is retried on a fresh one with backoff.
+
+        Parameters:
+            query : (str or sql.Composable)
+                The statement to run.
+            params : (tuple)
+                The query parameters.
+            one : (bool)
+                Fetch only the first row instead of all rows.
+            tables : (tuple of str)
+                The tables the query reads. When given, the result is served from and
+                stored in the cache, keyed by role, query and parameters. Cached results
+                are shared, so callers must not modify them.
+            prepared : (bool)
+                Run the query as a prepared statement of the connection, see `_prepare`,
+                so that later calls on the same connection skip parsing and planning.
+            name : (str)
+                What the call is recorded as in the query stats, usually the public method.
+
+        Returns:
+            (list of tuple or tuple):
+                The rows of the result, or its first row when `one` is set.
+        """
+        key = None
+        if tables is not None and self.cache.max_bytes:
+            key = (self.user, query if isinstance(query, str) else repr(query), params, one)
+        if key is not None:
+            started = time.perf_counter()
+            hit, value = self.cache.get(key)
+            if hit:
+                rows = int(value is not None) if one else len(value)
+                self._observe(name, 0, time.perf_counter() - started, rows, 0, cached=True)
+                return value
+            version = self.cache.version(tables)
+
+        for attempt in range(RECONNECT_ATTEMPTS):
+            try:
+                with self._connection() as conn:
+                    with conn.cursor() as cursor:
+                        started = time.perf_counter()
+                        if prepared:
+                            cursor.execute(*self._prepare(conn, cursor, query, params))
+                        else:
+                            cursor.execute(query, params)
+                        executed = time.perf_counter()
+                        result = cursor.fetchone() if one else cursor.fetchall()
+                        rows = [result] if one and result is not None else result or []
+                        self._observe(
+                            name, executed - started, time.perf_counter() - executed, len(rows),
+                            QueryStats.result_bytes(rows),
+                            (lambda: cursor.mogrify(query, params)) if prepared else cursor.query
+                        )
+                if key is not None:
+                    self.cache.put(key, result, tables, version)
+                return result
+            except psycopg2.Error as e:
+                if not self._is_disconnect(e) or attempt == RECONNECT_ATTEMPTS - 1:
+                    raise
+                logging.error(f"Lost the database connection, retrying: {str(e)}")
+                time.sleep(min(RECONNECT_BACKOFF * 2 ** attempt, MAX_BACKOFF))
+
+    def _prepare(self, conn, cursor, query, params):
+        """
+        PREPAREs `query` on `conn` unless it already was, and returns the EXECUTE statement
+        running it with `params`. Statements are named after a hash of their text, so the
+        same query built again finds its statement, and the server decides as usual between
+        a plan for the parameters at hand and a generic plan it keeps. Prepared statements
+        live as long as their connection; when one holds PREPARED_MAX of them they are all
+        deallocated first.
+
+        Parameters:
+            conn : (psycopg2.connection)
+                The connection running the query.
+            cursor : (psycopg2.cursor)
+                A cursor of `conn`.
+            query : (str or sql.Composable)
+                The statement, with psycopg2 placeholders.
+            params : (tuple)
+                The query parameters.
+
+        Returns:
+            (tuple):
+                The EXECUTE statement and its parameters.
+        """
+        text = query if isinstance(query, str) else query.as_string(conn)
+        name = f"app_{hashlib.md5(text.encode()).hexdigest()}"
+        prepared = self._statements.setdefault(conn, set())
+        if name not in prepared:
+            if len(prepared) >= PREPARED_MAX:
+                cursor.execute("DEALLOCATE ALL;")
+                prepared.clear()
+            numbers = itertools.count(1)
+            body = PLACEHOLDER.sub(lambda match: '%' if match.group() == '%%' else f"${next(numbers)}", text)
+            cursor.execute(f"PREPARE {name} AS {body.strip().rstrip(';')};")
+            prepared.add(name)
+        params = tuple(params or ())
+        if not params:
+            return f"EXECUTE {name};", None
+        return f"EXECUTE {name} ({', '.join(['%s'] * len(params))});", params
+
+    def _observe(self, name, execute, fetch, rows, nbytes, query=None, cached=False):
+        """
+        Records the timing of one call in `stats`. A slow call is written to the slow
+        query log, after its plan is captured on a background thread when EXPLAIN
+        capture is on.
+
+        Parameters:
+            name : (str)
+                The method that ran the query.
+            execute, fetch : (float)
+                Seconds spent executing the query and fetching its result.
+            rows : (int)
+                The number of rows returned.
+            nbytes : (int)
+                The size of the result.
+            query : (str, bytes or callable)
+                The statement as sent to the server, or a function returning it that is
+                only called when the call was slow.
+            cached : (bool)
+                Whether the result came from the cache.
+        """
+        entry = self.stats.record(name, execute, fetch, rows, nbytes, cached)
+        if query is None or not self.stats.is_slow(entry):
+            return
+        if callable(query):
+            query = query()
+        if isinstance(query, bytes):
+            query = query.decode('utf-8', 'replace')
+        if self.stats.explain:
+            threading.Thread(target=self._explain, args=(entry, query), name='explain', daemon=True).start()
+        else:
+            self.stats.log_slow(entry, query, self.user)
+
+    def _explain(self, entry, query):
+        """
+        Runs EXPLAIN (ANALYZE, BUFFERS) on a slow query and logs it with its plan. The
+        query runs again for this, inside a read-only transaction so that a statement
+        with side effects fails instead of repeating them.
+        """
+        plan = None
+        try:
+            with self._connection() as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute("SET TRANSACTION READ ONLY;")
+                    cursor.execute(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {query.strip().rstrip(';')}")
+                    plan = cursor.fetchone()[0]
+        except Exception as e:
+            logging.error(f"Failed to explain a slow query: {e}")
+        self.stats.log_slow(entry, query, self.user, plan)
+
+    @classmethod
+    def _where(cls, table, filters, extra=(), extra_params=(), registry=None):
+        """
+        Builds a parameterized WHERE clause from search filters and extra conditions.
+
+        Parameters:
+            table : (str)
+                The table being searched, one of `TABLES` or of `registry`.
+            filters : (dict)
+                Search filters, see `_conditions`.
+            extra : (list of sql.Composable)
+                Further conditions to AND with the filters.
+            extra_params : (list)
+                The parameters of the extra conditions.
+            registry : (dict)
+                The registry of the searching role, see `discover_tables`.
+
+        Returns:
+            (tuple):
+                The sql.Composable clause (empty without conditions) and its parameters.
+        """
+        conditions, params = cls._conditions(table, filters, registry)
+        conditions += list(extra)
+        params += list(extra_params)
+        if not conditions:
+            return sql.SQL(""), params
+        return sql.SQL(" WHERE ") + sql.SQL(" AND ").join(conditions), params
+
+    @classmethod
+    def _conditions(cls, table, filters, registry=None):
+        """
+        Turns search filters into parameterized conditions. Every condition is written
+        so that the matching index in sql/schema.sql can serve it.
+
+        Parameters:
+            table : (str)
+                The table being searched, one of `TABLES` or of `registry`.
+            filters : (dict)
+                Filter name -> value, using the names of `table_filters`. Range filters
+                take a (low, high) pair.
+            registry : (dict)
+                The registry of the searching role, see `discover_tables`.
+
+        Returns:
+            (tuple):
+                The list of sql.Composable conditions and the list of their parameters.
+
+        Raises:
+            ValueError: If a filter is unknown or its value is invalid.
+        """
+        known = table_filters(table, registry)
+        conditions, params = [], []
+        for name, value in (filters or {}).items():
+            if name not in known:
+                raise ValueError(f"{table} cannot be filtered by {name}")
+            column_name, kind, convert = known[name]
+            column = sql.Identifier(column_name.lower()) if isinstance(column_name, str) else None
+
+            if kind == 'equals':
+                conditions.append(sql.SQL("{} = %s").format(column))
+                params.append(convert(value))
+
+            elif kind == 'range':
+                low, high = (range_bound(name, convert, end) for end in value)
+                if low is not None:
+                    conditions.append(sql.SQL("{} >= %s").format(column))
+                    params.append(low)
+                if high is not None:
+                    conditions.append(sql.SQL("{} <= %s").format(column))
+                    params.append(high)
+
+            elif kind == 'prefix':
+                conditions.append(sql.SQL("lower({}) LIKE %s").format(column))
+                params.append(escape_like(value.lower()) + '%')
+
+            elif kind == 'contains':
+                # The pg_trgm GIN index serves this once the value has three characters
+                conditions.append(sql.SQL("{} ILIKE %s").format(column))
+                params.append('%' + escape_like(value) + '%')
+
+            elif kind == 'words':
+                conditions.append(sql.SQL("{} @@ websearch_to_tsquery('simple', %s)").format(
+                    sql.Identifier(f"{column_name.lower()}tokens")
+                ))
+                params.append(value)
+
+            elif kind == 'ip':
+                condition, param = cls._ip_test(column, value)
+                conditions.append(condition)
+                params.append(param)
+
+            elif kind == 'endpoint':
+                tests = [
+                    cls._ip_test(sql.Identifier(endpoint.lower()), address.strip())
+                    for address in value.split(',') if address.strip() for endpoint in column_name
+                ]
+                if not tests:
+                    raise ValueError(f"The {name} filter needs an address")
+                conditions.append(sql.SQL("({})").format(sql.SQL(" OR ").join(test for test, _ in tests)))
+                params += [param for _, param in tests]
+
+        return conditions, params
+
+    @staticmethod
+    def _ip_test(column, value):
+        """
+        Returns the condition testing that an INET column holds an address inside the IP
+        address or CIDR network `value`, and its parameter. The SP-GiST inet_ops indexes
+        serve both the equality and the containment test.
+
+        Raises:
+            ValueError: If the value is not an address or network.
+        """
+        network = ipaddress.ip_network(value, strict=False)
+        if network.num_addresses == 1:
+            return sql.SQL("{} = %s::inet").format(column), str(network.network_address)
+        return sql.SQL("{} <<= %s::inet").format(column), str(network)
+
+    @classmethod
+    def build_query(cls, table, filters=None, sort=None, descending=False, registry=None):
+        """
+        Builds the query returning the rows of one of the application's tables that match
+        `filters`, in a stable order. Shared by streaming, exports and the data service.
+
+        Parameters:
+            table : (str)
+                The table to read, one of `TABLES`.
+            filters : (dict)
+                Search filters, see `FILTERS`.
+            sort : (str)
+                The column to order the rows by, or None for primary key order.
+            descending : (bool)
+                Order from the largest value down.
+            registry : (dict)
+                The registry of the reading role, for tables that are not declared.
+
+        Returns:
+            (tuple):
+                The sql.Composable query, without a trailing semicolon, and its parameters.
+
+        Raises:
+            ValueError: If the table, a filter or the sort column is unknown.
+        """
+        where, params = cls._where(table, filters, registry=registry)
+        return (cls._select(table, registry=registry) + where
+                + cls._order_by(table, sort, descending, registry)), params
+
+    @classmethod
+    def build_count(cls, table, filters=None, registry=None):
+        """
+        Builds the query counting the rows of one of the application's tables that match
+        `filters`, see `build_query`.
+
+        Returns:
+            (tuple):
+                The sql.Composable query and its parameters.
+        """
+        where, params = cls._where(table, filters, registry=registry)
+        return sql.SQL("SELECT COUNT(*) FROM {}{};").format(sql.Identifier(table), where), params
+
+    @classmethod
+    def build_search_query(cls, filters, limit, offset=0):
+        """
+        Builds the query returning a page of the in450a rows matching `filters`, the best
+        matches of the words= and info= filters first, with the matches in Info put
+        between MATCH_START and MATCH_END. Pages are taken by offset, since the rank is
+        computed per search; the server still has to rank every match, but only keeps
+        the best `offset + limit` of them while doing so and only marks up the page.
+
+        Parameters:
+            filters : (dict)
+                Search filters, see `FILTERS`, including at least one of `RANKED_FILTERS`.
+            limit : (int)
+                The number of rows on the page.
+            offset : (int)
+                The number of better matches skipped before the page.
+
+        Returns:
+            (tuple):
+                The sql.Composable query and its parameters.
+
+        Raises:
+            ValueError: If no ranked filter is given or a filter is invalid.
+        """
+        filters = filters or {}
+        if not any(name in filters for name in RANKED_FILTERS):
+            raise ValueError(f"Ranking needs one of the filters: {', '.join(RANKED_FILTERS)}")
+        info = sql.Identifier('in450a', 'info')                   # The column, not the marked up output
+        select_params, ranks, rank_params = [], [], []
+        if 'words' in filters:
+            words = sql.SQL("websearch_to_tsquery('simple', %s)")
+            highlight = sql.SQL("ts_headline('simple', {}, {}, %s)").format(info, words)
+            select_params += [filters['words'], f"StartSel={MATCH_START}, StopSel={MATCH_END}, HighlightAll=true"]
+            ranks.append(sql.SQL("ts_rank({}, {}) DESC").format(sql.Identifier('infotokens'), words))
+            rank_params.append(filters['words'])
+        if 'info' in filters:
+            if 'words' not in filters:
+                highlight = sql.SQL("regexp_replace({}, %s, %s, 'gi')").format(info)
+                select_params += [escape_regex(filters['info']), f"{MATCH_START}\\&{MATCH_END}"]
+            ranks.append(sql.SQL("similarity({}, %s) DESC").format(info))
+            rank_params.append(filters['info'])
+
+        where, params = cls._where('in450a', filters)
+        query = (cls._select('in450a', overrides={'info': highlight}) + where
+                 + sql.SQL(" ORDER BY {}, id LIMIT %s OFFSET %s;").format(sql.SQL(', ').join(ranks)))
+        return query, (*select_params, *params, *rank_params, limit, offset)
+
+    @staticmethod
+    def _select(table, key=False, overrides=None, registry=None):
+        """
+        Returns the "SELECT <data columns> FROM <table>" part of a query on `table`, with
+        the primary key as the first column when `key` is set. `overrides` maps column
+        names to sql.Composable expressions to select under their name instead. Tables
+        that are not declared take their columns from `registry`.
+        """
+        expressions = COLUMN_EXPRESSIONS.get(table, {})
+        columns = [
+            sql.SQL("{} AS {}").format(overrides[name], sql.Identifier(name))
+            if overrides and name in overrides else
+            sql.SQL("{} AS {}").format(sql.SQL(expressions[name]), sql.Identifier(name))
+            if name in expressions else sql.Identifier(name)
+            for name in table_columns(table, registry)
+        ]
+        if key:
+            columns.insert(0, sql.Identifier('id'))
+        return sql.SQL("SELECT {} FROM {}").format(sql.SQL(', ').join(columns), sql.Identifier(table))
+
+    @staticmethod
+    def _sort_key(table, sort, descending, registry=None):
+        """
+        Describes the order keyset pagination walks a table in: the sort column, with
+        NULLs at the end (ascending) or start (descending) like a B-tree index scan, then
+        the primary key to break ties.
+
+        Parameters:
+            table : (str)
+                The table being sorted, one of `TABLES` or of `registry`.
+            sort : (str)
+                The column to sort by, one of `table_columns(table)`, or None for primary key order.
+            descending : (bool)
+                Sort from the largest value down.
+            registry : (dict)
+                The registry of the reading role, see `discover_tables`.
+
+        Returns:
+            (tuple):
+                The sort column identifier (None when sorting by the key), the direction
+                keyword and the comparison operator that seeks forward in that order.
+        """
+        if sort is not None and sort not in table_columns(table, registry):
+            raise ValueError(f"{table} cannot be sorted by {sort}")
+        # Qualified, so ORDER BY sorts by the stored column and not by a `COLUMN_EXPRESSIONS`
+        # output of the same name, which no index covers
+        column = sql.Identifier(table, sort) if sort is not None else None
+        return column, sql.SQL("DESC" if descending else "ASC"), sql.SQL("<=" if descending else ">=")
+
+    @classmethod
+    def _order_by(cls, table, sort, descending, registry=None):
+        """
+        Returns the ORDER BY clause matching `_sort_key`.
+        """
+        column, direction, _ = cls._sort_key(table, sort, descending, registry)
+        if column is None:
+            return sql.SQL(" ORDER BY id {}").format(direction)
+        nulls = sql.SQL("FIRST" if descending else "LAST")
+        return sql.SQL(" ORDER BY {} {} NULLS {}, id {}").format(column, direction, nulls, direction)
+
+    def get_data(self, table):
         """
-        Retrieves all records from the 'in450a' table.
+        Retrieves all records from one of the application's tables.
+
+        Parameters:
+            table : (str)
+                The table to read, one of `TABLES`.
 
         Returns:
             (list of tuple):
-                All rows from the 'in450a' table.
+                All rows of the table, in the order of `COLUMN_NAMES[table]`.
         """
         try:
-            self.cursor.execute("SELECT * FROM in450a;")
-            return self.cursor.fetchall()
+            return self._query(self._select(table, registry=self.registry) + sql.SQL(";"), tables=(table,), name='get_data')
         except Exception as e:
-            logging.error(f"Failed to get data from in450a: {e}")
-            messagebox.showerror(
+            logging.error(f"Failed to get data from {table}: {e}")
+            self.error_handler(
                 "Error", 
                 "An error occurred while fetching data. Please check the logs."
             )
 
-    def get_in450b_data(self):
+    def get_count(self, table):
         """
-        Retrieves records from the 'in450b' table specific to the current user.
+        Counts the number of rows in one of the application's tables.
+
+        Parameters:
+            table : (str)
+                The table to count, one of `TABLES`.
 
         Returns:
-            (list of tuple): All rows from the 'in450b' table for the current user.
+            (int):
+                The number of rows in the table visible to the current user.
         """
         try:
-            self.cursor.execute("SELECT * FROM in450b;")
-            return self.cursor.fetchall()
+            query, params = self.build_count(table, registry=self.registry)
+            return self._query(query, tuple(params), one=True, tables=(table,), prepared=True, name='get_count')[0]
         except Exception as e:
-            logging.error(f"Failed to get data from in450b: {e}")
-            messagebox.showerror(
+            logging.error(f"Failed to get row count for {table}: {e}")
+            self.error_handler(
                 "Error", 
                 "An error occurred while fetching data. Please check the logs."
             )
 
+    def get_in450a_data(self):
+        """
+        Retrieves all records from the 'in450a' table, see `get_data`.
+        """
+        return self.get_data('in450a')
+
+    def get_in450b_data(self):
+        """
+        Retrieves all records from the 'in450b' table, see `get_data`.
+        """
+        return self.get_data('in450b')
+
     def get_in450c_data(self):
         """
-        Retrieves records from the 'in450c' table specific to the current user.
+        Retrieves all records from the 'in450c' table, see `get_data`.
+        """
+        return self.get_data('in450c')
 
-        Returns:
-            (list of tuple): 
-                All rows from the 'in450c' table for the current user.
+    def _stream(self, query, table, itersize=DEFAULT_ITERSIZE, params=None, prepare=None, name=None):
+        """
+        Runs a query through a named (server-side) cursor and yields the result in batches.
+
+        Only one batch of rows is held in client memory at a time, so memory use stays
+        flat no matter how large the table is.
+
+        Parameters:
+            query : (str)
+                The SELECT statement to run.
+            table : (str)
+                The table being read, used for the cursor name and error messages.
+            itersize : (int)
+                The number of rows fetched from the server per batch.
+            params : (list)
+                The query parameters.
+            prepare : (callable)
+                Called with a cursor in the query's transaction before the query runs, e.g.
+                to fill a temporary table that the query reads.
+            name : (str)
+                The name the query's timings are recorded under, `stream_rows[<table>]`
+                by default.
+
+        Yields:
+            (list of tuple):
+                The next batch of at most `itersize` rows.
         """
         try:
-            self.cursor.execute("SELECT * FROM in450c;")
-            return self.cursor.fetchall()
+            # The connection stays checked out until the stream is exhausted or closed
+            with self._connection() as conn:
+                if prepare is not None:
+                    with conn.cursor() as cursor:
+                        prepare(cursor)
+                with conn.cursor(name=f"stream_{table}_{uuid.uuid4().hex}") as cursor:
+                    cursor.itersize = itersize
+                    started = time.perf_counter()
+                    cursor.execute(query, params)
+                    execute = time.perf_counter() - started
+                    fetch, rows, nbytes = 0.0, 0, 0
+                    try:
+                        while True:
+                            started = time.perf_counter()
+                            batch = cursor.fetchmany(itersize)
+                            fetch += time.perf_counter() - started
+                            if not batch:
+                                break
+                            rows += len(batch)
+                            nbytes += QueryStats.result_bytes(batch)
+                            yield batch
+                    finally:
+                        # Time spent by the consumer between batches is not counted
+                        self._observe(name or f"stream_rows[{table}]", execute, fetch, rows, nbytes,
+                                      cursor.mogrify(query, params))
         except Exception as e:
-            logging.error(f"Failed to get data from in450c: {e}")
-            messagebox.showerror(
-                "Error", 
-                "An error occurred while fetching data. Please check the logs."
+            logging.error(f"Failed to stream data from {table}: {e}")
+            raise Exception("An error occurred while streaming data. Please check the logs.")
+
+    def stream_in450a_data(self, itersize=DEFAULT_ITERSIZE):
+        """
+        Streams all records from the 'in450a' table, see `stream_rows`.
+
+        Parameters:
+            itersize : (int)
+                The number of rows fetched from the server per batch.
+
+        Yields:
+            (list of tuple):
+                Batches of rows from the 'in450a' table.
+        """
+        return self.stream_rows('in450a', itersize=itersize)
+
+    def stream_in450b_data(self, itersize=DEFAULT_ITERSIZE):
+        """
+        Streams all records from the 'in450b' table, see `stream_rows`.
+
+        Parameters:
+            itersize : (int)
+                The number of rows fetched from the server per batch.
+
+        Yields:
+            (list of tuple):
+                Batches of rows from the 'in450b' table.
+        """
+        return self.stream_rows('in450b', itersize=itersize)
+
+    def stream_in450c_data(self, itersize=DEFAULT_ITERSIZE):
+        """
+        Streams all records from the 'in450c' table, see `stream_rows`.
+
+        Parameters:
+            itersize : (int)
+                The number of rows fetched from the server per batch.
+
+        Yields:
+            (list of tuple):
+                Batches of rows from the 'in450c' table.
+        """
+        return self.stream_rows('in450c', itersize=itersize)
+
+    def stream_rows(self, table, filters=None, sort=None, descending=False, itersize=DEFAULT_ITERSIZE):
+        """
+        Streams the rows of one of the application's tables that match `filters`,
+        using a server-side cursor.
+
+        Parameters:
+            table : (str)
+                The table to read, one of `TABLES`.
+            filters : (dict)
+                Search filters, see `FILTERS`.
+            sort : (str)
+                The column to order the rows by, or None for primary key order.
+            descending : (bool)
+                Order from the largest value down.
+            itersize : (int)
+                The number of rows fetched from the server per batch.
+
+        Yields:
+            (list of tuple):
+                Batches of matching rows.
+        """
+        query, params = self.build_query(table, filters, sort, descending, self.registry)
+        return self._stream(query + sql.SQL(";"), table, itersize, params)
+
+    def get_traffic_report(self, table, live=False):
+        """
+        Reports which rows of in450b or in450c appear in the in450a capture: every row
+        whose source or destination address sent or received packets, with the packets
+        and bytes of each of its two addresses and when either was first and last seen,
+        the most packets first.
+
+        The figures come from in450a_host_traffic, the per-address totals that triggers on
+        in450a keep up to date as packets are added (see sql/schema.sql), so the report
+        costs two primary key probes per row. `live` computes them from in450a instead,
+        with two probes of its address indexes per row.
+
+        Parameters:
+            table : (str)
+                The table to report on, one of `CORRELATED_TABLES`.
+            live : (bool)
+                Count the packets in in450a instead of reading the summary table.
+
+        Returns:
+            (list of tuple):
+                The data columns of each row followed by `TRAFFIC_REPORT_COLUMNS`.
+
+        Raises:
+            ValueError: If the table cannot be correlated with in450a.
+        """
+        if table not in CORRELATED_TABLES:
+            raise ValueError(f"{table} rows cannot be correlated with in450a")
+        if live:
+            totals = sql.SQL(
+                "LATERAL (SELECT COUNT(*) AS packets, COALESCE(SUM(Length), 0) AS bytes, MIN(Time) AS first_seen, "
+                "MAX(Time) AS last_seen FROM in450a WHERE Source = t.{0} OR Destination = t.{0})"
             )
+            joins = [(totals.format(sql.Identifier(column)), sql.SQL("{}.packets > 0").format(sql.Identifier(alias)))
+                     for column, alias in (('source', 's'), ('destination', 'd'))]
+        else:
+            joins = [(sql.Identifier('in450a_host_traffic'), sql.SQL("{0}.address = t.{1}").format(sql.Identifier(alias), sql.Identifier(column)))
+                     for column, alias in (('source', 's'), ('destination', 'd'))]
+        query = sql.SQL(
+            "SELECT {columns}, COALESCE(s.packets, 0), COALESCE(s.bytes, 0), COALESCE(d.packets, 0), "
+            "COALESCE(d.bytes, 0), LEAST(s.first_seen, d.first_seen), GREATEST(s.last_seen, d.last_seen) "
+            "FROM {table} t LEFT JOIN {source} s ON {source_on} LEFT JOIN {destination} d ON {destination_on} "
+            "WHERE s.packets IS NOT NULL OR d.packets IS NOT NULL "
+            "ORDER BY COALESCE(s.packets, 0) + COALESCE(d.packets, 0) DESC, t.id;"
+        ).format(
+            columns=sql.SQL(', ').join(sql.Identifier('t', name) for name in COLUMN_NAMES[table]),
+            table=sql.Identifier(table),
+            source=joins[0][0], source_on=joins[0][1],
+            destination=joins[1][0], destination_on=joins[1][1],
+        )
+        try:
+            return self._query(query, tables=('in450a', table), name='get_traffic_report')
+        except Exception as e:
+            logging.error(f"Failed to get the traffic report of {table}: {e}")
+            raise Exception("An error occurred while fetching data. Please check the logs.")
 
-    def get_in450a_row_count(self):
+    def lookup_in450c(self, column, values, itersize=DEFAULT_ITERSIZE):
+        """
+        Streams the in450c rows whose DigSig or AppID is one of `values`, resolving the
+        whole collection in one query instead of one per value. Up to LOOKUP_ARRAY_MAX
+        values are sent as a single array that is unnested and joined to in450c; larger
+        collections are first copied into a temporary table with COPY FROM STDIN, in the
+        same transaction. Either way each value is looked up through the DigSig hash index
+        or the AppID B-tree of sql/schema.sql. Values are matched exactly; repeated and
+        empty values are ignored.
+
+        Parameters:
+            column : (str)
+                The column to match, one of `LOOKUP_COLUMNS`.
+            values : (iterable of str)
+                The values to look up.
+            itersize : (int)
+                The number of rows fetched from the server per batch.
+
+        Yields:
+            (list of tuple):
+                Batches of matching rows, in primary key order.
+
+        Raises:
+            ValueError: If the column cannot be looked up.
         """
-        Counts the number of rows in the 'in450a' table.
+        if column not in LOOKUP_COLUMNS:
+            raise ValueError(f"in450c can be looked up by: {', '.join(LOOKUP_COLUMNS)}")
+        wanted = list(dict.fromkeys(value for value in values if value))
+        if len(wanted) <= LOOKUP_ARRAY_MAX:
+            source, params, prepare = sql.SQL("unnest(%s::text[])"), [wanted], None
+        else:
+            source, params = sql.SQL("lookup_values"), None
+
+            def prepare(cursor):
+                buffer = io.StringIO()
+                csv.writer(buffer).writerows((value,) for value in wanted)
+                buffer.seek(0)
+                cursor.execute("CREATE TEMP TABLE lookup_values (value TEXT) ON COMMIT DROP;")
+                cursor.copy_expert("COPY lookup_values FROM STDIN WITH (FORMAT csv);", buffer)
+                cursor.execute("ANALYZE lookup_values;")
+
+        query = self._select('in450c') + sql.SQL(" JOIN {} AS wanted(value) ON {} = wanted.value ORDER BY {};").format(
+            source, sql.Identifier('in450c', LOOKUP_COLUMNS[column].lower()), sql.Identifier('in450c', 'id')
+        )
+        return self._stream(query, 'in450c', itersize, params, prepare, f"lookup_in450c[{column}]")
+
+    def get_columnar(self, table, filters=None, sort=None, descending=False, itersize=DEFAULT_ITERSIZE):
+        """
+        Retrieves the rows of one of the application's tables that match `filters` into a
+        compact columnar.ColumnarResult, for results that have to be held on the client.
+        The rows are streamed in and encoded a batch at a time, so the tuples of the whole
+        result never exist at once. The result can be sorted and filtered again without
+        going back to the server.
+
+        Parameters:
+            table : (str)
+                The table to read, one of `TABLES`.
+            filters : (dict)
+                Search filters, see `FILTERS`.
+            sort : (str)
+                The column to order the rows by, or None for primary key order.
+            descending : (bool)
+                Order from the largest value down.
+            itersize : (int)
+                The number of rows fetched from the server per batch.
 
         Returns:
-            (int): 
-                The number of rows in the 'in450a' table.
+            (ColumnarResult):
+                The matching rows.
         """
+        from columnar import ColumnarResult                 # Imports this module, so not at the top
+
         try:
-            self.cursor.execute("SELECT COUNT(*) FROM in450a;")
-            return self.cursor.fetchone()[0]
+            return ColumnarResult.from_batches(table, self.stream_rows(table, filters, sort, descending, itersize),
+                                               self.registry)
         except Exception as e:
-            logging.error(f"Failed to get row count for in450a: {e}")
-            messagebox.showerror(
-                "Error", 
-                "An error occurred while fetching data. Please check the logs."
-            )
+            logging.error(f"Failed to get columnar data from {table}: {e}")
+            raise Exception("An error occurred while fetching data. Please check the logs.")
+
+    def export(self, table, path, filters=None, sort=None, descending=False, fmt='csv',
+               compress=False, progress=None):
+        """
+        Streams the rows of one of the application's tables that match `filters` straight
+        to a file with COPY (query) TO STDOUT. The server formats the rows as CSV and they
+        are written to disk as they arrive, so memory use stays flat whatever the size of
+        the result and no row is ever built as a Python tuple.
+
+        Parquet files are written by parsing the CSV stream into Arrow record batches of
+        `EXPORT_BLOCK_SIZE` bytes, which needs the optional pyarrow package.
+
+        Parameters:
+            table : (str)
+                The table to export, one of `TABLES`.
+            path : (str)
+                The file to write. It is removed again if the export fails.
+            filters : (dict)
+                Only export the rows matching these search filters, see `FILTERS`.
+            sort : (str)
+                The column to order the rows by, or None for primary key order.
+            descending : (bool)
+                Order from the largest value down.
+            fmt : (str)
+                'csv' or 'parquet'.
+            compress : (bool)
+                Gzip a CSV file, or use gzip instead of snappy for the pages of a Parquet file.
+            progress : (callable)
+                Called as progress(bytes, rows) with the amount of CSV received so far.
+                Raising from it aborts the export.
+
+        Returns:
+            (dict):
+                The number of rows exported (counted as CSV lines, so a value holding a
+                line break counts twice) and of CSV bytes received from the server.
+        """
+        if fmt not in ('csv', 'parquet'):
+            raise ValueError(f"Unknown export format: {fmt}")
+        query, params = self.build_query(table, filters, sort, descending, self.registry)
+        try:
+            with self._connection() as conn:
+                with conn.cursor() as cursor:
+                    select = cursor.mogrify(query, params).decode(conn.encoding_name)
+                    copy = f"COPY ({select}) TO STDOUT WITH (FORMAT csv, HEADER)"
+                    started = time.perf_counter()
+                    if fmt == 'csv':
+                        with (gzip.open(path, 'wb') if compress else open(path, 'wb')) as target:
+                            writer = ExportWriter(target, progress)
+                            cursor.copy_expert(copy, writer)
+                    else:
+                        writer = self._export_parquet(cursor, query, params, copy, path, compress, progress)
+                    # The server streams COPY output while it runs, so the time to the first
+                    # data stands for execution and the rest for the transfer
+                    finished = time.perf_counter()
+                    first = writer.first or finished
+                    rows = max(writer.rows - 1, 0)
+                    self._observe(f"export[{table}]", first - started, finished - first, rows, writer.bytes, select)
+            return {'rows': rows, 'bytes': writer.bytes}
+        except Exception as e:
+            if os.path.exists(path):
+                os.remove(path)
+            logging.error(f"Failed to export {table} to {path}: {e}")
+            raise Exception("An error occurred while exporting data. Please check the logs.")
+
+    @staticmethod
+    def _export_parquet(cursor, query, params, copy, path, compress, progress):
+        """
+        Runs `copy` and writes its CSV output to a Parquet file. The COPY feeds a pipe on
+        the calling thread, so it can still be cancelled with `cancel_query`, while a
+        helper thread parses the other end into record batches and writes them out.
+
+        Returns:
+            (ExportWriter):
+                The writer the COPY output went through.
+        """
+        try:
+            import pyarrow
+            from pyarrow import csv as arrow_csv, parquet
+        except ImportError:
+            raise RuntimeError("Parquet export needs pyarrow: pip install database_application[parquet]")
+
+        # Read the column types of the result without running it, so every batch gets the same schema
+        cursor.execute(sql.SQL("SELECT * FROM ({}) result LIMIT 0;").format(query), params)
+        columns = {
+            column.name: getattr(pyarrow, ARROW_TYPES.get(column.type_code, 'string'))()
+            for column in cursor.description
+        }
+        options = dict(
+            read_options=arrow_csv.ReadOptions(block_size=EXPORT_BLOCK_SIZE),
+            convert_options=arrow_csv.ConvertOptions(
+                column_types=columns, strings_can_be_null=True, quoted_strings_can_be_null=False
+            ),
+        )
+
+        read_fd, write_fd = os.pipe()
+        errors = []
+
+        def consume():
+            try:
+                with open(read_fd, 'rb') as source:
+                    reader = arrow_csv.open_csv(source, **options)
+                    with parquet.ParquetWriter(path, reader.schema,
+                                               compression='gzip' if compress else 'snappy') as output:
+                        for batch in reader:
+                            output.write_batch(batch)
+            except Exception as e:
+                errors.append(e)
+
+        consumer = threading.Thread(target=consume, name='parquet-export', daemon=True)
+        consumer.start()
+        try:
+            with open(write_fd, 'wb') as target:
+                writer = ExportWriter(target, progress)
+                cursor.copy_expert(copy, writer)
+        except BrokenPipeError:
+            pass                                            # The consumer failed; its error is raised below
+        finally:
+            consumer.join()
+        if errors:
+            raise errors[0]
+        return writer
+
+    def get_row_count(self, table, filters=None):
+        """
+        Counts the number of rows in one of the application's tables.
+
+        Parameters:
+            table : (str)
+                The table to count, one of `TABLES`.
+            filters : (dict)
+                Only count the rows matching these search filters, see `FILTERS`.
+
+        Returns:
+            (int):
+                The number of rows in the table visible to the current user.
+        """
+        query, params = self.build_count(table, filters, self.registry)
+        try:
+            return self._query(query, tuple(params), one=True, tables=(table,), prepared=True, name='get_row_count')[0]
+        except Exception as e:
+            logging.error(f"Failed to get row count for {table}: {e}")
+            raise Exception("An error occurred while fetching data. Please check the logs.")
+
+    def get_page_keys(self, table, page_size, filters=None, sort=None, descending=False):
+        """
+        Finds the sort key of the first row of every page, so that any page can then be
+        fetched with `get_page_after` at the same cost. This reads only the sort column
+        and primary key, once per sort order and filter.
+
+        Parameters:
+            table : (str)
+                The table to read, one of `TABLES`.
+            page_size : (int)
+                The number of rows per page.
+            filters : (dict)
+                Only consider the rows matching these search filters, see `FILTERS`.
+            sort : (str)
+                The column the pages are ordered by, or None for primary key order.
+            descending : (bool)
+                Order from the largest value down.
+
+        Returns:
+            (list of tuple):
+                The (sort value, id) of the first row of each page, or (id,) when sorting
+                by the primary key.
+        """
+        column, _, _ = self._sort_key(table, sort, descending, self.registry)
+        keys = sql.SQL("id") if column is None else sql.SQL("{}, id").format(column)
+        ranked = sql.SQL("id") if column is None else sql.SQL("{}, id").format(sql.Identifier(sort))
+        where, params = self._where(table, filters, registry=self.registry)
+        query = sql.SQL(
+            "SELECT {ranked} FROM ("
+            "SELECT {keys}, row_number() OVER ({order}) AS position FROM {table}{where}"
+            ") ranked WHERE (position - 1) %% %s = 0 ORDER BY position;"
+        ).format(ranked=ranked, keys=keys, order=self._order_by(table, sort, descending, self.registry),
+                 table=sql.Identifier(table), where=where)
+        try:
+            return self._query(query, (*params, page_size), tables=(table,), name='get_page_keys')
+        except Exception as e:
+            logging.error(f"Failed to get page keys for {table}: {e}")
+            raise Exception("An error occurred while fetching data. Please check the logs.")
+
+    def get_last_rows(self, table, limit, filters=None):
+        """
+        Retrieves the `limit` most recently added rows of a table, oldest first, each
+        with its primary key in front. Starts a live tail, see `get_rows_after`.
+
+        Parameters:
+            table : (str)
+                The table to read, one of `TABLES`.
+            limit : (int)
+                The maximum number of rows.
+            filters : (dict)
+                Only return the rows matching these search filters, see `FILTERS`.
+
+        Returns:
+            (list of tuple):
+                (id, *data columns) of each row, in primary key order.
+        """
+        where, params = self._where(table, filters, registry=self.registry)
+        query = sql.SQL("SELECT * FROM ({} ORDER BY id DESC LIMIT %s) latest ORDER BY id;").format(
+            self._select(table, key=True, registry=self.registry) + where
+        )
+        try:
+            return self._query(query, (*params, limit), name='get_last_rows')
+        except Exception as e:
+            logging.error(f"Failed to get the last rows of {table}: {e}")
+            raise Exception("An error occurred while fetching data. Please check the logs.")
+
+    def get_rows_after(self, table, after_id, limit, filters=None):
+        """
+        Retrieves the rows added to a table since the row whose primary key is `after_id`,
+        oldest first, each with its primary key in front. The caller keeps the largest
+        key it has seen as a high-water mark and passes it to the next call, so only new
+        rows are ever transferred. The result is never cached, and the query runs as a
+        prepared statement since a tail repeats it every few seconds.
+
+        Keys are handed out in insert order but become visible in commit order, so a row
+        whose transaction commits after a later one's can be passed over. The capture
+        pipeline and bulk_loader.py commit a table's rows in a single stream, which keeps
+        the two orders the same.
+
+        Parameters:
+            table : (str)
+                The table to read, one of `TABLES`.
+            after_id : (int)
+                The high-water mark: only rows with a larger primary key are returned.
+            limit : (int)
+                The maximum number of rows; fewer means the tail has caught up.
+            filters : (dict)
+                Only return the rows matching these search filters, see `FILTERS`. A lower
+                bound on in450a's time lets the server skip all but the newest partitions.
+
+        Returns:
+            (list of tuple):
+                (id, *data columns) of each row, in primary key order.
+        """
+        where, params = self._where(table, filters, [sql.SQL("id > %s")], [after_id], self.registry)
+        query = self._select(table, key=True, registry=self.registry) + where + sql.SQL(" ORDER BY id LIMIT %s;")
+        try:
+            return self._query(query, (*params, limit), prepared=True, name='get_rows_after')
+        except Exception as e:
+            logging.error(f"Failed to get the rows of {table} after {after_id}: {e}")
+            raise Exception("An error occurred while fetching data. Please check the logs.")
+
+    def search_info(self, filters, limit, offset=0):
+        """
+        Searches the Info of in450a, returning a page of the matching rows with the best
+        matches first and the matches in Info marked, see `build_search_query`. words=
+        searches are ranked by ts_rank and info= substring searches by trigram similarity.
+
+        Parameters:
+            filters : (dict)
+                Search filters, see `FILTERS`, including at least one of `RANKED_FILTERS`.
+            limit : (int)
+                The number of rows on the page.
+            offset : (int)
+                The number of better matches skipped before the page.
+
+        Returns:
+            (list of tuple):
+                The rows of the requested page.
+        """
+        query, params = self.build_search_query(filters, limit, offset)
+        try:
+            return self._query(query, params, tables=('in450a',), prepared=True, name='search_info')
+        except Exception as e:
+            logging.error(f"Failed to search in450a for {filters}: {e}")
+            raise Exception("An error occurred while fetching data. Please check the logs.")
+
+    def get_page_after(self, table, key, limit, filters=None, sort=None, descending=False):
+        """
+        Retrieves one page of rows starting at `key`, seeking to it through the index on
+        the sort column and primary key instead of skipping rows with OFFSET, so the last
+        page costs the same as the first.
+
+        Parameters:
+            table : (str)
+                The table to read, one of `TABLES`.
+            key : (tuple)
+                The key of the first row of the page, from `get_page_keys`.
+            limit : (int)
+                The maximum number of rows in the page.
+            filters : (dict)
+                Only return the rows matching these search filters, see `FILTERS`.
+            sort : (str)
+                The column the rows are ordered by, or None for primary key order.
+            descending : (bool)
+                Order from the largest value down.
+
+        Returns:
+            (list of tuple):
+                The rows of the requested page.
+        """
+        column, direction, seek = self._sort_key(table, sort, descending, self.registry)
+        id_order = sql.SQL(" ORDER BY id {}").format(direction)
+        if column is None:
+            segments = [([sql.SQL("id {} %s").format(seek)], [key[0]], id_order)]
+        else:
+            # Row comparisons never match NULL, so the NULL and non-NULL runs of the sort
+            # column are read separately: first from the key within its own run, then from
+            # the start of the run that follows it, if any.
+            value_order = sql.SQL(" ORDER BY {} {}, id {}").format(column, direction, direction)
+            seek_values = ([sql.SQL("({}, id) {} (%s, %s)").format(column, seek)], list(key), value_order)
+            seek_nulls = ([sql.SQL("{} IS NULL AND id {} %s").format(column, seek)], [key[1]], id_order)
+            all_values = ([sql.SQL("{} IS NOT NULL").format(column)], [], value_order)
+            all_nulls = ([sql.SQL("{} IS NULL").format(column)], [], id_order)
+            if key[0] is None:
+                segments = [seek_nulls, all_values] if descending else [seek_nulls]
+            else:
+                segments = [seek_values] if descending else [seek_values, all_nulls]
+
+        rows = []
+        try:
+            for conditions, condition_params, order in segments:
+                where, params = self._where(table, filters, conditions, condition_params, self.registry)
+                query = self._select(table, registry=self.registry) + where + order + sql.SQL(" LIMIT %s;")
+                rows += self._query(query, (*params, limit - len(rows)), tables=(table,), prepared=True, name='get_page_after')
+                if len(rows) >= limit:
+                    break
+            return rows
+        except Exception as e:
+            logging.error(f"Failed to get page after {key} from {table}: {e}")
+            raise Exception("An error occurred while fetching data. Please check the logs.")
+
+    def get_in450a_row_count(self):
+        """
+        Counts the number of rows in the 'in450a' table, see `get_count`.
+        """
+        return self.get_count('in450a')
 
     def get_in450b_names(self):
         """
@@ -126,46 +2130,249 @@ class BusinessLayer:
                 All first and last names from the 'in450b' table for the current user.
         """
         try:
-            self.cursor.execute("SELECT first_name, last_name FROM in450b;")
-            return self.cursor.fetchall()
+            return self._query("SELECT first_name, last_name FROM in450b;", tables=('in450b',), name='get_in450b_names')
         except Exception as e:
             logging.error(f"Failed to get names from in450b: {e}")
-            messagebox.showerror(
+            self.error_handler(
                 "Error", 
                 "An error occurred while fetching data. Please check the logs."
             )
 
     def get_in450c_row_count(self):
         """
-        Counts the number of rows in the 'in450c' table for the current user.
+        Counts the number of rows in the 'in450c' table, see `get_count`.
+        """
+        return self.get_count('in450c')
+
+    def get_protocol_stats(self):
+        """
+        Retrieves packets and bytes per protocol in 'in450a', from the analytics view.
 
         Returns:
-            (int):
-                The number of rows in the 'in450c' table for the current user.
+            (list of tuple):
+                (protocol, packets, bytes), busiest protocol first.
         """
         try:
-            self.cursor.execute("SELECT COUNT(*) FROM in450c;")
-            return self.cursor.fetchone()[0]
-        except Exception as e:
-            logging.error(f"Failed to get row count from in450c: {e}")
-            messagebox.showerror(
-                "Error", 
-                "An error occurred while fetching data. Please check the logs."
+            return self._query(
+                "SELECT Protocol, packets, bytes FROM in450a_protocol_stats ORDER BY packets DESC;",
+                tables=(ANALYTICS,), name='get_protocol_stats'
             )
+        except Exception as e:
+            logging.error(f"Failed to get protocol statistics: {e}")
+            raise Exception("An error occurred while fetching data. Please check the logs.")
+
+    def get_top_talkers(self, direction='source', limit=20):
+        """
+        Retrieves the addresses that send or receive the most packets in 'in450a', from
+        the analytics views.
+
+        Parameters:
+            direction : (str)
+                'source' for senders or 'destination' for receivers.
+            limit : (int)
+                The number of addresses to return.
+
+        Returns:
+            (list of tuple):
+                (address, packets, bytes), busiest address first.
+        """
+        if direction not in ('source', 'destination'):
+            raise ValueError(f"Unknown direction: {direction}")
+        query = sql.SQL("SELECT address, packets, bytes FROM {} ORDER BY packets DESC LIMIT %s;").format(
+            sql.Identifier(f"in450a_{direction}_stats")
+        )
+        try:
+            return self._query(query, (limit,), tables=(ANALYTICS,), name='get_top_talkers')
+        except Exception as e:
+            logging.error(f"Failed to get top {direction} talkers: {e}")
+            raise Exception("An error occurred while fetching data. Please check the logs.")
+
+    def get_traffic_over_time(self, bucket_seconds=1):
+        """
+        Retrieves packets and bytes per time bucket of 'in450a'.
+
+        Buckets are kept between calls, and since captures are appended in time order only
+        the last cached bucket (which may have been incomplete) and anything after it are
+        recomputed. `invalidate_cache` starts over, which the listener does whenever in450a
+        changes, since a reload, delete or update may touch any bucket.
+
+        Parameters:
+            bucket_seconds : (int or Decimal)
+                The width of a bucket in seconds of capture time.
+
+        Returns:
+            (list of tuple):
+                (bucket start, packets, bytes) in time order.
+        """
+        width = Decimal(bucket_seconds)
+        with self._series_lock:
+            buckets = self._series.setdefault(width, {})
+            resume = max(buckets, default=None)
+
+        conditions = [sql.SQL("Time IS NOT NULL")]
+        params = [width]
+        if resume is not None:
+            conditions.append(sql.SQL("Time >= %s"))
+            params.append(resume * width)
+        query = sql.SQL(
+            "SELECT floor(Time / %s)::bigint AS bucket, COUNT(*), COALESCE(SUM(Length), 0) "
+            "FROM in450a WHERE {} GROUP BY bucket;"
+        ).format(sql.SQL(" AND ").join(conditions))
+        try:
+            rows = self._query(query, tuple(params), name='get_traffic_over_time')
+        except Exception as e:
+            logging.error(f"Failed to get traffic over time: {e}")
+            raise Exception("An error occurred while fetching data. Please check the logs.")
+
+        with self._series_lock:
+            buckets.update((bucket, (packets, total)) for bucket, packets, total in rows)
+            return [(bucket * width, packets, total) for bucket, (packets, total) in sorted(buckets.items())]
+
+    def refresh_analytics(self):
+        """
+        Refreshes the in450a analytics views on the server without blocking readers. The
+        refresh notifies every listening application, which drops its cached analytics.
+        """
+        try:
+            self._query("SELECT refresh_in450a_analytics();", one=True, name='refresh_analytics')
+        except Exception as e:
+            logging.error(f"Failed to refresh the analytics views: {e}")
+            raise Exception("An error occurred while refreshing the analytics. Please check the logs.")
+        self.cache.invalidate(ANALYTICS)
+
+    def cache_stats(self):
+        """
+        Returns the hit/miss statistics of the query cache, for tuning its size and TTL.
+
+        Returns:
+            (dict):
+                Hits, misses, evictions, expirations, invalidations, hit rate, number of
+                entries and bytes in use.
+        """
+        return self.cache.statistics()
+
+    def invalidate_cache(self, table=None):
+        """
+        Drops the cached results of `table`, or of every table when none is given,
+        including the time buckets kept by `get_traffic_over_time`.
+
+        Parameters:
+            table : (str)
+                The table whose results should be fetched again.
+        """
+        self.cache.invalidate(table)
+        if table in (None, 'in450a'):
+            with self._series_lock:
+                self._series.clear()
+
+    def cancel_query(self, thread=None):
+        """
+        Asks the server to cancel a running query. Safe to call from any thread; the
+        cancelled call fails with QueryCanceledError.
+
+        Parameters:
+            thread : (int)
+                The ident of the thread whose query should be cancelled. Every running
+                query is cancelled when it is not given.
+        """
+        if thread is None:
+            connections = [conn for in_use in list(self._active.values()) for conn in in_use]
+        else:
+            connections = list(self._active.get(thread, []))
+        for conn in connections:
+            try:
+                conn.cancel()
+            except Exception as e:
+                logging.error(f"Error cancelling the query: {str(e)}")
+
+    def load_registry(self):
+        """
+        Discovers the tables listed in the app_tables registry of sql/schema.sql, whether
+        the user may read them (has_table_privilege) and their columns and types
+        (information_schema), see `discover_tables`. A database without the registry gets
+        the tables declared in `TABLES`. The result is kept in `self.registry`, so only the
+        first call of a BusinessLayer queries the server, and it only describes what this
+        BusinessLayer's user may see.
+
+        Returns:
+            (dict):
+                Table -> {'label', 'readable', 'columns', 'filters', 'types'}, in registry
+                order, for the tables that exist.
+        """
+        if self.registry is not None:
+            return self.registry
+        try:
+            try:
+                rows = self._query(*registry_query(), name='load_registry')
+            except UndefinedTable:
+                rows = self._query(*registry_query(declared=True), name='load_registry')
+        except Exception as e:
+            logging.error(f"Failed to load the table registry: {e}")
+            raise Exception("An error occurred while fetching data. Please check the logs.")
+        self.registry = discover_tables(rows)
+        return self.registry
+
+    def readable_tables(self):
+        """
+        Returns the registered tables the user may read, in registry order.
+        """
+        return [table for table, info in self.load_registry().items() if info['readable'] and info['columns']]
+
+    def _table_estimate(self, table):
+        """
+        Returns the estimated number of rows of `table`. The estimate comes from the
+        planner statistics, summed over the partitions of a partitioned table, so it costs
+        no scan.
+        """
+        return self._query(
+            """
+            SELECT COALESCE(SUM(GREATEST(p.reltuples, 0)), 0)::bigint FROM pg_class p
+            WHERE p.oid = to_regclass(%s)
+               OR p.oid IN (SELECT inhrelid FROM pg_inherits WHERE inhparent = to_regclass(%s));
+            """,
+            (table, table), one=True, name='_table_estimate'
+        )[0]
+
+    def prefetch_metadata(self, tables=None):
+        """
+        Loads the registry, see `load_registry`, and fetches the estimated size of each
+        table in parallel, one pooled connection per table, keeping both in
+        `self.metadata`. Called right after the login, while the main window is being built.
+
+        Parameters:
+            tables : (iterable of str)
+                The tables to describe, or None for every registered table.
+
+        Returns:
+            (dict):
+                Table -> {'label', 'readable', 'columns', 'estimate'}, for the tables that exist.
+        """
+        registry = self.load_registry()
+        wanted = None if tables is None else set(tables)
+        tables = [table for table in registry if wanted is None or table in wanted]
+        try:
+            with ThreadPoolExecutor(max_workers=min(len(tables), self.pool_size) or 1,
+                                    thread_name_prefix='prefetch') as executor:
+                estimates = list(executor.map(self._table_estimate, tables))
+        except Exception as e:
+            logging.error(f"Failed to prefetch table metadata: {e}")
+            raise Exception("An error occurred while fetching data. Please check the logs.")
+        self.metadata = {table: dict(registry[table], estimate=estimate) for table, estimate in zip(tables, estimates)}
+        return self.metadata
 
     def close_connection(self):
         """
-        Closes the database connection and cursor.
+        Closes every connection in the pool.
 
         This method should be called when the database connection is no longer needed
         to ensure that resources are properly released.
         """
+        self._stop.set()
         try:
-            self.cursor.close()
-            self.conn.close()
+            self.pool.closeall()
         except Exception as e:
             logging.error(f"Error closing the connection: {str(e)}")
-            messagebox.showerror(
+            self.error_handler(
                 "Error", 
                 "An error occurred while closing the database connection. Please check the logs."
             )
@@ -0,0 +1,688 @@
+#!/usr/bin/env python
+# columnar.py
+"""
+Author          :   Alexander Shelton
+Date            :   October 2024
+Name            :   Database Application
+Description     :   A compact, column-oriented container for query results held on the client.
+
+A result fetched as tuples costs a Python object per value: a Decimal per capture time and a
+str per address and protocol, although in450a has a handful of protocols and few distinct
+addresses. ColumnarResult stores numbers in typed arrays, repeated values once with a small
+integer code per row, and addresses packed into 4 or 16 bytes. Filters and sorts are
+evaluated once per distinct value and then mapped over the codes, and rows are only turned
+back into tuples for the slice on screen.
+"""
+# ----- Imports ----- #
+import sys
+import ipaddress
+import itertools
+from array import array
+from decimal import Decimal
+from business_layer import range_bound, table_columns, table_filters
+
+# How each column is stored:
+#   decimal  : fixed-point numbers, as integers of 10^-scale units in an int64 array
+#   integer  : integers in an int64 array
+#   category : repeated values, each stored once and referenced by a code per row
+#   address  : IP addresses, dictionary encoded and packed; other values (e.g. the link-layer
+#              names of in450a) are kept as text
+#   text     : mostly distinct strings, and values of other types, kept as they are
+COLUMN_TYPES = {
+    'in450a': {
+        'time': ('decimal', 6), 'source': ('address',), 'destination': ('address',),
+        'protocol': ('category',), 'length': ('integer',), 'info': ('text',),
+    },
+    'in450b': {
+        'first_name': ('category',), 'last_name': ('category',), 'email': ('text',),
+        'source': ('address',), 'destination': ('address',),
+    },
+    'in450c': {
+        'appid': ('text',), 'appname': ('category',), 'appversion': ('category',),
+        'source': ('address',), 'destination': ('address',), 'digsig': ('text',),
+    },
+}
+
+# How the columns of other tables discovered in the database are stored, by their data
+# type, see business_layer.discover_tables. Numeric columns without a declared scale, and
+# columns of other types, are kept as they are.
+DATA_TYPE_KINDS = {
+    'inet': 'address',
+    'smallint': 'integer',
+    'integer': 'integer',
+    'bigint': 'integer',
+    'numeric': 'decimal',
+}
+
+# Every this many rows one is measured to estimate the size of the same result as tuples
+TUPLE_SAMPLE_STRIDE = 64
+
+# Code array types from the narrowest up, with the number of distinct values each can reference
+CODE_TYPES = (('B', 1 << 8), ('H', 1 << 16), ('I', 1 << 32))
+
+def _object_bytes(values):
+    """
+    Returns the size of a list and of the objects it holds.
+    """
+    return sys.getsizeof(values) + sum(sys.getsizeof(value) for value in values)
+
+# ----- Columns ----- #
+class NumberColumn:
+    """
+    Integers, or fixed-point decimals scaled to integers, in an int64 array.
+
+    Attributes:
+        scale : (int)
+            The decimal places of a fixed-point column, or None for integers.
+        values : (array)
+            The value of every row; 0 where the row is NULL.
+        nulls : (set)
+            The positions of the NULL rows.
+    """
+    def __init__(self, scale=None):
+        """
+        Initializes an empty NumberColumn.
+
+        Parameters:
+            scale : (int)
+                The decimal places of a fixed-point column, or None for integers.
+        """
+        self.scale = scale
+        self.values = array('q')
+        self.nulls = set()
+
+    def encode(self, value):
+        """
+        Returns the integer `value` is stored as.
+        """
+        if self.scale is None:
+            return int(value)
+        return int(Decimal(value).scaleb(self.scale).to_integral_value())
+
+    def append(self, value):
+        """
+        Adds the value of the next row.
+        """
+        if value is None:
+            self.nulls.add(len(self.values))
+            self.values.append(0)
+        else:
+            self.values.append(self.encode(value))
+
+    def finish(self):
+        """
+        Called once all rows were added.
+        """
+
+    def value(self, position):
+        """
+        Returns the value of the row at `position`.
+        """
+        if position in self.nulls:
+            return None
+        stored = self.values[position]
+        return stored if self.scale is None else Decimal(stored).scaleb(-self.scale)
+
+    def ranks(self):
+        """
+        Returns an integer per row that sorts like the values, with NULLs after the rest.
+        """
+        if not self.nulls:
+            return self.values
+        ranks = list(self.values)
+        last = max(ranks) + 1
+        for position in self.nulls:
+            ranks[position] = last
+        return ranks
+
+    def mask(self, kind, value):
+        """
+        Returns a true or false value per row telling whether it matches a filter.
+        """
+        if kind == 'equals':
+            wanted = self.encode(value)
+            mask = [stored == wanted for stored in self.values]
+        elif kind == 'range':
+            low, high = value
+            low = self.encode(low) if low is not None else min(self.values, default=0)
+            high = self.encode(high) if high is not None else max(self.values, default=0)
+            mask = [low <= stored <= high for stored in self.values]
+        else:
+            raise ValueError(f"A number column cannot be filtered by {kind}")
+        for position in self.nulls:
+            mask[position] = False
+        return mask
+
+    def nbytes(self):
+        """
+        Returns the memory used by the column.
+        """
+        return self.values.itemsize * len(self.values) + (sys.getsizeof(self.nulls) if self.nulls else 0)
+
+class CategoryColumn:
+    """
+    Repeated values, each stored once in a dictionary and referenced from every row by
+    the smallest integer code that fits the number of distinct values.
+
+    Attributes:
+        codes : (array)
+            The dictionary code of every row.
+        entries : (list)
+            The distinct values, in order of first appearance.
+    """
+    def __init__(self):
+        """
+        Initializes an empty CategoryColumn.
+        """
+        self.codes = array(CODE_TYPES[0][0])
+        self.entries = []
+        self._lookup = {}
+
+    def append(self, value):
+        """
+        Adds the value of the next row.
+        """
+        code = self._lookup.get(value)
+        if code is None:
+            code = self._lookup[value] = len(self._lookup)
+            self.add_entry(value)
+            self._widen(code)
+        self.codes.append(code)
+
+    def _widen(self, code):
+        """
+        Switches the codes to a wider array type when `code` does not fit the current one.
+        """
+        for typecode, limit in CODE_TYPES:
+            if code < limit:
+                if typecode != self.codes.typecode and self.codes.itemsize < array(typecode).itemsize:
+                    self.codes = array(typecode, self.codes)
+                return
+
+    def add_entry(self, value):
+        """
+        Stores a new distinct value in the dictionary.
+        """
+        self.entries.append(value)
+
+    def entry_count(self):
+        """
+        Returns the number of distinct values.
+        """
+        return len(self.entries)
+
+    def entry(self, code):
+        """
+        Returns the distinct value referenced by `code`.
+        """
+        return self.entries[code]
+
+    def entry_key(self, code):
+        """
+        Returns what the distinct value referenced by `code` sorts by, or None for NULL.
+        """
+        return self.entries[code]
+
+    def finish(self):
+        """
+        Drops the lookup table that is only needed while rows are added.
+        """
+        self._lookup = {}
+
+    def value(self, position):
+        """
+        Returns the value of the row at `position`.
+        """
+        return self.entry(self.codes[position])
+
+    def ranks(self):
+        """
+        Returns an integer per row that sorts like the values, with NULLs after the rest.
+        The distinct values are sorted once and every row takes the rank of its own.
+        """
+        count = self.entry_count()
+        keys = [self.entry_key(code) for code in range(count)]
+        ordered = sorted((code for code in range(count) if keys[code] is not None), key=keys.__getitem__)
+        rank = [count] * count
+        for position, code in enumerate(ordered):
+            rank[code] = position
+        return list(map(rank.__getitem__, self.codes))
+
+    def entry_matches(self, kind, value):
+        """
+        Returns a true or false value per distinct value telling whether it matches a filter.
+        """
+        if kind == 'equals':
+            return [entry == value for entry in self.entries]
+        if kind == 'prefix':
+            prefix = value.lower()
+            return [entry is not None and entry.lower().startswith(prefix) for entry in self.entries]
+        if kind == 'contains':
+            part = value.lower()
+            return [entry is not None and part in entry.lower() for entry in self.entries]
+        raise ValueError(f"A category column cannot be filtered by {kind}")
+
+    def mask(self, kind, value):
+        """
+        Returns a true or false value per row telling whether it matches a filter, testing
+        each distinct value once.
+        """
+        return list(map(self.entry_matches(kind, value).__getitem__, self.codes))
+
+    def nbytes(self):
+        """
+        Returns the memory used by the column.
+        """
+        return self.codes.itemsize * len(self.codes) + _object_bytes(self.entries)
+
+class AddressColumn(CategoryColumn):
+    """
+    A CategoryColumn whose distinct IP addresses are packed into 4 bytes each, or 16
+    bytes each once an IPv6 address appears. Values that are not addresses are kept as
+    text and sort after them, like the NULL address they stand in for on the server.
+
+    Attributes:
+        width : (int)
+            The bytes per packed address.
+        packed : (bytearray)
+            The packed address of every distinct value; zeros for the other values.
+        versions : (bytearray)
+            The IP version of every distinct value, 0 for the other values.
+        labels : (dict)
+            Code -> value of the distinct values that are not addresses.
+    """
+    def __init__(self):
+        """
+        Initializes an empty AddressColumn.
+        """
+        super().__init__()
+        self.entries = None
+        self.width = 4
+        self.packed = bytearray()
+        self.versions = bytearray()
+        self.labels = {}
+
+    def add_entry(self, value):
+        """
+        Packs a new distinct value, widening the existing entries for an IPv6 address.
+        """
+        try:
+            address = ipaddress.ip_address(value)
+        except ValueError:
+            address = None
+        code = len(self.versions)
+        if address is None:
+            self.labels[code] = value
+            self.versions.append(0)
+            self.packed += bytes(self.width)
+            return
+        if address.version == 6 and self.width == 4:
+            self.packed = bytearray(b''.join(
+                bytes(12) + self.packed[start:start + 4] for start in range(0, len(self.packed), 4)
+            ))
+            self.width = 16
+        self.versions.append(address.version)
+        self.packed += address.packed.rjust(self.width, b'\0')
+
+    def entry_count(self):
+        """
+        Returns the number of distinct values.
+        """
+        return len(self.versions)
+
+    def _address(self, code):
+        """
+        Returns the IP address referenced by `code`, or None for a value that is not one.
+        """
+        version = self.versions[code]
+        if not version:
+            return None
+        start = code * self.width
+        packed = bytes(self.packed[start:start + self.width])
+        return ipaddress.IPv4Address(packed[-4:]) if version == 4 else ipaddress.IPv6Address(packed)
+
+    def entry(self, code):
+        """
+        Returns the value referenced by `code` as it was fetched.
+        """
+        if code in self.labels:
+            return self.labels[code]
+        return str(self._address(code))
+
+    def entry_key(self, code):
+        """
+        Returns what the value referenced by `code` sorts by: IPv4 before IPv6 addresses,
+        like PostgreSQL orders INET, and None for values that are not addresses.
+        """
+        address = self._address(code)
+        return None if address is None else (address.version, int(address))
+
+    def entry_matches(self, kind, value):
+        """
+        Returns a true or false value per distinct value telling whether it matches a filter.
+        """
+        if kind != 'ip':
+            raise ValueError(f"An address column cannot be filtered by {kind}")
+        network = ipaddress.ip_network(value, strict=False)
+        addresses = (self._address(code) for code in range(self.entry_count()))
+        return [address is not None and address.version == network.version and address in network
+                for address in addresses]
+
+    def nbytes(self):
+        """
+        Returns the memory used by the column.
+        """
+        return (self.codes.itemsize * len(self.codes) + len(self.packed) + len(self.versions)
+                + (_object_bytes(list(self.labels.values())) + sys.getsizeof(self.labels) if self.labels else 0))
+
+class TextColumn:
+    """
+    Mostly distinct strings, which dictionary encoding would not shrink, or values of
+    types no other column stores.
+
+    Attributes:
+        values : (list)
+            The value of every row.
+    """
+    def __init__(self):
+        """
+        Initializes an empty TextColumn.
+        """
+        self.values = []
+
+    def append(self, value):
+        """
+        Adds the value of the next row.
+        """
+        self.values.append(value)
+
+    def finish(self):
+        """
+        Called once all rows were added.
+        """
+
+    def value(self, position):
+        """
+        Returns the value of the row at `position`.
+        """
+        return self.values[position]
+
+    def ranks(self):
+        """
+        Returns a key per row that sorts like the values, with NULLs after the rest.
+        """
+        return [(value is None, value or '') for value in self.values]
+
+    def mask(self, kind, value):
+        """
+        Returns a true or false value per row telling whether it matches a filter.
+        """
+        if kind == 'equals':
+            return [stored == value for stored in self.values]
+        if kind == 'prefix':
+            prefix = value.lower()
+            return [stored is not None and stored.lower().startswith(prefix) for stored in self.values]
+        if kind == 'contains':
+            part = value.lower()
+            return [stored is not None and part in stored.lower() for stored in self.values]
+        if kind == 'range':
+            low, high = value
+            return [stored is not None and (low is None or stored >= low) and (high is None or stored <= high)
+                    for stored in self.values]
+        raise ValueError(f"A text column cannot be filtered by {kind}")
+
+    def nbytes(self):
+        """
+        Returns the memory used by the column.
+        """
+        return _object_bytes(self.values)
+
+def column_type(table, name, registry=None):
+    """
+    Returns how a column of `table` is stored: as declared in `COLUMN_TYPES`, or else by
+    its data type in `registry`, see `DATA_TYPE_KINDS`.
+    """
+    declared = COLUMN_TYPES.get(table, {})
+    if name in declared:
+        return declared[name]
+    types = (registry or {}).get(table, {}).get('types', {})
+    if name not in types:
+        return ('text',)
+    data_type, scale = types[name]
+    kind = DATA_TYPE_KINDS.get(data_type, 'text')
+    if kind == 'decimal':
+        return (kind, scale) if scale is not None else ('text',)
+    return (kind,)
+
+def make_column(kind, *options):
+    """
+    Returns an empty column storing values of `kind`, see `COLUMN_TYPES`.
+    """
+    if kind == 'decimal':
+        return NumberColumn(*options)
+    if kind == 'integer':
+        return NumberColumn()
+    if kind == 'category':
+        return CategoryColumn()
+    if kind == 'address':
+        return AddressColumn()
+    return TextColumn()
+
+# ----- Results ----- #
+class ColumnarResult:
+    """
+    The rows of a query on one of the application's tables, stored column by column.
+
+    Filtering and sorting return new results sharing the same columns, so they only cost
+    an array of row positions. Indexing and slicing return rows as tuples, in the order of
+    `table_columns(table)`, just like the rows fetched by the BusinessLayer.
+
+    Attributes:
+        table : (str)
+            The table the rows come from.
+        registry : (dict)
+            The registry of the reading role, for tables that are not declared.
+        columns : (dict)
+            Column name -> column object holding the values of all rows.
+        positions : (array)
+            The rows of this result, as positions in the columns, or None for all of them.
+        tuple_bytes : (int)
+            The estimated size of all rows when held as a list of tuples.
+    """
+    def __init__(self, table, columns=None, positions=None, tuple_bytes=0, registry=None):
+        """
+        Initializes a ColumnarResult, empty unless `columns` are given.
+
+        Parameters:
+            table : (str)
+                The table the rows come from, one of `TABLES` or of `registry`.
+            columns : (dict)
+                Existing columns to share, e.g. with the result being filtered.
+            positions : (array)
+                The rows of `columns` in this result, or None for all of them.
+            tuple_bytes : (int)
+                The estimated size of all rows when held as tuples.
+            registry : (dict)
+                The registry of the reading role, see business_layer.discover_tables.
+        """
+        self.table = table
+        self.registry = registry
+        self.names = table_columns(table, registry)
+        if columns is None:
+            columns = {name: make_column(*column_type(table, name, registry)) for name in self.names}
+        self.columns = columns
+        self.positions = positions
+        self.tuple_bytes = tuple_bytes
+        self._sampled = (0, 0)
+
+    @classmethod
+    def from_batches(cls, table, batches, registry=None):
+        """
+        Builds a result from batches of rows, such as those of `BusinessLayer.stream_rows`,
+        without ever holding more than one batch of tuples.
+
+        Parameters:
+            table : (str)
+                The table the rows come from.
+            batches : (iterable)
+                Lists of row tuples, in the order of `table_columns(table)`.
+            registry : (dict)
+                The registry of the reading role, for tables that are not declared.
+        """
+        result = cls(table, registry=registry)
+        for batch in batches:
+            result.extend(batch)
+        result.finish()
+        return result
+
+    def extend(self, rows):
+        """
+        Appends rows to a result being built.
+        """
+        columns = [self.columns[name] for name in self.names]
+        sampled, size = self._sampled
+        count = len(self)
+        for row in rows:
+            for column, value in zip(columns, row):
+                column.append(value)
+            if count % TUPLE_SAMPLE_STRIDE == 0:
+                sampled += 1
+                size += sys.getsizeof(row) + sum(sys.getsizeof(value) for value in row)
+            count += 1
+        self._sampled = (sampled, size)
+
+    def finish(self):
+        """
+        Completes a result being built, freeing what was only needed to build it.
+        """
+        for column in self.columns.values():
+            column.finish()
+        sampled, size = self._sampled
+        count = len(self)
+        # Plus the list holding the tuples, one pointer per row
+        self.tuple_bytes = (size * count // sampled if sampled else 0) + sys.getsizeof([]) + 8 * count
+
+    def _all(self):
+        """
+        Returns the positions of the rows in this result.
+        """
+        return self.positions if self.positions is not None else range(self._size())
+
+    def _size(self):
+        """
+        Returns the number of rows stored in the columns.
+        """
+        column = self.columns[self.names[0]]
+        return len(column.codes) if hasattr(column, 'codes') else len(column.values)
+
+    def __len__(self):
+        """
+        Returns the number of rows in this result.
+        """
+        return len(self.positions) if self.positions is not None else self._size()
+
+    def _row(self, position):
+        """
+        Returns the row stored at `position` as a tuple.
+        """
+        return tuple(self.columns[name].value(position) for name in self.names)
+
+    def __getitem__(self, index):
+        """
+        Returns the row at `index` as a tuple, or the rows of a slice as a list of tuples.
+        Only the rows asked for are decoded, so showing a page of a large result is cheap.
+        """
+        if isinstance(index, slice):
+            return [self._row(position) for position in self._all()[index]]
+        return self._row(self._all()[index])
+
+    def __iter__(self):
+        """
+        Iterates over the rows as tuples.
+        """
+        return (self._row(position) for position in self._all())
+
+    def _derive(self, positions):
+        """
+        Returns a result of the given rows that shares this result's columns.
+        """
+        return ColumnarResult(self.table, self.columns, array('I', positions), self.tuple_bytes, self.registry)
+
+    def filter(self, filters):
+        """
+        Returns the rows matching search filters, evaluated on the client.
+
+        Parameters:
+            filters : (dict)
+                Filter name -> value, as for `BusinessLayer.stream_rows`, see `table_filters`.
+
+        Raises:
+            ValueError: If a filter is unknown or its value is invalid.
+        """
+        known = table_filters(self.table, self.registry)
+        positions = self._all()
+        for name, value in (filters or {}).items():
+            if name not in known:
+                raise ValueError(f"{self.table} cannot be filtered by {name}")
+            column, kind, convert = known[name]
+            if kind == 'range':
+                value = tuple(range_bound(name, convert, end) for end in value)
+            elif kind != 'prefix':
+                value = convert(value)
+            if kind == 'endpoint':
+                masks = [self.columns[endpoint.lower()].mask('ip', address.strip())
+                         for address in value.split(',') if address.strip() for endpoint in column]
+                if not masks:
+                    raise ValueError(f"The {name} filter needs an address")
+                mask = [any(flags) for flags in zip(*masks)]
+            else:
+                mask = self.columns[column.lower()].mask(kind, value)
+            positions = list(itertools.compress(positions, map(mask.__getitem__, positions)))
+        return self._derive(positions)
+
+    def sort(self, column, descending=False):
+        """
+        Returns the rows ordered by `column`: NULLs last when ascending and first when
+        descending, and ties in load order (reversed when descending). Text is compared by
+        code point, so it can come out in another order than the server's, which sorts by
+        the column's collation.
+
+        Parameters:
+            column : (str)
+                The column to sort by, one of `table_columns(table)`.
+            descending : (bool)
+                Sort from the largest value down.
+
+        Raises:
+            ValueError: If the column is unknown.
+        """
+        if column not in self.columns:
+            raise ValueError(f"{self.table} cannot be sorted by {column}")
+        ranks = self.columns[column].ranks()
+        positions = sorted(self._all(), key=ranks.__getitem__)
+        if descending:
+            positions.reverse()
+        return self._derive(positions)
+
+    def memory_report(self):
+        """
+        Compares the memory used by the columns with the same rows held as tuples.
+
+        Returns:
+            (dict):
+                The rows, the bytes of each column, the total columnar and estimated tuple
+                bytes, and how many times smaller the columnar form is. A filtered or
+                sorted result counts the shared columns plus its array of positions.
+        """
+        columns = {name: column.nbytes() for name, column in self.columns.items()}
+        columnar = sum(columns.values())
+        if self.positions is not None:
+            columnar += self.positions.itemsize * len(self.positions)
+        tuples = self.tuple_bytes * len(self) // self._size() if self._size() else 0
+        return {
+            'rows': len(self),
+            'columns': columns,
+            'columnar_bytes': columnar,
+            'tuple_bytes': tuples,
+            'ratio': tuples / columnar if columnar else None,
+        }
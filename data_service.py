@@ -0,0 +1,447 @@
+#!/usr/bin/env python
+# data_service.py
+"""
+Author          :   Alexander Shelton
+Date            :   October 2024
+Name            :   Database Application
+Description     :   A headless HTTP service streaming the IN450 tables as NDJSON to any
+                    number of analysts, with the same per-role permissions as the application.
+
+Every request authenticates with HTTP Basic auth as a PostgreSQL role, and its queries run
+as that role, so the GRANTs in sql/data_and_roles.sql decide what each analyst can read.
+
+Endpoints:
+    GET /health                             -> {"status": "ok"}
+    GET /tables                             -> the tables the role may read
+    GET /tables/{table}/count?FILTERS       -> {"count": N}
+    GET /tables/{table}/rows?FILTERS        -> one JSON object per line
+        FILTERS are the search bar filters, e.g. ?protocol=TCP&time=0..30&source=10.0.0.0/8,
+        plus sort=COLUMN and desc=1.
+"""
+# ----- Imports ----- #
+import os
+import sys
+import hmac
+import json
+import uuid
+import base64
+import asyncio
+import hashlib
+import contextlib
+import logging
+import argparse
+from decimal import Decimal
+from psycopg2 import sql
+from psycopg2.errors import UndefinedTable
+from business_layer import (BusinessLayer, TABLES, DEFAULT_ITERSIZE, connection_args, make_filters, discover_tables,
+                            registry_query, table_columns)
+
+try:
+    import aiopg
+    from aiohttp import web
+except ImportError:                                         # Only the service needs them
+    aiopg = web = None
+
+# Connections each role may hold open at once
+SERVICE_POOL_SIZE = int(os.getenv('SERVICE_POOL_SIZE', '4'))
+
+# Seconds a single statement, e.g. the FETCH of one batch, may run
+SERVICE_QUERY_TIMEOUT = float(os.getenv('SERVICE_QUERY_TIMEOUT', '300'))
+
+# Seconds a role's pool is kept without requests before its connections are closed
+SERVICE_IDLE_TIMEOUT = float(os.getenv('SERVICE_IDLE_TIMEOUT', '600'))
+
+# Query string parameters that are not filters
+RESERVED_PARAMS = ('sort', 'desc')
+
+# What a client is told when a query fails; the details go to the log
+FETCH_ERROR = "An error occurred while fetching data. Please check the logs."
+
+# Application key of the task closing the pools of idle roles
+REAPER = web.AppKey('reaper', asyncio.Task) if web is not None else None
+
+def _json_default(value):
+    """
+    Serializes the values json cannot, i.e. the DECIMAL Time column, without losing digits.
+    """
+    if isinstance(value, Decimal):
+        return str(value)
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+class LoginFailed(PermissionError):
+    """
+    Raised when a request has no credentials or wrong ones.
+    """
+
+# ----- Role pools ----- #
+class RolePools:
+    """
+    One asyncio connection pool per PostgreSQL role. A pool is opened by the first
+    request of a role, which also proves its password; later requests must present the
+    same password. Pools that no request used for SERVICE_IDLE_TIMEOUT are closed. The
+    lock of a role is dropped once no request waits for it and the role has no pool, so
+    failed logins leave nothing behind.
+
+    Attributes:
+        pools : (dict)
+            Role -> (aiopg.Pool, password digest, registry of the tables the role can see).
+        last_used : (dict)
+            Role -> event loop time its last request started or finished.
+        in_use : (dict)
+            Role -> number of requests using its pool right now.
+    """
+    def __init__(self, pool_size=SERVICE_POOL_SIZE):
+        """
+        Initializes RolePools without any pool.
+
+        Parameters:
+            pool_size : (int)
+                The maximum number of connections per role.
+        """
+        self.pool_size = pool_size
+        self.pools = {}
+        self.last_used = {}
+        self.in_use = {}
+        self._locks = {}
+        self._waiting = {}
+        self._key = os.urandom(32)
+
+    def _digest(self, password):
+        """
+        Returns a keyed digest of a password, so the service never keeps passwords in memory.
+        """
+        return hmac.new(self._key, password.encode(), hashlib.sha256).digest()
+
+    @contextlib.asynccontextmanager
+    async def _role_lock(self, user):
+        """
+        Holds the lock of a role for the block, creating it if needed and dropping it
+        afterwards when no other request waits for it and the role has no pool.
+        """
+        lock = self._locks.setdefault(user, asyncio.Lock())
+        self._waiting[user] = self._waiting.get(user, 0) + 1
+        try:
+            async with lock:
+                yield
+        finally:
+            self._waiting[user] -= 1
+            if not self._waiting[user]:
+                del self._waiting[user]
+                if user not in self.pools:
+                    del self._locks[user]
+
+    async def get(self, user, password):
+        """
+        Returns the pool of a role and its registry, see business_layer.discover_tables,
+        opening the pool if needed. The pool counts as in use, and is not closed as idle,
+        until it is handed back with `release`.
+
+        Raises:
+            LoginFailed: If the password is wrong.
+        """
+        async with self._role_lock(user):
+            digest = self._digest(password)
+            if user not in self.pools:
+                pool = None
+                try:
+                    pool = await aiopg.create_pool(
+                        minsize=0, maxsize=self.pool_size, timeout=SERVICE_QUERY_TIMEOUT,
+                        enable_hstore=False, **connection_args(user, password)
+                    )
+                    # The pool opens no connection by itself, so the password is proven here
+                    registry = await self._registry(pool)
+                except Exception as e:
+                    logging.error(f"Service login failed for {user}: {e}")
+                    if pool is not None:
+                        pool.close()
+                        await pool.wait_closed()
+                    raise LoginFailed("Login failed")
+                self.pools[user] = (pool, digest, registry)
+            pool, expected, registry = self.pools[user]
+            if not hmac.compare_digest(digest, expected):
+                raise LoginFailed("Login failed")
+            self.in_use[user] = self.in_use.get(user, 0) + 1
+            self.last_used[user] = asyncio.get_running_loop().time()
+            return pool, registry
+
+    def release(self, user):
+        """
+        Hands back a pool returned by `get`. Its idle time starts once no request uses it.
+        """
+        self.in_use[user] -= 1
+        if not self.in_use[user]:
+            del self.in_use[user]
+        if user in self.pools:
+            self.last_used[user] = asyncio.get_running_loop().time()
+
+    @contextlib.asynccontextmanager
+    async def use(self, user, password):
+        """
+        Holds the pool of a role and its registry for the block, see `get`.
+        """
+        pool, registry = await self.get(user, password)
+        try:
+            yield pool, registry
+        finally:
+            self.release(user)
+
+    @staticmethod
+    async def _registry(pool):
+        """
+        Discovers the registered tables as the pool's role sees them, see
+        business_layer.discover_tables.
+        """
+        async with pool.acquire() as conn:
+            async with conn.cursor() as cursor:
+                try:
+                    await cursor.execute(*registry_query())
+                except UndefinedTable:
+                    await cursor.execute(*registry_query(declared=True))
+                return discover_tables(await cursor.fetchall())
+
+    async def close_idle(self):
+        """
+        Closes the pools of roles that no request used for SERVICE_IDLE_TIMEOUT seconds.
+        A pool still used by a request, e.g. a long stream, is kept.
+        """
+        loop = asyncio.get_running_loop()
+        for user in list(self.last_used):
+            async with self._role_lock(user):
+                # A request may have taken the pool while the lock was awaited
+                if (user not in self.pools or self.in_use.get(user)
+                        or loop.time() - self.last_used[user] < SERVICE_IDLE_TIMEOUT):
+                    continue
+                pool, _, _ = self.pools.pop(user)
+                del self.last_used[user]
+            pool.close()                                    # No connection is checked out, so this is quick
+            await pool.wait_closed()
+
+    async def close(self):
+        """
+        Closes every pool.
+        """
+        for pool, _, _ in self.pools.values():
+            pool.close()
+            await pool.wait_closed()
+        self.pools.clear()
+        self.last_used.clear()
+
+# ----- Service ----- #
+class DataService:
+    """
+    The request handlers of the HTTP service.
+
+    Attributes:
+        pools : (RolePools)
+            The connection pools of the roles that logged in.
+        itersize : (int)
+            The number of rows fetched from the server per batch of a stream.
+    """
+    def __init__(self, pool_size=SERVICE_POOL_SIZE, itersize=DEFAULT_ITERSIZE):
+        """
+        Initializes the DataService.
+
+        Parameters:
+            pool_size : (int)
+                The maximum number of connections per role.
+            itersize : (int)
+                The number of rows fetched from the server per batch of a stream.
+        """
+        self.pools = RolePools(pool_size)
+        self.itersize = itersize
+
+    def app(self):
+        """
+        Returns the aiohttp application serving the endpoints.
+        """
+        if web is None:
+            raise RuntimeError("The data service needs aiohttp and aiopg: pip install database_application[service]")
+
+        @web.middleware
+        async def errors(request, handler):
+            return await self.errors(request, handler)
+
+        app = web.Application(middlewares=[errors])
+        app.router.add_get('/health', self.health)
+        app.router.add_get('/tables', self.tables)
+        app.router.add_get('/tables/{table}/count', self.count)
+        app.router.add_get('/tables/{table}/rows', self.rows)
+        app.on_startup.append(self._start_reaper)
+        app.on_cleanup.append(self._stop)
+        return app
+
+    async def errors(self, request, handler):
+        """
+        Turns the errors of a handler into JSON responses with a matching status code.
+        """
+        try:
+            return await handler(request)
+        except LoginFailed as e:
+            return web.json_response({'error': str(e)}, status=401, headers={'WWW-Authenticate': 'Basic realm="in450"'})
+        except PermissionError as e:
+            return web.json_response({'error': str(e)}, status=403)
+        except ValueError as e:
+            return web.json_response({'error': str(e)}, status=400)
+        except (web.HTTPException, ConnectionResetError):   # Not found, or the client went away
+            raise
+        except Exception as e:
+            logging.error(f"Data service request {request.path_qs} failed: {e}")
+            return web.json_response({'error': FETCH_ERROR}, status=500)
+
+    @contextlib.asynccontextmanager
+    async def _authorize(self, request, table=None):
+        """
+        Authenticates a request, checks that its role may read `table` and holds the
+        role's pool for the block, see `RolePools.use`.
+
+        Yields:
+            (tuple):
+                The pool and the registry of the request's role.
+
+        Raises:
+            LoginFailed: If the credentials are missing or wrong.
+            web.HTTPNotFound: If the table is neither declared nor registered.
+            PermissionError: If the role may not read the table.
+        """
+        scheme, _, encoded = request.headers.get('Authorization', '').partition(' ')
+        if scheme.lower() != 'basic':
+            raise LoginFailed("Login failed")
+        try:
+            user, _, password = base64.b64decode(encoded).decode().partition(':')
+        except (ValueError, UnicodeDecodeError):
+            raise LoginFailed("Login failed")
+        async with self.pools.use(user, password) as (pool, registry):
+            if table is not None and table not in TABLES and table not in registry:
+                raise web.HTTPNotFound(text=json.dumps({'error': f"Unknown table: {table}"}), content_type='application/json')
+            if table is not None and not (table in registry and registry[table]['readable']):
+                raise PermissionError(f"{user} may not read {table}")
+            yield pool, registry
+
+    @staticmethod
+    def _request_filters(request, registry):
+        """
+        Reads the table, filters and sort order of a table request from its URL.
+
+        Returns:
+            (tuple):
+                The table, the search filters, the sort column (or None) and whether to
+                sort descending.
+        """
+        table = request.match_info['table']
+        pairs = [(name, value) for name, value in request.query.items() if name not in RESERVED_PARAMS]
+        filters = make_filters(table, pairs, registry)
+        descending = request.query.get('desc', '0').lower() in ('1', 'true', 'yes')
+        return table, filters, request.query.get('sort'), descending
+
+    async def health(self, request):
+        """
+        GET /health: answers without touching the database.
+        """
+        return web.json_response({'status': 'ok'})
+
+    async def tables(self, request):
+        """
+        GET /tables: lists the tables the role may read, with their columns.
+        """
+        async with self._authorize(request) as (_, registry):
+            tables = {
+                table: list(info['columns']) for table, info in registry.items() if info['readable'] and info['columns']
+            }
+        return web.json_response(tables)
+
+    async def count(self, request):
+        """
+        GET /tables/{table}/count: counts the rows matching the filters.
+        """
+        # Authorized first, since the first login of a role discovers the tables it may read
+        async with self._authorize(request, request.match_info['table']) as (pool, registry):
+            table, filters, _, _ = self._request_filters(request, registry)
+            query, params = BusinessLayer.build_count(table, filters, registry)
+            async with pool.acquire() as conn:
+                async with conn.cursor() as cursor:
+                    await cursor.execute(query, params)
+                    (count,) = await cursor.fetchone()
+        return web.json_response({'count': count})
+
+    async def rows(self, request):
+        """
+        GET /tables/{table}/rows: streams the matching rows as NDJSON. Rows are read with
+        a server-side cursor one batch at a time, and the next batch is only fetched once
+        the previous one has been handed to the client's socket, so a slow client slows
+        the query down instead of filling the service's memory. Once the first line is
+        sent the status can no longer change, so a query failing later ends the stream
+        with an {"error": ...} line instead.
+        """
+        async with self._authorize(request, request.match_info['table']) as (pool, registry):
+            table, filters, sort, descending = self._request_filters(request, registry)
+            query, params = BusinessLayer.build_query(table, filters, sort, descending, registry)
+            columns = table_columns(table, registry)
+            cursor_name = sql.Identifier(f"service_{table}_{uuid.uuid4().hex}")
+
+            response = web.StreamResponse(headers={'Content-Type': 'application/x-ndjson'})
+            response.enable_chunked_encoding()
+            async with pool.acquire() as conn:
+                async with conn.cursor() as cursor:
+                    # aiopg connections are in autocommit mode, and a cursor needs a transaction
+                    await cursor.execute("BEGIN READ ONLY;")
+                    try:
+                        await cursor.execute(
+                            sql.SQL("DECLARE {} NO SCROLL CURSOR FOR {};").format(cursor_name, query), params
+                        )
+                        await response.prepare(request)
+                        fetch = sql.SQL("FETCH FORWARD %s FROM {};").format(cursor_name)
+                        try:
+                            while True:
+                                await cursor.execute(fetch, (self.itersize,))
+                                batch = await cursor.fetchall()
+                                if not batch:
+                                    break
+                                lines = ''.join(
+                                    json.dumps(dict(zip(columns, row)), default=_json_default) + '\n' for row in batch
+                                )
+                                await response.write(lines.encode())    # Waits while the client is behind
+                        except ConnectionResetError:                    # The client went away
+                            raise
+                        except Exception as e:
+                            logging.error(f"Data service request {request.path_qs} failed while streaming: {e}")
+                            await response.write(json.dumps({'error': FETCH_ERROR}).encode() + b'\n')
+                    finally:
+                        if not conn.closed:                             # A cancelled query closes the connection
+                            await cursor.execute("ROLLBACK;")
+            await response.write_eof()
+        return response
+
+    async def _start_reaper(self, app):
+        """
+        Starts closing the pools of idle roles once a minute.
+        """
+        async def reap():
+            while True:
+                await asyncio.sleep(60)
+                await self.pools.close_idle()
+
+        app[REAPER] = asyncio.get_running_loop().create_task(reap())
+
+    async def _stop(self, app):
+        """
+        Stops the reaper and closes every pool when the service shuts down.
+        """
+        app[REAPER].cancel()
+        await self.pools.close()
+
+def main(argv=None):
+    """
+    Entry point of the `data_service` console script.
+    """
+    parser = argparse.ArgumentParser(prog='data_service', description='Serve the IN450 tables over HTTP as NDJSON.')
+    parser.add_argument('--host', default='127.0.0.1', help='address to listen on (default: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=8080, help='port to listen on (default: 8080)')
+    parser.add_argument('--pool-size', type=int, default=SERVICE_POOL_SIZE, help='connections per role')
+    args = parser.parse_args(argv)
+    if web is None:
+        sys.exit("The data service needs aiohttp and aiopg: pip install database_application[service]")
+    web.run_app(DataService(args.pool_size).app(), host=args.host, port=args.port)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
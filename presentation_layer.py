@@ -7,25 +7,135 @@ Name            :   Database Application
 Description     :   An application for users to view data from a database based on their permissions.    
 """
 # ----- Imports ----- # 
+import os
+import time
+import queue
+import threading
+import itertools
 import tkinter as tk
-from tkinter import ttk, messagebox
-from business_layer import BusinessLayer
+from collections import OrderedDict
+from decimal import Decimal, InvalidOperation
+from contextlib import closing
+from tkinter import ttk, messagebox, filedialog
 from styles import AppStyles
+
+# business_layer, and psycopg2 with it, is imported where it is first needed rather than
+# here, so the login window can appear before it has loaded (see LoginScreen.prepare)
+
+# Rows fetched from the database per page when a table is shown in virtual mode
+PAGE_SIZE = 500
+
+# Results with more rows than this are shown in virtual mode instead of one item per row
+VIRTUAL_THRESHOLD = 10000
+
+# Virtual mode results of up to this many rows are held on the client in columnar form, so
+# scrolling and sorting them need no more queries. 0 pages every result from the server.
+COLUMNAR_ROWS = int(os.getenv('APP_COLUMNAR_ROWS', '0'))
+
+# How often, in milliseconds, the Tk thread checks for finished background queries
+POLL_INTERVAL = 50
+
+# Minutes between automatic refreshes of the analytics views, when turned on
+ANALYTICS_REFRESH_MINUTES = 5
+
+# How often, in milliseconds, the diagnostics window redraws the query statistics
+DIAGNOSTICS_INTERVAL = 1000
+
+# Rows kept on screen by the live tail; the oldest are dropped as new ones arrive
+TAIL_ROWS = 10000
+
+# Rows the live tail fetches per query. A full batch is followed by another straight away.
+TAIL_BATCH = 1000
+
+# Milliseconds between the live tail's checks for new rows when no notification arrived.
+# Notifications from the server's triggers wake it sooner; 0 relies on them alone.
+TAIL_POLL_MS = int(os.getenv('APP_TAIL_POLL_MS', '2000'))
+
+# Seconds of capture time before the newest row seen that the live tail still looks at,
+# so the server only scans the newest in450a partitions
+TAIL_TIME_SLACK = 3600
+
+# Column headers of the declared tables, in the order of business_layer.COLUMN_NAMES. Other
+# discovered tables are headed by their column names, see `headings`.
+COLUMNS = {
+    'in450a': ['Time', 'Source', 'Destination', 'Protocol', 'Length', 'Info'],
+    'in450b': ['First Name', 'Last Name', 'Email', 'Source IP', 'Destination IP'],
+    'in450c': ['App ID', 'App Name', 'App Version', 'Source IP', 'Destination IP', 'DigSig'],
+}
+
+# Headers of the columns a traffic report adds, in the order of business_layer.TRAFFIC_REPORT_COLUMNS
+TRAFFIC_REPORT_HEADINGS = ['Source Packets', 'Source Bytes', 'Destination Packets', 'Destination Bytes',
+                           'First Seen', 'Last Seen']
+
+def headings(table, registry=None):
+    """
+    Returns the column headers of a table: those in `COLUMNS`, or for a table discovered
+    in `registry` its column names in title case, e.g. 'First Name' for first_name.
+    """
+    if table in COLUMNS:
+        return COLUMNS[table]
+    from business_layer import table_columns
+
+    return [name.replace('_', ' ').title() for name in table_columns(table, registry)]
+
+def parse_filters(table, text, registry=None):
+    """
+    Parses the text of the search bar into BusinessLayer search filters. The text is a
+    list of name=value pairs, e.g. `protocol=TCP source=192.168.1.0/24 length=100..1500`.
+    Range filters take `low..high` with either end optional, or a single exact value.
+    Values containing spaces can be quoted.
+
+    Parameters:
+        table : (str)
+            The table being searched.
+        text : (str)
+            The search bar text.
+        registry : (dict)
+            The registry of the searching role, for tables that are not declared.
+
+    Returns:
+        (dict):
+            Filter name -> value, as accepted by the BusinessLayer.
+
+    Raises:
+        ValueError: If the text is malformed or names an unknown filter.
+    """
+    import shlex
+    from business_layer import make_filters
+
+    pairs = []
+    for token in shlex.split(text):
+        name, equals, value = token.partition('=')
+        if not equals or not value:
+            raise ValueError(f"Expected name=value, got {token!r}")
+        pairs.append((name, value))
+    return make_filters(table, pairs, registry)
 # ----- Login Screen ----- #
 class LoginScreen:
     """
     Represents the login screen for the application. Manages user login and transitions
     to the main application upon successful login.
 
+    The window is shown before business_layer is imported. While the user types, a
+    background thread imports it and does the part of connecting that needs no
+    credentials (see `prepare`). The login runs in the background too, and the main
+    application is then built in the same root window instead of a new one.
+
     Attributes:
         root : (tk.Tk)
-            The root Tkinter window for the login screen.
+            The root Tkinter window, kept for the main application.
         username_entry : (ttk.Entry)
             Entry widget for entering the username.
         password_entry : (ttk.Entry)
             Entry widget for entering the password.
+        status : (tk.StringVar)
+            Tells whether the server can be reached and how the login is going.
         business_layer : (BusinessLayer)
-            An instance of the BusinessLayer class for database interaction.
+            An instance of the BusinessLayer class for database interaction, once logged in.
+        app : (Application)
+            The main application, once logged in.
+        results : (queue.Queue)
+            Messages from the background threads waiting to be handled on the Tk thread.
     """
     def __init__(self, root):
         """
@@ -36,6 +146,9 @@ class LoginScreen:
                 The root Tkinter window.
         """
         self.root = root
+        self.business_layer = None
+        self.app = None
+        self.results = queue.Queue()
 
         # Set the title for login page
         self.root.title('Login')
@@ -63,8 +176,24 @@ class LoginScreen:
         ttk.Label(root, text="Password:", style='TLabel').pack(**padding)
         self.password_entry = ttk.Entry(root, **entry_font, show="*")
         self.password_entry.pack(**padding)
+        self.password_entry.bind('<Return>', lambda event: self.login())
+
+        self.login_button = ttk.Button(root, text="Login", style='AppButton.TButton', command=self.login)
+        self.login_button.pack(side='bottom', anchor='s', **padding)
+        self.status = tk.StringVar(value='Connecting to the server...')
+        ttk.Label(root, textvariable=self.status, style='TLabel').pack(side='bottom', **padding)
+
+        threading.Thread(target=self.prepare, name='preconnect', daemon=True).start()
+        self.root.after(POLL_INTERVAL, self.poll)
+
+    def prepare(self):
+        """
+        Runs on a background thread while the user types: imports business_layer and
+        psycopg2, then resolves the server's address and checks it answers.
+        """
+        import business_layer
 
-        ttk.Button(root, text="Login", style='AppButton.TButton', command=self.login).pack(side='bottom', anchor='s', **padding)
+        self.results.put(('prepared', business_layer.preconnect()))
 
     def login(self):
         """
@@ -74,28 +203,1106 @@ class LoginScreen:
         user = self.username_entry.get()        # Get username entered by user
         password = self.password_entry.get()    # Get Password entered by user
 
-        if not user and password:               # Gives an error message if both aren't filled out
+        if not user or not password:            # Gives an error message if either isn't filled out
             messagebox.showerror('Error', 'All fields are required.')
+            return
 
-        try:
-            self.business_layer = BusinessLayer(user=user, password=password)   # connect to db using BusinessLayer
+        self.login_button.config(state=tk.DISABLED)
+        self.status.set('Logging in...')
+        threading.Thread(target=self.authenticate, args=(user, password), name='login', daemon=True).start()
 
-            messagebox.showinfo('Success', f'You are logged in as {user}.')
-            self.open_main_app()
+    def authenticate(self, user, password):
+        """
+        Runs on a background thread: connects to the database and loads the registry of
+        tables the main window is built from, hands the BusinessLayer to the Tk thread,
+        then prefetches the table sizes while the main window is built.
+        """
+        from business_layer import BusinessLayer
 
+        try:
+            business_layer = BusinessLayer(user=user, password=password)   # connect to db using BusinessLayer
+        except Exception as e:
+            self.results.put(('failed', e))
+            return
+        try:
+            business_layer.load_registry()
         except Exception as e:
-            messagebox.showerror("Login Failed", f"Login failed: {e}")
+            business_layer.close_connection()
+            self.results.put(('failed', e))
+            return
+        self.results.put(('authenticated', business_layer))
+        try:
+            metadata = business_layer.prefetch_metadata()
+        except Exception:
+            metadata = None                                 # Logged by the BusinessLayer; nothing depends on it
+        self.results.put(('prefetched', metadata))
+
+    def poll(self):
+        """
+        Handles the messages of the background threads on the Tk thread.
+        """
+        while True:
+            try:
+                kind, payload = self.results.get_nowait()
+            except queue.Empty:
+                break
+            if kind == 'prepared' and self.business_layer is None:
+                self.status.set('Server is reachable.' if payload is not None else 'Server cannot be reached.')
+            elif kind == 'failed':
+                self.login_button.config(state=tk.NORMAL)
+                self.status.set('')
+                messagebox.showerror("Login Failed", f"Login failed: {payload}")
+            elif kind == 'authenticated':
+                self.business_layer = payload
+                self.business_layer.error_handler = messagebox.showerror
+                self.open_main_app()
+            elif kind == 'prefetched':
+                if hasattr(self.app, 'search_help'):
+                    self.app.update_search_help()
+                return                                      # Nothing else is coming
+        self.root.after(POLL_INTERVAL, self.poll)
 
     def open_main_app(self):
         """
-        Opens the main application window after a successful login and closes the
-        current login window.
+        Replaces the login form with the main application in the same window, which is
+        faster than destroying it and starting a new Tk interpreter.
+        """
+        for widget in self.root.winfo_children():
+            widget.destroy()
+        self.app = Application(self.root, self.business_layer)
+        self.app.status_text.set(f'You are logged in as {self.business_layer.user}.')
+# ----- Query Runner ----- #
+class QueryCancelled(Exception):
+    """
+    Raised inside a background job when the query it belongs to was cancelled or superseded.
+    """
+
+
+class QueryRunner:
+    """
+    Runs database work on a background worker pool so the Tk main loop never blocks.
+    Results, progress and errors are put on a queue that the Tk thread polls with
+    `after()`, so callbacks always run on the Tk thread.
+
+    Jobs are submitted under a key. Submitting a new job under a key that already has
+    one supersedes it: the old job is cancelled and anything it still reports is dropped.
+
+    Attributes:
+        root : (tk.Tk)
+            The root window whose event loop polls the result queue.
+        business_layer : (BusinessLayer)
+            Used to cancel a query that is running on the server.
+        executor : (ThreadPoolExecutor)
+            The worker pool the jobs run on.
+        results : (queue.Queue)
+            Messages from the workers waiting to be handled on the Tk thread.
+        current : (dict)
+            The latest generation submitted under each key.
+        callbacks : (dict)
+            The (on_done, on_progress, on_error) callbacks of each live job.
+        running : (dict)
+            The (generation, thread ident) of the job currently executing under each key.
+    """
+    def __init__(self, root, business_layer, workers):
+        """
+        Initializes the QueryRunner and starts polling the result queue.
+
+        Parameters:
+            root : (tk.Tk)
+                The root window whose event loop polls the result queue.
+            business_layer : (BusinessLayer)
+                Used to cancel a query that is running on the server.
+            workers : (int)
+                The number of worker threads, normally the size of the connection pool.
+        """
+        self.root = root
+        self.business_layer = business_layer
+        from concurrent.futures import ThreadPoolExecutor
+
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='query')
+        self.results = queue.Queue()
+        self.current = {}
+        self.callbacks = {}
+        self.running = {}
+        self.generations = itertools.count(1)
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.root.after(POLL_INTERVAL, self.poll)
+
+    def submit(self, key, work, on_done, on_progress=None, on_error=None):
+        """
+        Runs `work` on a worker thread, superseding any job already submitted under `key`.
+
+        Parameters:
+            key : (str)
+                Identifies the slot the job runs in.
+            work : (callable)
+                Called on the worker as work(progress); progress(payload) hands the
+                payload to `on_progress` and raises QueryCancelled once the job is stale.
+            on_done : (callable)
+                Called on the Tk thread with the return value of `work`.
+            on_progress : (callable)
+                Called on the Tk thread with each progress payload.
+            on_error : (callable)
+                Called on the Tk thread with the exception if `work` raises.
+
+        Returns:
+            (int):
+                The generation number of the new job.
+        """
+        self.cancel(key)
+        generation = next(self.generations)
+        with self.lock:
+            self.current[key] = generation
+        self.callbacks[generation] = (on_done, on_progress, on_error)
+        self.executor.submit(self._run, key, generation, work)
+        return generation
+
+    def _run(self, key, generation, work):
+        """
+        Executes a job on a worker thread and reports its outcome through the queue.
+        """
+        with self.lock:
+            if self.current.get(key) != generation:        # Superseded before it started
+                return
+            self.running[key] = (generation, threading.get_ident())
+        self.local.job = (key, generation)
+
+        def progress(payload):
+            if not self.is_current(key, generation):
+                raise QueryCancelled()
+            self.results.put((key, generation, 'progress', payload))
+
+        try:
+            self.results.put((key, generation, 'done', work(progress)))
+        except Exception as e:
+            self.results.put((key, generation, 'error', e))
+        finally:
+            self.local.job = None
+            with self.lock:
+                if self.running.get(key, (None,))[0] == generation:
+                    del self.running[key]
+
+    def is_current(self, key, generation):
+        """
+        Returns whether `generation` is still the live job under `key`.
+        """
+        with self.lock:
+            return self.current.get(key) == generation
+
+    def cancel(self, key):
+        """
+        Cancels the job under `key`. A job that has not started is skipped, and a job whose
+        query is running on the server has that query cancelled.
+        """
+        with self.lock:
+            generation = self.current.pop(key, None)
+            running, thread = self.running.get(key, (None, None))
+        if generation is not None:
+            self.callbacks.pop(generation, None)
+            if running == generation:
+                self.business_layer.cancel_query(thread)
+
+    def post_error(self, title, message):
+        """
+        Thread-safe replacement for `messagebox.showerror`, used as the BusinessLayer
+        error handler. Errors raised by a job that was cancelled are dropped.
+        """
+        key, generation = getattr(self.local, 'job', None) or (None, None)
+        self.results.put((key, generation, 'message', (title, message)))
+
+    def poll(self):
+        """
+        Handles every message the workers have queued, then schedules the next poll.
+        """
+        try:
+            while True:
+                key, generation, kind, payload = self.results.get_nowait()
+                if kind == 'message':
+                    if key is None or self.is_current(key, generation):
+                        messagebox.showerror(*payload)
+                    continue
+                if not self.is_current(key, generation):
+                    continue
+                on_done, on_progress, on_error = self.callbacks[generation]
+                if kind == 'progress':
+                    if on_progress:
+                        on_progress(payload)
+                    continue
+                with self.lock:
+                    del self.current[key]
+                del self.callbacks[generation]
+                if kind == 'done':
+                    on_done(payload)
+                elif on_error:
+                    on_error(payload)
+                else:
+                    messagebox.showerror("Error", f"Failed to get data: {payload}")
+        except queue.Empty:
+            pass
+        self.root.after(POLL_INTERVAL, self.poll)
+
+    def shutdown(self):
+        """
+        Cancels every job and stops the worker pool without waiting for it.
+        """
+        for key in list(self.current):
+            self.cancel(key)
+        self.executor.shutdown(wait=False, cancel_futures=True)
+# ----- Virtual Table ----- #
+class VirtualTable:
+    """
+    Shows a large result in a Treeview without creating an item per row. Only the rows
+    currently on screen exist as Treeview items; they are refilled from a small cache of
+    pages as the scrollbar moves, and missing pages are fetched on demand.
+
+    Attributes:
+        tree : (ttk.Treeview)
+            The Treeview the rows are drawn in.
+        scrollbar : (ttk.Scrollbar)
+            The scrollbar attached to the Treeview.
+        status : (tk.StringVar)
+            Receives the "Rows x-y of n" text describing the scroll position.
+        runner : (QueryRunner)
+            Fetches missing pages in the background.
+        fetch_page : (callable)
+            Called as fetch_page(offset, limit) to get the rows of a page.
+        total : (int)
+            The number of rows in the result.
+        first : (int)
+            The index of the first visible row.
+        pages : (OrderedDict)
+            Least recently used cache of fetched pages, keyed by page number.
+        pending : (set)
+            Page numbers that are being fetched. The fetch of a page is cancelled once it
+            leaves the window, or when another result is loaded.
+        generation : (int)
+            Incremented by every load so pages of an earlier result are discarded.
+        active : (bool)
+            Whether the Treeview is currently in virtual mode.
+        name : (str)
+            Prefix of the runner keys the pages are fetched under, unique per VirtualTable.
+    """
+    def __init__(self, tree, scrollbar, status, runner, page_size=PAGE_SIZE, max_pages=8, name='page'):
+        """
+        Initializes the VirtualTable and binds the scrolling events of the Treeview.
+
+        Parameters:
+            tree : (ttk.Treeview)
+                The Treeview the rows are drawn in.
+            scrollbar : (ttk.Scrollbar)
+                The scrollbar attached to the Treeview.
+            status : (tk.StringVar)
+                Receives the text describing the scroll position.
+            runner : (QueryRunner)
+                Fetches missing pages in the background.
+            page_size : (int)
+                The number of rows fetched per page.
+            max_pages : (int)
+                The number of pages kept in the cache.
+            name : (str)
+                Prefix of the runner keys the pages are fetched under.
+        """
+        self.tree = tree
+        self.scrollbar = scrollbar
+        self.status = status
+        self.runner = runner
+        self.page_size = page_size
+        self.max_pages = max_pages
+        self.fetch_page = None
+        self.total = 0
+        self.first = 0
+        self.visible = 1
+        self.pages = OrderedDict()
+        self.pending = set()
+        self.generation = 0
+        self.active = False
+        self.name = name
+
+        for sequence in ('<MouseWheel>', '<Button-4>', '<Button-5>'):
+            self.tree.bind(sequence, self.on_wheel, add='+')
+        for sequence in ('<Prior>', '<Next>', '<Home>', '<End>'):
+            self.tree.bind(sequence, self.on_key, add='+')
+        self.tree.bind('<Configure>', lambda event: self.render(), add='+')
+
+    def load(self, total, fetch_page):
+        """
+        Switches the Treeview into virtual mode for a result of `total` rows.
+
+        Parameters:
+            total : (int)
+                The number of rows in the result.
+            fetch_page : (callable)
+                Called as fetch_page(offset, limit) to get the rows of a page.
+        """
+        self.tree.delete(*self.tree.get_children())
+        self.fetch_page = fetch_page
+        self.total = total
+        self.first = 0
+        self.pages.clear()
+        self._cancel_pages(self.pending)
+        self.generation += 1
+        self.active = True
+
+        # The Treeview only ever holds what fits on screen, so the scrollbar follows us instead
+        self.tree.config(yscrollcommand='')
+        self.scrollbar.config(command=self.yview)
+        self.render()
+
+    def detach(self):
+        """
+        Leaves virtual mode and hands the scrollbar back to the Treeview.
+        """
+        if not self.active:
+            return
+        self.active = False
+        self.fetch_page = None
+        self.pages.clear()
+        self._cancel_pages(self.pending)
+        self.generation += 1
+        self.scrollbar.config(command=self.tree.yview)
+        self.tree.config(yscrollcommand=self.scrollbar.set)
+
+    def yview(self, *args):
+        """
+        Handles the scrollbar's 'moveto' and 'scroll' commands.
+        """
+        if args[0] == 'moveto':
+            self.scroll_to(round(float(args[1]) * self.total))
+        elif args[0] == 'scroll':
+            step = self.visible if args[2] == 'pages' else 1
+            self.scroll_to(self.first + int(args[1]) * step)
+
+    def on_wheel(self, event):
+        """
+        Scrolls three rows per mouse wheel notch.
+        """
+        if not self.active:
+            return
+        direction = -1 if event.num == 4 or event.delta > 0 else 1
+        self.scroll_to(self.first + 3 * direction)
+        return 'break'
+
+    def on_key(self, event):
+        """
+        Handles the Page Up, Page Down, Home and End keys.
+        """
+        if not self.active:
+            return
+        steps = {'Prior': -self.visible, 'Next': self.visible, 'Home': -self.total, 'End': self.total}
+        self.scroll_to(self.first + steps[event.keysym])
+        return 'break'
+
+    def scroll_to(self, first):
+        """
+        Makes `first` the top visible row, clamped to the bounds of the result.
+        """
+        first = max(0, min(first, self.total - self.visible))
+        if first != self.first:
+            self.first = first
+            self.tree.selection_remove(*self.tree.selection())
+            self.render()
+
+    def render(self):
+        """
+        Refills the Treeview items with the rows of the current window and updates the
+        scrollbar and status text.
+        """
+        if not self.active:
+            return
+
+        self.visible = self._visible_rows()
+        self.first = max(0, min(self.first, self.total - self.visible))
+        rows = [self._row(index) for index in range(self.first, min(self.first + self.visible, self.total))]
+
+        # Reuse the existing items and only add or remove the difference
+        items = self.tree.get_children()
+        for item, row in zip(items, rows):
+            self.tree.item(item, values=row)
+        for row in rows[len(items):]:
+            self.tree.insert('', tk.END, values=row)
+        if len(items) > len(rows):
+            self.tree.delete(*items[len(rows):])
+
+        last = self.first + len(rows)
+        if self.total:
+            self.scrollbar.set(self.first / self.total, last / self.total)
+            self.status.set(f"Rows {self.first + 1:,}-{last:,} of {self.total:,}")
+        else:
+            self.scrollbar.set(0, 1)
+            self.status.set("0 rows")
+
+        # Fetch the next page ahead of time once the window gets close to its end
+        last_page = max(last - 1, self.first) // self.page_size
+        wanted = set(range(self.first // self.page_size, last_page + 1))
+        next_page = last_page + 1
+        if last + self.visible >= next_page * self.page_size and next_page * self.page_size < self.total:
+            wanted.add(next_page)
+            self._page(next_page)
+
+        # Stop fetching the pages the window has scrolled away from
+        self._cancel_pages(self.pending - wanted)
+
+        # The first render happens before row heights are known, so correct the item count
+        if self._visible_rows() != self.visible:
+            self.tree.after_idle(self.render)
+
+    def _visible_rows(self):
+        """
+        Returns how many rows fit in the Treeview, measured from its first item.
+        """
+        items = self.tree.get_children()
+        box = self.tree.bbox(items[0]) if items else ''
+        if not box:
+            return max(self.visible, 1)
+        top, height = box[1], box[3]
+        return max(1, (self.tree.winfo_height() - top) // height)
+
+    def _row(self, index):
+        """
+        Returns the row at `index`, or an empty row while its page is being fetched.
+        """
+        page, position = divmod(index, self.page_size)
+        rows = self._page(page)
+        return rows[position] if position < len(rows) else ()
+
+    def _page(self, page):
+        """
+        Returns the rows of `page` from the cache. A page that is not cached is fetched
+        in the background and an empty list is returned until it arrives.
+        """
+        if not self.active:
+            return []
+        if page in self.pages:
+            self.pages.move_to_end(page)
+            return self.pages[page]
+        if page not in self.pending:
+            self.pending.add(page)
+            generation, fetch_page = self.generation, self.fetch_page
+            self.runner.submit(
+                f'{self.name}-{page}',
+                lambda progress: fetch_page(page * self.page_size, self.page_size),
+                lambda rows: self._store(generation, page, rows),
+                on_error=lambda error: self._failed(generation, page, error)
+            )
+        return []
+
+    def _cancel_pages(self, pages):
+        """
+        Cancels the fetches of `pages`, so that pages scrolled past or belonging to an
+        earlier result free their worker and have their query cancelled on the server.
         """
-        self.root.destroy()                                 # Destroy the current window 
+        for page in list(pages):
+            self.runner.cancel(f'{self.name}-{page}')
+            self.pending.discard(page)
 
-        root = tk.Tk()                                      # Initiate a new one 
-        main_app = Application(root, self.business_layer)
-        root.mainloop()                                     # Let her rip
+    def _store(self, generation, page, rows):
+        """
+        Caches a fetched page and redraws the window if the page belongs to the current result.
+        """
+        if generation != self.generation:
+            return
+        self.pending.discard(page)
+        self.pages[page] = rows
+        while len(self.pages) > self.max_pages:
+            self.pages.popitem(last=False)
+        self.render()
+
+    def _failed(self, generation, page, error):
+        """
+        Reports a page that could not be fetched, so scrolling back to it tries again.
+        """
+        if generation != self.generation:
+            return
+        self.pending.discard(page)
+        messagebox.showerror("Error", f"Failed to get data: {error}")
+# ----- Traffic Window ----- #
+class TrafficWindow:
+    """
+    A window listing the in450a packets sent or received by the addresses of one in450b
+    or in450c row. The packets are found on the server through the address indexes and
+    shown in virtual mode, so rows with a lot of traffic open as fast as those with little.
+
+    Attributes:
+        window : (tk.Toplevel)
+            The traffic window.
+        runner : (QueryRunner)
+            Runs the queries in the background.
+        key : (str)
+            The runner key of the window's queries.
+        status_text : (tk.StringVar)
+            Describes the scroll position, or what the window is doing.
+        virtual : (VirtualTable)
+            Shows the packets.
+    """
+    def __init__(self, root, business_layer, runner, title, filters):
+        """
+        Builds the traffic window and starts loading the packets.
+
+        Parameters:
+            root : (tk.Tk)
+                The main application window.
+            business_layer : (BusinessLayer)
+                Runs the queries.
+            runner : (QueryRunner)
+                Runs the queries in the background.
+            title : (str)
+                Names the row whose traffic is shown.
+            filters : (dict)
+                The in450a filters selecting the traffic, see `business_layer.related_traffic_filters`.
+        """
+        self.runner = runner
+        self.key = f"traffic-{id(self)}"
+        paddings = {'padx': 5, 'pady': 5}
+
+        self.window = tk.Toplevel(root)
+        self.window.title(f"Traffic of {title}")
+        self.window.configure(bg='dark blue')
+        self.window.geometry('1000x500')
+        self.window.protocol('WM_DELETE_WINDOW', self.close)
+
+        self.status_text = tk.StringVar(value=f"Finding the packets of {filters['host'].replace(',', ', ')}...")
+        ttk.Label(self.window, textvariable=self.status_text, style='TLabel').pack(side=tk.BOTTOM, **paddings)
+        tree = ttk.Treeview(self.window, columns=COLUMNS['in450a'], show='headings', selectmode='browse')
+        for col in COLUMNS['in450a']:
+            tree.heading(col, text=col)
+            tree.column(col, anchor=tk.W)
+        tree.pack(fill=tk.BOTH, expand=True, **paddings)
+        scrollbar = ttk.Scrollbar(tree, orient=tk.VERTICAL, command=tree.yview)
+        tree.config(yscrollcommand=scrollbar.set)
+        scrollbar.pack(side='right', fill=tk.Y)
+        self.virtual = VirtualTable(tree, scrollbar, self.status_text, runner, name=self.key)
+
+        def work(progress):
+            total = business_layer.get_row_count('in450a', filters)
+            return total, business_layer.get_page_keys('in450a', PAGE_SIZE, filters)
+
+        def done(result):
+            total, keys = result
+            self.virtual.load(total, lambda offset, limit: business_layer.get_page_after(
+                'in450a', keys[offset // PAGE_SIZE], limit, filters
+            ))
+
+        runner.submit(self.key, work, done, on_error=lambda error: self.status_text.set(f"Failed to load the traffic: {error}"))
+
+    def close(self):
+        """
+        Stops loading the packets and closes the window.
+        """
+        self.runner.cancel(self.key)
+        self.virtual.detach()
+        self.window.destroy()
+# ----- Live Tail ----- #
+class LiveTail:
+    """
+    Follows the rows being added to a table in a Treeview. It remembers the largest
+    primary key it has shown, its high-water mark, and only ever asks the server for rows
+    past it. It checks every TAIL_POLL_MS, and as soon as the table's trigger sends a
+    notification. The Treeview works as a ring buffer: once it holds `max_rows` rows the
+    oldest are deleted as new ones come in. It keeps scrolling to the newest row unless
+    the user scrolled up.
+
+    A row is missed if its transaction commits after that of a row with a larger key
+    was shown, or if its capture time is TAIL_TIME_SLACK older than the newest row's.
+
+    Attributes:
+        tree : (ttk.Treeview)
+            The Treeview the rows are drawn in.
+        status : (tk.StringVar)
+            Receives the text describing the tail.
+        runner : (QueryRunner)
+            Fetches new rows in the background.
+        business_layer : (BusinessLayer)
+            Runs the queries and reports the table's changes.
+        table : (str)
+            The table being followed.
+        max_rows : (int)
+            The number of rows kept in the Treeview.
+        last_id : (int)
+            The high-water mark, or None before the first rows arrived.
+        last_time : (Decimal)
+            The newest capture time seen, for tables filtered by time.
+        items : (deque)
+            The Treeview items, oldest first.
+        received : (int)
+            The number of rows received since the tail started.
+        wake : (threading.Event)
+            Set by the listener thread when the table changed.
+        active : (bool)
+            Whether the tail is running.
+    """
+    def __init__(self, tree, status, runner, business_layer, table, max_rows=TAIL_ROWS):
+        """
+        Initializes the LiveTail. Nothing happens until `start` is called.
+
+        Parameters:
+            tree : (ttk.Treeview)
+                The Treeview the rows are drawn in, with the table's columns configured.
+            status : (tk.StringVar)
+                Receives the text describing the tail.
+            runner : (QueryRunner)
+                Fetches new rows in the background.
+            business_layer : (BusinessLayer)
+                Runs the queries and reports the table's changes.
+            table : (str)
+                The table to follow.
+            max_rows : (int)
+                The number of rows kept in the Treeview.
+        """
+        from collections import deque
+        from business_layer import table_columns, table_filters
+
+        self.tree = tree
+        self.status = status
+        self.runner = runner
+        self.business_layer = business_layer
+        self.table = table
+        self.max_rows = max_rows
+        registry = business_layer.registry
+        self.time_index = (table_columns(table, registry).index('time')
+                           if 'time' in table_filters(table, registry) else None)
+        self.last_id = None
+        self.last_time = None
+        self.items = deque()
+        self.received = 0
+        self.wake = threading.Event()
+        self.fetching = False
+        self.last_fetch = 0
+        self.scheduled = None
+        self.active = False
+
+    def start(self):
+        """
+        Shows the latest rows of the table and starts following it.
+        """
+        self.active = True
+        self.business_layer.watch(self.table, self.notified)
+        self.status.set(f"Live tail of {self.table}: starting...")
+        self.fetch()
+        self.scheduled = self.tree.after(POLL_INTERVAL, self.tick)
+
+    def stop(self):
+        """
+        Stops following the table. The rows shown stay in the Treeview.
+        """
+        if not self.active:
+            return
+        self.active = False
+        self.business_layer.unwatch(self.table, self.notified)
+        if self.scheduled is not None:
+            self.tree.after_cancel(self.scheduled)
+            self.scheduled = None
+        self.runner.cancel('tail')
+
+    def notified(self, table):
+        """
+        Called on the listener thread when the table changed; the next tick fetches.
+        """
+        self.wake.set()
+
+    def tick(self):
+        """
+        Fetches new rows when the table changed or the poll interval has passed, then
+        schedules the next check.
+        """
+        self.scheduled = None
+        if not self.active:
+            return
+        due = TAIL_POLL_MS and time.monotonic() - self.last_fetch >= TAIL_POLL_MS / 1000
+        if not self.fetching and (self.wake.is_set() or due):
+            self.fetch()
+        self.scheduled = self.tree.after(POLL_INTERVAL, self.tick)
+
+    def fetch(self):
+        """
+        Asks the server, in the background, for the rows past the high-water mark, or for
+        the latest rows when nothing has been shown yet.
+        """
+        self.fetching = True
+        self.wake.clear()
+        self.last_fetch = time.monotonic()
+        table, last_id = self.table, self.last_id
+        filters = None
+        if self.last_time is not None:
+            filters = {'time': (self.last_time - TAIL_TIME_SLACK, None)}
+
+        def work(progress):
+            if last_id is None:
+                return self.business_layer.get_last_rows(table, min(self.max_rows, TAIL_BATCH))
+            return self.business_layer.get_rows_after(table, last_id, TAIL_BATCH, filters)
+
+        self.runner.submit('tail', work, self.append, on_error=self.failed)
+
+    def append(self, rows):
+        """
+        Adds fetched rows to the end of the Treeview, deletes the oldest beyond `max_rows`
+        and fetches again straight away if the batch was full.
+        """
+        self.fetching = False
+        if not self.active:
+            return
+        if rows:
+            following = self.tree.yview()[1] >= 1.0 or not self.items
+            self.received += len(rows)
+            self.last_id = rows[-1][0]
+            if self.time_index is not None:
+                newest = max(row[1 + self.time_index] for row in rows)
+                self.last_time = newest if self.last_time is None else max(self.last_time, newest)
+            for row in rows[-self.max_rows:]:
+                self.items.append(self.tree.insert('', tk.END, values=row[1:]))
+            excess = len(self.items) - self.max_rows
+            if excess > 0:
+                self.tree.delete(*(self.items.popleft() for _ in range(excess)))
+            if following:
+                self.tree.see(self.items[-1])
+        self.status.set(
+            f"Live tail of {self.table}: {len(self.items):,} rows shown, "
+            f"{self.received:,} received, last id {self.last_id}"
+        )
+        if len(rows) == TAIL_BATCH:
+            self.fetch()
+
+    def failed(self, error):
+        """
+        Reports a failed fetch; the next tick tries again.
+        """
+        self.fetching = False
+        if self.active:
+            self.status.set(f"Live tail of {self.table}: {error}, retrying...")
+# ----- Analytics Panel ----- #
+class AnalyticsPanel:
+    """
+    A window showing in450a traffic analytics that are aggregated on the server: packets
+    and bytes per protocol, the top talkers and traffic over time. The aggregates come
+    from materialized views that can be refreshed on demand or on a schedule.
+
+    Attributes:
+        window : (tk.Toplevel)
+            The analytics window.
+        business_layer : (BusinessLayer)
+            Runs the analytics queries.
+        runner : (QueryRunner)
+            Runs the queries in the background.
+        trees : (dict)
+            The Treeview of each tab, keyed by tab name.
+        bucket_entry : (ttk.Entry)
+            The width in seconds of the traffic over time buckets.
+        auto_refresh : (tk.BooleanVar)
+            Whether the views are refreshed every ANALYTICS_REFRESH_MINUTES.
+        status_text : (tk.StringVar)
+            Describes what the panel is doing.
+    """
+    def __init__(self, root, business_layer, runner):
+        """
+        Builds the analytics window and loads every tab.
+
+        Parameters:
+            root : (tk.Tk)
+                The main application window.
+            business_layer : (BusinessLayer)
+                Runs the analytics queries.
+            runner : (QueryRunner)
+                Runs the queries in the background.
+        """
+        self.business_layer = business_layer
+        self.runner = runner
+        self.scheduled = None
+        paddings = {'padx': 5, 'pady': 5}
+
+        self.window = tk.Toplevel(root)
+        self.window.title('IN450a Traffic Analytics')
+        self.window.configure(bg='dark blue')
+        self.window.geometry('900x600')
+        self.window.protocol('WM_DELETE_WINDOW', self.close)
+
+        controls = tk.Frame(self.window, bg='dark blue')
+        controls.pack(fill=tk.X, **paddings)
+        ttk.Button(controls, text='Refresh Views', style='AppButton.TButton', command=self.refresh).pack(side=tk.LEFT, **paddings)
+        self.auto_refresh = tk.BooleanVar(value=False)
+        ttk.Checkbutton(
+            controls, text=f'Refresh every {ANALYTICS_REFRESH_MINUTES} min', variable=self.auto_refresh, command=self.schedule
+        ).pack(side=tk.LEFT, **paddings)
+        self.status_text = tk.StringVar()
+        ttk.Label(controls, textvariable=self.status_text, style='TLabel').pack(side=tk.RIGHT, **paddings)
+
+        notebook = ttk.Notebook(self.window)
+        notebook.pack(fill=tk.BOTH, expand=True, **paddings)
+        self.trees = {}
+        for name, columns in (
+            ('Protocols', ['Protocol', 'Packets', 'Bytes']),
+            ('Top Sources', ['Source', 'Packets', 'Bytes']),
+            ('Top Destinations', ['Destination', 'Packets', 'Bytes']),
+            ('Over Time', ['Bucket Start (s)', 'Packets', 'Bytes']),
+        ):
+            tab = tk.Frame(notebook, bg='dark blue')
+            notebook.add(tab, text=name)
+            if name == 'Over Time':
+                bucket_frame = tk.Frame(tab, bg='dark blue')
+                bucket_frame.pack(fill=tk.X, **paddings)
+                ttk.Label(bucket_frame, text='Bucket (s):', style='TLabel').pack(side=tk.LEFT, **paddings)
+                self.bucket_entry = ttk.Entry(bucket_frame, width=8, font=('Courier', 14))
+                self.bucket_entry.insert(0, '1')
+                self.bucket_entry.pack(side=tk.LEFT, **paddings)
+                self.bucket_entry.bind('<Return>', lambda event: self.load_series())
+                ttk.Button(bucket_frame, text='Show', style='AppButton.TButton', command=self.load_series).pack(side=tk.LEFT, **paddings)
+            tree = ttk.Treeview(tab, columns=columns, show='headings')
+            for col in columns:
+                tree.heading(col, text=col)
+                tree.column(col, anchor=tk.W)
+            scrollbar = ttk.Scrollbar(tree, orient=tk.VERTICAL, command=tree.yview)
+            tree.config(yscrollcommand=scrollbar.set)
+            scrollbar.pack(side='right', fill=tk.Y)
+            tree.pack(fill=tk.BOTH, expand=True)
+            self.trees[name] = tree
+
+        self.load()
+
+    def _submit(self, name, work):
+        """
+        Runs `work` in the background and shows its rows in the tab called `name`.
+        """
+        self.runner.submit(
+            f'analytics-{name}',
+            lambda progress: work(),
+            lambda rows: self._fill(name, rows),
+            on_error=lambda error: self.status_text.set(f"Failed to load {name}: {error}")
+        )
+
+    def _fill(self, name, rows):
+        """
+        Replaces the rows of the tab called `name`.
+        """
+        if not self.window.winfo_exists():
+            return
+        tree = self.trees[name]
+        tree.delete(*tree.get_children())
+        for row in rows:
+            tree.insert('', tk.END, values=row)
+
+    def load(self):
+        """
+        Loads every tab from the analytics views.
+        """
+        self._submit('Protocols', self.business_layer.get_protocol_stats)
+        self._submit('Top Sources', lambda: self.business_layer.get_top_talkers('source'))
+        self._submit('Top Destinations', lambda: self.business_layer.get_top_talkers('destination'))
+        self.load_series()
+
+    def load_series(self):
+        """
+        Loads the traffic over time tab with the bucket width in the entry.
+        """
+        try:
+            width = Decimal(self.bucket_entry.get())
+            if width <= 0:
+                raise InvalidOperation()
+        except InvalidOperation:
+            messagebox.showerror("Invalid Bucket", "The bucket width must be a positive number of seconds.", parent=self.window)
+            return
+        self._submit('Over Time', lambda: self.business_layer.get_traffic_over_time(width))
+
+    def refresh(self):
+        """
+        Refreshes the materialized views on the server, then reloads every tab.
+        """
+        self.status_text.set("Refreshing views...")
+
+        def done(result):
+            self.status_text.set(f"Refreshed at {time.strftime('%H:%M:%S')}")
+            self.load()
+
+        self.runner.submit(
+            'analytics-refresh',
+            lambda progress: self.business_layer.refresh_analytics(),
+            done,
+            on_error=lambda error: self.status_text.set(f"Refresh failed: {error}")
+        )
+
+    def schedule(self):
+        """
+        Starts or stops the periodic refresh according to the auto refresh checkbox.
+        """
+        if self.scheduled is not None:
+            self.window.after_cancel(self.scheduled)
+            self.scheduled = None
+        if self.auto_refresh.get():
+            self.scheduled = self.window.after(ANALYTICS_REFRESH_MINUTES * 60000, self._scheduled_refresh)
+
+    def _scheduled_refresh(self):
+        """
+        Refreshes the views and schedules the next refresh.
+        """
+        self.scheduled = None
+        self.refresh()
+        self.schedule()
+
+    def close(self):
+        """
+        Stops the periodic refresh and closes the window.
+        """
+        self.auto_refresh.set(False)
+        self.schedule()
+        self.window.destroy()
+# ----- Diagnostics ----- #
+class DiagnosticsPanel:
+    """
+    A window showing the timings the BusinessLayer records for its queries: the most
+    recent calls, a summary per method and a latency histogram per method. It reads the
+    statistics kept in memory and never queries the database.
+
+    Attributes:
+        window : (tk.Toplevel)
+            The diagnostics window.
+        stats : (QueryStats)
+            The statistics being shown.
+        recent_tree : (ttk.Treeview)
+            The most recent calls, newest first.
+        summary_tree : (ttk.Treeview)
+            Calls and latency percentiles per method.
+        method : (ttk.Combobox)
+            The method whose histogram is drawn.
+        canvas : (tk.Canvas)
+            The latency histogram.
+        explain : (tk.BooleanVar)
+            Whether the plan of slow queries is captured.
+    """
+    def __init__(self, root, business_layer):
+        """
+        Builds the diagnostics window and starts redrawing it every DIAGNOSTICS_INTERVAL.
+
+        Parameters:
+            root : (tk.Tk)
+                The main application window.
+            business_layer : (BusinessLayer)
+                Whose query statistics are shown.
+        """
+        self.stats = business_layer.stats
+        self.scheduled = None
+        paddings = {'padx': 5, 'pady': 5}
+
+        self.window = tk.Toplevel(root)
+        self.window.title('Query Diagnostics')
+        self.window.configure(bg='dark blue')
+        self.window.geometry('1000x650')
+        self.window.protocol('WM_DELETE_WINDOW', self.close)
+
+        controls = tk.Frame(self.window, bg='dark blue')
+        controls.pack(fill=tk.X, **paddings)
+        log = self.stats.log_path or 'off'
+        ttk.Label(controls, text=f"Slow query log: {log} (over {self.stats.slow_ms:g} ms)", style='TLabel').pack(side=tk.LEFT, **paddings)
+        self.explain = tk.BooleanVar(value=self.stats.explain)
+        ttk.Checkbutton(
+            controls, text='Capture EXPLAIN (ANALYZE, BUFFERS)', variable=self.explain,
+            command=lambda: setattr(self.stats, 'explain', self.explain.get())
+        ).pack(side=tk.LEFT, **paddings)
+        ttk.Button(controls, text='Clear', style='AppButton.TButton', command=self.clear).pack(side=tk.RIGHT, **paddings)
+
+        notebook = ttk.Notebook(self.window)
+        notebook.pack(fill=tk.BOTH, expand=True, **paddings)
+        self.recent_tree = self._tree(notebook, 'Recent Queries',
+                                      ['Time', 'Method', 'Total (ms)', 'Execute (ms)', 'Fetch (ms)', 'Rows', 'Bytes', 'Cached'])
+        self.summary_tree = self._tree(notebook, 'Summary',
+                                       ['Method', 'Calls', 'p50 (ms)', 'p95 (ms)', 'Max (ms)', 'Rows', 'Bytes'])
+
+        tab = tk.Frame(notebook, bg='dark blue')
+        notebook.add(tab, text='Histogram')
+        self.method = ttk.Combobox(tab, state='readonly', width=40)
+        self.method.pack(anchor=tk.W, **paddings)
+        self.method.bind('<<ComboboxSelected>>', lambda event: self.update())
+        self.canvas = tk.Canvas(tab, bg='white')
+        self.canvas.pack(fill=tk.BOTH, expand=True, **paddings)
+
+        self.update()
+
+    def _tree(self, notebook, name, columns):
+        """
+        Adds a tab called `name` holding a Treeview with `columns` and returns the Treeview.
+        """
+        tab = tk.Frame(notebook, bg='dark blue')
+        notebook.add(tab, text=name)
+        tree = ttk.Treeview(tab, columns=columns, show='headings')
+        for col in columns:
+            tree.heading(col, text=col)
+            tree.column(col, anchor=tk.W, width=110)
+        scrollbar = ttk.Scrollbar(tree, orient=tk.VERTICAL, command=tree.yview)
+        tree.config(yscrollcommand=scrollbar.set)
+        scrollbar.pack(side='right', fill=tk.Y)
+        tree.pack(fill=tk.BOTH, expand=True)
+        return tree
+
+    def update(self):
+        """
+        Redraws every tab from the current statistics and schedules the next redraw.
+        """
+        if self.scheduled is not None:
+            self.window.after_cancel(self.scheduled)
+        recent, histograms = self.stats.snapshot()
+
+        self.recent_tree.delete(*self.recent_tree.get_children())
+        for entry in reversed(recent):
+            self.recent_tree.insert('', tk.END, values=(
+                time.strftime('%H:%M:%S', time.localtime(entry['time'])), entry['name'],
+                f"{entry['total_ms']:.1f}", f"{entry['execute_ms']:.1f}", f"{entry['fetch_ms']:.1f}",
+                f"{entry['rows']:,}", f"{entry['bytes']:,}", 'yes' if entry['cached'] else ''
+            ))
+
+        by_method = {}
+        for entry in recent:
+            by_method.setdefault(entry['name'], []).append(entry)
+        self.summary_tree.delete(*self.summary_tree.get_children())
+        for name, entries in sorted(by_method.items()):
+            totals = sorted(entry['total_ms'] for entry in entries)
+            self.summary_tree.insert('', tk.END, values=(
+                name, len(entries), f"{totals[len(totals) // 2]:.1f}", f"{totals[int(len(totals) * 0.95)]:.1f}",
+                f"{totals[-1]:.1f}", f"{sum(entry['rows'] for entry in entries):,}",
+                f"{sum(entry['bytes'] for entry in entries):,}"
+            ))
+
+        self.method['values'] = sorted(histograms)
+        if self.method.get() not in histograms and histograms:
+            self.method.set(sorted(histograms)[0])
+        self.draw_histogram(histograms.get(self.method.get()))
+        self.scheduled = self.window.after(DIAGNOSTICS_INTERVAL, self.update)
+
+    def draw_histogram(self, counts):
+        """
+        Draws one bar per latency bucket for the calls of the selected method.
+
+        Parameters:
+            counts : (list of int)
+                The number of calls in each of `LATENCY_BUCKETS`, or None for no method.
+        """
+        from business_layer import LATENCY_BUCKETS
+
+        self.canvas.delete('all')
+        if not counts:
+            return
+        width = max(self.canvas.winfo_width(), 400)
+        height = max(self.canvas.winfo_height(), 200)
+        slot = width / len(counts)
+        tallest = max(counts) or 1
+        for index, (count, bound) in enumerate(zip(counts, LATENCY_BUCKETS)):
+            bar = (height - 40) * count / tallest
+            x = index * slot
+            self.canvas.create_rectangle(x + 4, height - 20 - bar, x + slot - 4, height - 20, fill='dark blue')
+            self.canvas.create_text(x + slot / 2, height - 20 - bar - 8, text=str(count))
+            label = f"<={bound:g}" if bound != float('inf') else f">{LATENCY_BUCKETS[-2]:g}"
+            self.canvas.create_text(x + slot / 2, height - 10, text=f"{label} ms")
+
+    def clear(self):
+        """
+        Forgets every recorded call.
+        """
+        self.stats.clear()
+        self.update()
+
+    def close(self):
+        """
+        Stops redrawing and closes the window.
+        """
+        if self.scheduled is not None:
+            self.window.after_cancel(self.scheduled)
+        self.window.destroy()
 # ---- Application ----- #
 class Application:
     """
@@ -111,6 +1318,18 @@ class Application:
             A tree view widget for displaying data in table format.
         paddings : (dict)
             Padding configuration for widgets.
+        runner : (QueryRunner)
+            Runs the database work in the background.
+        view : (dict)
+            The table, filters and sort order currently shown, or None when the Treeview
+            holds something other than a table. Includes the ColumnarResult of a result
+            held on the client, see `COLUMNAR_ROWS`.
+        tail : (LiveTail)
+            The live tail shown in the Treeview, or None.
+        report_table : (str)
+            The table whose traffic report the Treeview holds, or None.
+        tables : (list of str)
+            The registered tables the user may read, which the buttons and search bar offer.
     """
     def __init__(self, root, business_layer):
         """
@@ -135,6 +1354,15 @@ class Application:
         
         # Call business layer
         self.business_layer = business_layer
+        self.view = None
+        self.tail = None
+        self.report_table = None
+        self.active = set()
+
+        # Run the queries in the background and report their errors on the Tk thread
+        self.runner = QueryRunner(root, business_layer, business_layer.pool_size)
+        self.business_layer.error_handler = self.runner.post_error
+        self.root.protocol('WM_DELETE_WINDOW', self.on_closing)
         
         # Bring in the configured styles
         AppStyles()
@@ -143,26 +1371,55 @@ class Application:
         self.paddings = {'padx': 5, 'pady': 5}
 
 
-        # Create the different buttons based on what each user has the permissions to do
-        if 'in450a' in self.business_layer.user:      # in450a has permission to view all three tables, so all options are shown
-            ttk.Button(root, text="Show IN450a Row Count", style='AppButton.TButton', command=self.show_in450a_row_count).pack(**self.paddings)
+        # Create the buttons of the tables the user may read, as the server reports them, in
+        # the order of the app_tables registry. Features built on a table are only offered
+        # when it is readable.
+        from business_layer import CORRELATED_TABLES
+
+        registry = self.business_layer.load_registry()
+        self.tables = self.business_layer.readable_tables()
+        for table in self.tables:
+            ttk.Button(root, text=f"Show {registry[table]['label']} Row Count", style='AppButton.TButton', command=lambda table=table: self.show_row_count(table)).pack(**self.paddings)
+        if 'in450b' in self.tables:
             ttk.Button(root, text="Show IN450b Names", style='AppButton.TButton', command=self.show_in450b_names).pack(**self.paddings)
-            ttk.Button(root, text='Show IN450c Count', style='AppButton.TButton', command=self.show_in450c_row_count).pack(**self.paddings)
 
-            ttk.Button(root, text='Show All Data for in450a', style='AppButton.TButton', command=self.show_in450a_data).pack(**self.paddings)
-            ttk.Button(root, text='Show All Data for in450b', style='AppButton.TButton', command=self.show_in450b_data).pack(**self.paddings)
-            ttk.Button(root, text='Show All Data for in450c', style='AppButton.TButton', command=self.show_in450c_data).pack(**self.paddings)
-        
-        # in450b only has permission to see the in450b table, so that is the only option shown.
-        elif 'in450b' in self.business_layer.user: 
-            ttk.Button(root, text='Show IN450b Names', style='AppButton.TButton', command=self.show_in450b_names).pack(**self.paddings)
-            ttk.Button(root, text='Show All Data for in450b', style='AppButton.TButton', command=self.show_in450b_data).pack(**self.paddings)
-        
-        # in450c only has permission to see the in450c table, so that is the only option shown.
-        elif 'in450c' in self.business_layer.user:
-            ttk.Button(root, text='Show IN450c Count', style='AppButton.TButton', command=self.show_in450c_row_count).pack(**self.paddings)
-            ttk.Button(root, text='Show All Data for in450c', style='AppButton.TButton', command=self.show_in450c_data).pack(**self.paddings)
+        for table in self.tables:
+            ttk.Button(root, text=f"Show All Data for {registry[table]['label']}", style='AppButton.TButton', command=lambda table=table: self.show_table(table)).pack(**self.paddings)
+        if 'in450a' in self.tables:
+            ttk.Button(root, text='Show IN450a Analytics', style='AppButton.TButton', command=self.show_analytics).pack(**self.paddings)
+            ttk.Button(root, text='Live Tail IN450a', style='AppButton.TButton', command=self.show_live_tail).pack(**self.paddings)
+            for table in CORRELATED_TABLES:
+                if table in self.tables:
+                    ttk.Button(root, text=f"{registry[table]['label']} Traffic Report", style='AppButton.TButton', command=lambda table=table: self.show_traffic_report(table)).pack(**self.paddings)
+
+        # Search bar: pick a table and type filters; they run as a WHERE clause on the server
+        if self.tables:
+            search_frame = tk.Frame(root, bg='dark blue')
+            search_frame.pack(fill=tk.X, **self.paddings)
+            self.search_table = ttk.Combobox(search_frame, values=self.tables, state='readonly', width=8)
+            self.search_table.current(0)
+            self.search_table.pack(side=tk.LEFT, **self.paddings)
+            self.search_entry = ttk.Entry(search_frame, font=('Courier', 14))
+            self.search_entry.pack(side=tk.LEFT, fill=tk.X, expand=True, **self.paddings)
+            self.search_entry.bind('<Return>', lambda event: self.search())
+            ttk.Button(search_frame, text='Search', style='AppButton.TButton', command=self.search).pack(side=tk.LEFT, **self.paddings)
+            ttk.Button(search_frame, text='Export View', style='AppButton.TButton', command=self.export_view).pack(side=tk.LEFT, **self.paddings)
+            self.search_help = tk.StringVar()
+            ttk.Label(root, textvariable=self.search_help, style='TLabel').pack(**self.paddings)
+            self.search_table.bind('<<ComboboxSelected>>', lambda event: self.update_search_help())
+            self.update_search_help()
 
+        # Shows how many rows are loaded, or the scroll position in virtual mode, next to
+        # a progress bar and a cancel button for the running query
+        status_frame = tk.Frame(root, bg='dark blue')
+        status_frame.pack(side=tk.BOTTOM, fill=tk.X)
+        self.status_text = tk.StringVar()
+        ttk.Label(status_frame, textvariable=self.status_text, style='TLabel').pack(side=tk.LEFT, **self.paddings)
+        self.cancel_button = ttk.Button(status_frame, text='Cancel Query', style='AppButton.TButton', command=self.cancel_query, state=tk.DISABLED)
+        self.cancel_button.pack(side=tk.RIGHT, **self.paddings)
+        ttk.Button(status_frame, text='Diagnostics', style='AppButton.TButton', command=self.show_diagnostics).pack(side=tk.RIGHT, **self.paddings)
+        self.progress = ttk.Progressbar(status_frame, mode='indeterminate')
+        self.progress.pack(side=tk.RIGHT, fill=tk.X, expand=True, **self.paddings)
 
         # Create a tkinter Treeview object for viewing the data in a table format.
         self.tree = ttk.Treeview(root, selectmode='browse')
@@ -176,57 +1433,340 @@ class Application:
 
         self.tree.bind('<<TreeviewSelect>>', self.action)
 
-    def show_in450a_row_count(self):
+        # Large results only keep the visible rows as Treeview items
+        self.virtual = VirtualTable(self.tree, self.tree_scrollbar, self.status_text, self.runner)
+
+    def show_row_count(self, table):
         """
-        Fetches and displays the row count from the 'in450a' table in a message box.
+        Fetches and displays the row count of a table in a message box.
+
+        Parameters:
+            table : (str)
+                The name of the table to count.
         """
-        try:
-            row_count = self.business_layer.get_in450a_row_count()
-            messagebox.showinfo("IN450a Row Count", f"Row count: {row_count}")
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to get row count: {e}")
-    
+        label = self.business_layer.load_registry()[table]['label']
+        self.run_query(
+            lambda progress: self.business_layer.get_count(table),
+            lambda row_count: messagebox.showinfo(f"{label} Row Count", f"Row count: {row_count}")
+        )
+
     def show_in450b_names(self):
         """
         Fetches and displays the names (first and last) from the 'in450b' table in the Treeview.
         """
+        self.run_query(
+            lambda progress: self.business_layer.get_in450b_names(),
+            lambda names: self.display_data(names, ['First Name', 'Last Name'])
+        )
+
+    def run_query(self, work, on_done, on_progress=None, key='main'):
+        """
+        Runs `work` in the background while the progress bar spins, superseding the
+        query started earlier under the same key.
+
+        Parameters:
+            work : (callable)
+                Called on a worker thread as work(progress).
+            on_done : (callable)
+                Called on the Tk thread with the result, unless the query failed.
+            on_progress : (callable)
+                Called on the Tk thread with each payload passed to progress().
+            key : (str)
+                The runner slot of the query: 'main' for browsing, 'export' for exports,
+                so an export keeps running while the user looks at other data.
+        """
+        def finished():
+            self.active.discard(key)
+            if not self.active:
+                self.set_busy(False)
+
+        def done(result):
+            finished()
+            if result is not None:                          # The BusinessLayer already reported the error
+                on_done(result)
+
+        def failed(error):
+            finished()
+            messagebox.showerror("Error", f"Failed to get data: {error}")
+
+        self.active.add(key)
+        self.set_busy(True)
+        self.runner.submit(key, work, done, on_progress, failed)
+
+    def set_busy(self, busy):
+        """
+        Starts or stops the progress bar and enables the cancel button while a query runs.
+        """
+        if busy:
+            self.status_text.set("Running query...")
+            self.progress.start()
+            self.cancel_button.config(state=tk.NORMAL)
+        else:
+            self.progress.stop()
+            self.cancel_button.config(state=tk.DISABLED)
+
+    def cancel_query(self):
+        """
+        Cancels every running query, including an export in progress.
+        """
+        for key in self.active:
+            self.runner.cancel(key)
+        self.active.clear()
+        self.set_busy(False)
+        self.status_text.set("Query cancelled")
+
+    def show_analytics(self):
+        """
+        Opens the in450a traffic analytics window.
+        """
+        AnalyticsPanel(self.root, self.business_layer, self.runner)
+
+    def show_live_tail(self):
+        """
+        Follows the rows being added to in450a in the Treeview until other data is shown.
+        """
+        self.display_data([], COLUMNS['in450a'])
+        self.tail = LiveTail(self.tree, self.status_text, self.runner, self.business_layer, 'in450a')
+        self.tail.start()
+
+    def show_traffic_report(self, table):
+        """
+        Shows which rows of in450b or in450c appear in the in450a capture, with the traffic
+        of their addresses, the most packets first. Selecting a row opens its packets.
+
+        Parameters:
+            table : (str)
+                The table to report on, in450b or in450c.
+        """
+        def done(rows):
+            self.display_data(rows, headings(table) + TRAFFIC_REPORT_HEADINGS)
+            self.report_table = table
+
+        self.run_query(lambda progress: self.business_layer.get_traffic_report(table), done)
+
+    def show_traffic(self, table, values):
+        """
+        Opens a window with the in450a packets sent or received by the addresses of a row
+        of in450b or in450c.
+
+        Parameters:
+            table : (str)
+                The table the row comes from.
+            values : (sequence)
+                The data columns of the row, in the order of `COLUMN_NAMES[table]`.
+
+        Returns:
+            (bool):
+                Whether the window was opened; rows without addresses have no traffic.
+        """
+        from business_layer import related_traffic_filters
+
         try:
-            names = self.business_layer.get_in450b_names()
-            self.display_data(names, ['First Name', 'Last Name'])
+            filters = related_traffic_filters(table, values)
+        except ValueError:
+            return False
+        TrafficWindow(self.root, self.business_layer, self.runner, ' '.join(str(value) for value in values[:2]), filters)
+        return True
 
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to get names: {e}")
-            
-    def show_in450c_row_count(self):
+    def show_diagnostics(self):
+        """
+        Opens the query diagnostics window.
+        """
+        DiagnosticsPanel(self.root, self.business_layer)
+
+    def update_search_help(self):
         """
-        Fetches and displays the row count from the 'in450c' table in a message box.
+        Lists the filters the selected table supports under the search bar, with the
+        estimated size of the table when the login prefetched it.
         """
+        from business_layer import RANKED_FILTERS, table_filters
+
+        table = self.search_table.get()
+        info = self.business_layer.metadata.get(table)
+        size = f" (~{info['estimate']:,} rows)" if info and info['estimate'] else ''
+        filters = table_filters(table, self.business_layer.registry)
+        ranked = [f'{name}=' for name in RANKED_FILTERS if name in filters]
+        hint = f"; {' and '.join(ranked)} show the best matches first" if ranked else ''
+        self.search_help.set(f"Filter {table}{size} by: {', '.join(f'{name}=' for name in filters)}{hint}")
+
+    def search(self):
+        """
+        Shows the rows of the selected table that match the filters in the search bar.
+        """
+        table = self.search_table.get()
         try:
-            row_count = self.business_layer.get_in450c_row_count()
-            messagebox.showinfo('IN450c Row Count', f'Row count: {row_count}')
-        except Exception as ex:
-            messagebox.showerror('Error', f'Failed to get namees: {ex}')
-            
-    def show_in450a_data(self):
+            filters = parse_filters(table, self.search_entry.get(), self.business_layer.registry)
+        except ValueError as e:
+            messagebox.showerror("Invalid Search", str(e))
+            return
+        self.show_table(table, filters)
+
+    def show_table(self, table, filters=None, sort=None, descending=False):
+        """
+        Shows a table, or the rows of it matching `filters`, in the Treeview. Small results
+        are streamed in completely, large ones are shown in virtual mode and paged in as
+        the user scrolls, using keyset pagination so every page costs the same to fetch.
+        Clicking a column header sorts the table by that column on the server. Results of
+        up to `COLUMNAR_ROWS` rows are instead fetched once into a ColumnarResult, which is
+        paged and sorted on the client. Searches of Info with words= or info= are shown by
+        `show_ranked` until the user sorts them by a column.
+
+        Parameters:
+            table : (str)
+                The name of the table to show.
+            filters : (dict)
+                BusinessLayer search filters, see `parse_filters`.
+            sort : (str)
+                The column to sort by, one of `table_columns(table)`, or None for load order.
+            descending : (bool)
+                Sort from the largest value down.
+        """
+        from business_layer import RANKED_FILTERS
+
+        if sort is None and any(name in RANKED_FILTERS for name in filters or {}):
+            self.show_ranked(table, filters)
+            return
+        columns = headings(table, self.business_layer.registry)
+
+        def work(progress):
+            total = self.business_layer.get_row_count(table, filters)
+            if VIRTUAL_THRESHOLD < total <= COLUMNAR_ROWS:
+                held = self.business_layer.get_columnar(table, filters)
+                return total, None, held, held.sort(sort, descending) if sort else held
+            if total > VIRTUAL_THRESHOLD:
+                return total, self.business_layer.get_page_keys(table, PAGE_SIZE, filters, sort, descending), None, None
+            with closing(self.business_layer.stream_rows(table, filters, sort, descending)) as batches:
+                for batch in batches:
+                    progress(batch)
+            return total, None, None, None
+
+        def done(result):
+            total, keys, held, ordered = result
+            if held is not None:
+                self.display_held(view, held, ordered)
+                return
+            if keys is None:
+                self.status_text.set(f"{len(self.tree.get_children()):,} rows")
+                return
+
+            def fetch_page(offset, limit):
+                return self.business_layer.get_page_after(table, keys[offset // PAGE_SIZE], limit, filters, sort, descending)
+
+            self.display_virtual(total, columns, fetch_page)
+            self.set_headings(table, sort, descending)
+            self.view = view
+
+        self.display_data([], columns)
+        view = self.view = dict(table=table, filters=filters, sort=sort, descending=descending, held=None)
+        self.set_headings(table, sort, descending)
+        self.run_query(work, done, self.append_rows)
+
+    def show_ranked(self, table, filters):
         """
-        Fetches and displays all data from the 'in450a' table in the Treeview.
+        Shows the rows of in450a whose Info matches the words= or info= filters in virtual
+        mode, the best matches first and each match in Info marked with
+        business_layer.MATCH_START and MATCH_END.
+
+        Parameters:
+            table : (str)
+                The name of the table to show, in450a.
+            filters : (dict)
+                BusinessLayer search filters including words= or info=.
         """
-        data = self.business_layer.get_in450a_data()
-        self.display_data(data, ['Time', 'Source', 'Destination', 'Protocol', 'Length', 'Info']) 
+        columns = headings(table, self.business_layer.registry)
+
+        def done(total):
+            self.display_virtual(total, columns, lambda offset, limit: self.business_layer.search_info(filters, limit, offset))
+            self.set_headings(table, None, False)
+            self.view = view
 
-    def show_in450b_data(self):
+        self.display_data([], columns)
+        view = self.view = dict(table=table, filters=filters, sort=None, descending=False, held=None)
+        self.run_query(lambda progress: self.business_layer.get_row_count(table, filters), done)
+
+    def set_headings(self, table, sort, descending):
+        """
+        Makes the headers sort the table, with an arrow on the current sort column.
         """
-        Fetches and displays all data from the 'in450b' table in the Treeview.
+        from business_layer import table_columns
+
+        registry = self.business_layer.registry
+        for col, name in zip(headings(table, registry), table_columns(table, registry)):
+            arrow = (' \u25bc' if descending else ' \u25b2') if name == sort else ''
+            self.tree.heading(col, text=col + arrow, command=lambda name=name: self.sort_by(name))
+
+    def display_held(self, view, held, ordered):
         """
-        data = self.business_layer.get_in450b_data()
-        self.display_data(data, ['First Name', 'Last Name', 'Email', 'Source IP', 'Destination IP'])
+        Shows a result held on the client in virtual mode, reading its pages by slicing it.
 
-    def show_in450c_data(self):
+        Parameters:
+            view : (dict)
+                The table, filters and sort order of the result.
+            held : (ColumnarResult)
+                The result in load order, which later sorts start from.
+            ordered : (ColumnarResult)
+                The result in the order of `view`.
         """
-        Fetches and displays all data from the 'in450c' table in the Treeview.
+        self.display_virtual(len(ordered), headings(view['table'], self.business_layer.registry),
+                             lambda offset, limit: ordered[offset:offset + limit])
+        self.set_headings(view['table'], view['sort'], view['descending'])
+        self.view = dict(view, held=held)
+
+    def sort_by(self, column):
         """
-        data = self.business_layer.get_in450c_data()
-        self.display_data(data, ['App ID', 'App Name', 'App Version', 'Source IP', 'Destination IP', 'DigSig'])
+        Re-runs the query for the table on screen ordered by `column`. Clicking the column
+        that is already sorted reverses the order.
+
+        Parameters:
+            column : (str)
+                The column to sort by, one of `table_columns(table)`.
+        """
+        if self.view is None:
+            return
+        descending = self.view['sort'] == column and not self.view['descending']
+        held = self.view['held']
+        if held is None:
+            self.show_table(self.view['table'], self.view['filters'], column, descending)
+            return
+        view = dict(self.view, sort=column, descending=descending)
+        self.run_query(lambda progress: held.sort(column, descending),
+                       lambda ordered: self.display_held(view, held, ordered))
+
+    def export_view(self):
+        """
+        Exports the table or search result currently shown, in its current order, to a
+        CSV, gzipped CSV or Parquet file chosen by the user. The rows are streamed from the
+        server straight to disk in the background, with the amount written shown below.
+        """
+        if self.view is None:
+            messagebox.showinfo("Export View", "Show a table or search result first.")
+            return
+        path = filedialog.asksaveasfilename(
+            title='Export View',
+            initialfile=f"{self.view['table']}.csv",
+            defaultextension='.csv',
+            filetypes=[('CSV', '*.csv'), ('Gzipped CSV', '*.csv.gz'), ('Parquet', '*.parquet')],
+        )
+        if not path:
+            return
+        fmt = 'parquet' if path.endswith('.parquet') else 'csv'
+        view = dict(self.view)
+
+        def work(progress):
+            return self.business_layer.export(
+                view['table'], path, view['filters'], view['sort'], view['descending'],
+                fmt=fmt, compress=path.endswith('.gz'),
+                progress=lambda written, rows: progress((written, rows))
+            )
+
+        def on_progress(payload):
+            written, rows = payload
+            self.status_text.set(f"Exporting... {max(rows - 1, 0):,} rows, {written / 1048576:,.1f} MB")   # Minus the header
+
+        def on_done(result):
+            self.status_text.set(f"Exported {result['rows']:,} rows to {path}")
+
+        self.run_query(work, on_done, on_progress, key='export')
 
     def display_data(self, data, columns):
         """
@@ -238,36 +1778,82 @@ class Application:
             columns : (list of str)
                 The column names to display as headers.
         """
-        # Clear the Treeview
+        # Leave virtual mode or the live tail and clear the Treeview
+        if self.tail is not None:
+            self.tail.stop()
+            self.tail = None
+        self.virtual.detach()
         self.tree.delete(*self.tree.get_children())
+        self.view = None
+        self.report_table = None
 
         # Set up columns and headers
         self.tree["columns"] = columns
         for col in columns:
-            self.tree.heading(col, text=col)
+            self.tree.heading(col, text=col, command='')
             self.tree.column(col, anchor=tk.W)
 
         # Insert data into Treeview
         for row in data:
             self.tree.insert('', tk.END, values=row)
+        self.status_text.set(f"{len(data):,} rows")
+
+    def append_rows(self, batch):
+        """
+        Appends a batch of streamed rows to the Treeview and updates the row count.
+
+        Parameters:
+            batch : (list of tuple)
+                Rows as yielded by the BusinessLayer `stream_*` methods.
+        """
+        for row in batch:
+            self.tree.insert('', tk.END, values=row)
+        self.status_text.set(f"Loading... {len(self.tree.get_children()):,} rows")
+
+    def display_virtual(self, total, columns, fetch_page):
+        """
+        Configures the Treeview like `display_data`, then shows a result of `total` rows
+        in virtual mode, fetching pages through `fetch_page` as the user scrolls.
+
+        Parameters:
+            total : (int)
+                The number of rows in the result.
+            columns : (list of str)
+                The column names to display as headers.
+            fetch_page : (callable)
+                Called as fetch_page(offset, limit) to get the rows of a page.
+        """
+        self.display_data([], columns)
+        self.virtual.load(total, fetch_page)
             
     def action(self, event):
         """
-        Displays information about the selected row in the Treeview when a row is clicked.
+        Drills down into the in450a traffic of the selected row when it is a person or an
+        app and the user may read in450a; otherwise displays information about the row.
 
         Parameters:
         ----------
         event : tk.Event
             The event object from the Treeview row click.
         """
+        if not self.tree.selection():                               # Scrolling in virtual mode clears the selection
+            return
         focus = self.tree.focus()
         x = self.tree.item(focus).get('values')
-        messagebox.showinfo('Info', message='\n'.join(x))
+        if not x:                                                   # A virtual mode row whose page is loading
+            return
+        table = self.view['table'] if self.view else self.report_table
+        if table in ('in450b', 'in450c') and 'in450a' in self.tables and self.show_traffic(table, x):
+            return
+        messagebox.showinfo('Info', message='\n'.join(str(value) for value in x))
 
     def on_closing(self):
         """
         Closes the database connection and the main application window.
         """
+        if self.tail is not None:
+            self.tail.stop()
+        self.runner.shutdown()
         if self.business_layer:
             self.business_layer.close_connection()
-        self.destroy()
+        self.root.destroy()
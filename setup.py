@@ -3,13 +3,20 @@ from setuptools import setup, find_packages
 setup(
     name='database_application',
     version='0.1',
-    py_modules=['presentation_layer', 'business_layer', 'styles', 'main'],
+    py_modules=['presentation_layer', 'business_layer', 'bulk_loader', 'columnar', 'data_service', 'app_lookup', 'styles', 'main'],
     install_requires=[
         'psycopg2',
     ],
+    extras_require={
+        'parquet': ['pyarrow'],
+        'service': ['aiohttp>=3.9', 'aiopg'],
+    },
     entry_points={
         'console_scripts': [
-            'start_app = main:main'
+            'start_app = main:main',
+            'load_data = bulk_loader:main',
+            'data_service = data_service:main',
+            'lookup_apps = app_lookup:main'
         ]
     },
     package_data={
@@ -1,5 +1,19 @@
--- Import data into in450a
-\copy in450a (Time, source, destination, protocol, length, info) FROM '~/database-application/data/IN450A.csv' DELIMITER ',' CSV HEADER;
+-- Import data into in450a through a staging table: link-layer endpoints that are not IP
+-- addresses go to the name columns, and the partitions the capture needs are created first
+CREATE TEMP TABLE in450a_staging (Time NUMERIC, Source TEXT, Destination TEXT, Protocol TEXT, Length INTEGER, Info TEXT);
+
+\copy in450a_staging FROM '~/database-application/data/IN450A.csv' DELIMITER ',' CSV HEADER;
+
+SELECT in450a_create_partitions(ARRAY(SELECT DISTINCT floor(Time / 3600)::bigint FROM in450a_staging WHERE Time IS NOT NULL));
+
+INSERT INTO in450a (Time, Source, SourceName, Destination, DestinationName, Protocol, Length, Info)
+SELECT Time,
+       try_inet(Source), CASE WHEN try_inet(Source) IS NULL THEN Source END,
+       try_inet(Destination), CASE WHEN try_inet(Destination) IS NULL THEN Destination END,
+       Protocol, Length, Info
+FROM in450a_staging;
+
+DROP TABLE in450a_staging;
 
 -- Import data into in450b
 \copy in450b (first_name, last_name, email, source, destination) FROM '~/database-application/data/IN450B.csv' DELIMITER ',' CSV HEADER;
@@ -7,6 +21,9 @@
 -- Import data into in450c
 \copy in450c (AppID, AppName, AppVersion, source, destination, DigSig) FROM '~/database-application/data/IN450C.csv' DELIMITER ',' CSV HEADER;
 
+-- Build the in450a analytics views from the loaded data
+SELECT refresh_in450a_analytics();
+
 CREATE ROLE IN450a 
 LOGIN 
 PASSWORD 'D3fault_p@ssw0rd1';
@@ -23,10 +40,30 @@ GRANT SELECT
 ON in450a, in450b, in450c
 TO IN450a;
 
+GRANT SELECT
+ON in450a_protocol_stats, in450a_source_stats, in450a_destination_stats, in450a_host_traffic
+TO IN450a;
+
+REVOKE EXECUTE
+ON FUNCTION refresh_in450a_analytics()
+FROM PUBLIC;
+
+GRANT EXECUTE
+ON FUNCTION refresh_in450a_analytics()
+TO IN450a;
+
+REVOKE EXECUTE
+ON FUNCTION in450a_host_traffic_recount(INET[]), rebuild_in450a_host_traffic()
+FROM PUBLIC;
+
 GRANT SELECT
 ON in450b
 TO IN450b;
 
+GRANT SELECT
+ON app_tables
+TO PUBLIC;
+
 GRANT SELECT
 ON in450c
 TO IN450c;
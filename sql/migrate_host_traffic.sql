@@ -0,0 +1,112 @@
+-- Adds in450a_host_traffic, the per-address traffic totals read by the in450b and in450c
+-- traffic reports, with the triggers keeping it up to date, to a database whose schema
+-- predates it, and fills it from the packets already in in450a. Run it once as the owner
+-- of in450a:
+--     psql -d <database> -f sql/migrate_host_traffic.sql
+BEGIN;
+
+-- Packets and bytes sent or received by each address seen in in450a, and when it was first
+-- and last seen. The traffic report of in450b and in450c reads these totals instead of
+-- aggregating the capture per row. The triggers below keep them up to date: inserted
+-- packets are added to the totals of their addresses, while updated and deleted ones make
+-- the totals of the addresses they touch be counted again from in450a, as first and last
+-- seen cannot be taken back. A packet between an address and itself counts once.
+CREATE TABLE in450a_host_traffic(
+address INET PRIMARY KEY,
+packets BIGINT NOT NULL,
+bytes BIGINT NOT NULL,
+first_seen NUMERIC(16, 6),
+last_seen NUMERIC(16, 6)
+);
+
+CREATE OR REPLACE FUNCTION in450a_host_traffic_add() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO in450a_host_traffic AS total (address, packets, bytes, first_seen, last_seen)
+    SELECT endpoint.address, COUNT(*), COALESCE(SUM(added.Length), 0), MIN(added.Time), MAX(added.Time)
+    FROM added_rows added
+    CROSS JOIN LATERAL (VALUES (added.Source), (NULLIF(added.Destination, added.Source))) AS endpoint(address)
+    WHERE endpoint.address IS NOT NULL
+    GROUP BY endpoint.address
+    ON CONFLICT (address) DO UPDATE SET
+        packets = total.packets + EXCLUDED.packets,
+        bytes = total.bytes + EXCLUDED.bytes,
+        first_seen = LEAST(total.first_seen, EXCLUDED.first_seen),
+        last_seen = GREATEST(total.last_seen, EXCLUDED.last_seen);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+CREATE OR REPLACE FUNCTION in450a_host_traffic_recount(addresses INET[]) RETURNS void AS $$
+    DELETE FROM in450a_host_traffic WHERE address = ANY(addresses);
+    INSERT INTO in450a_host_traffic (address, packets, bytes, first_seen, last_seen)
+    SELECT wanted.address, total.packets, total.bytes, total.first_seen, total.last_seen
+    FROM unnest(addresses) AS wanted(address)
+    CROSS JOIN LATERAL (
+        SELECT COUNT(*) AS packets, COALESCE(SUM(Length), 0) AS bytes, MIN(Time) AS first_seen, MAX(Time) AS last_seen
+        FROM in450a
+        WHERE Source = wanted.address OR Destination = wanted.address
+    ) AS total
+    WHERE wanted.address IS NOT NULL AND total.packets > 0;
+$$ LANGUAGE sql SECURITY DEFINER SET search_path = public;
+
+CREATE OR REPLACE FUNCTION in450a_host_traffic_remove() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'UPDATE' THEN
+        PERFORM in450a_host_traffic_recount(ARRAY(
+            SELECT Source FROM removed_rows UNION SELECT Destination FROM removed_rows
+            UNION SELECT Source FROM added_rows UNION SELECT Destination FROM added_rows
+        ));
+    ELSE
+        PERFORM in450a_host_traffic_recount(ARRAY(
+            SELECT Source FROM removed_rows UNION SELECT Destination FROM removed_rows
+        ));
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+CREATE OR REPLACE FUNCTION in450a_host_traffic_clear() RETURNS trigger AS $$
+BEGIN
+    TRUNCATE in450a_host_traffic;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+-- Counts every total again from in450a, e.g. after loading with the triggers disabled
+CREATE OR REPLACE FUNCTION rebuild_in450a_host_traffic() RETURNS void AS $$
+    TRUNCATE in450a_host_traffic;
+    INSERT INTO in450a_host_traffic (address, packets, bytes, first_seen, last_seen)
+    SELECT endpoint.address, COUNT(*), COALESCE(SUM(in450a.Length), 0), MIN(in450a.Time), MAX(in450a.Time)
+    FROM in450a
+    CROSS JOIN LATERAL (VALUES (in450a.Source), (NULLIF(in450a.Destination, in450a.Source))) AS endpoint(address)
+    WHERE endpoint.address IS NOT NULL
+    GROUP BY endpoint.address;
+$$ LANGUAGE sql SECURITY DEFINER SET search_path = public;
+
+-- A trigger with transition tables can only fire on one kind of statement
+CREATE TRIGGER in450a_host_traffic_insert
+AFTER INSERT ON in450a REFERENCING NEW TABLE AS added_rows
+FOR EACH STATEMENT EXECUTE FUNCTION in450a_host_traffic_add();
+
+CREATE TRIGGER in450a_host_traffic_update
+AFTER UPDATE ON in450a REFERENCING OLD TABLE AS removed_rows NEW TABLE AS added_rows
+FOR EACH STATEMENT EXECUTE FUNCTION in450a_host_traffic_remove();
+
+CREATE TRIGGER in450a_host_traffic_delete
+AFTER DELETE ON in450a REFERENCING OLD TABLE AS removed_rows
+FOR EACH STATEMENT EXECUTE FUNCTION in450a_host_traffic_remove();
+
+CREATE TRIGGER in450a_host_traffic_truncate
+AFTER TRUNCATE ON in450a
+FOR EACH STATEMENT EXECUTE FUNCTION in450a_host_traffic_clear();
+
+SELECT rebuild_in450a_host_traffic();
+
+-- ----- Privileges ----- --
+GRANT SELECT ON in450a_host_traffic TO IN450a;
+
+REVOKE EXECUTE
+ON FUNCTION in450a_host_traffic_recount(INET[]), rebuild_in450a_host_traffic()
+FROM PUBLIC;
+
+COMMIT;
@@ -0,0 +1,148 @@
+-- Migrates a database created with the earlier schema.sql, whose addresses were VARCHAR(17)
+-- and whose in450a was a single table, to INET addresses and an in450a partitioned by Time.
+-- Keeps every row and id. Run it once as the owner of the tables:
+--     psql -d <database> -f sql/migrate_inet_partitions.sql
+-- then VACUUM ANALYZE. in450a rows without a Time cannot be placed in a partition and are
+-- kept in in450a_untimed for review instead.
+BEGIN;
+
+-- ----- Functions ----- --
+CREATE OR REPLACE FUNCTION try_inet(value TEXT) RETURNS inet AS $$
+BEGIN
+    RETURN value::inet;
+EXCEPTION WHEN invalid_text_representation THEN
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql IMMUTABLE;
+
+CREATE OR REPLACE FUNCTION in450a_create_partitions(buckets BIGINT[], width INTEGER DEFAULT 3600, max_new INTEGER DEFAULT 1000)
+RETURNS integer AS $$
+DECLARE
+    missing BIGINT[];
+    bucket BIGINT;
+    part_name TEXT;
+BEGIN
+    SELECT COALESCE(array_agg(DISTINCT b), '{}') INTO missing
+    FROM unnest(buckets) AS b
+    WHERE b IS NOT NULL AND to_regclass(quote_ident(format('in450a_p%s', b * width))) IS NULL;
+    IF cardinality(missing) > max_new THEN
+        RAISE EXCEPTION 'in450a_create_partitions would create % partitions, more than %; check the Time values for outliers',
+            cardinality(missing), max_new;
+    END IF;
+    FOREACH bucket IN ARRAY missing LOOP
+        part_name := format('in450a_p%s', bucket * width);
+        EXECUTE format('CREATE TABLE %I (LIKE in450a INCLUDING DEFAULTS INCLUDING GENERATED)', part_name);
+        EXECUTE format(
+            'ALTER TABLE in450a ATTACH PARTITION %I FOR VALUES FROM (%s) TO (%s)',
+            part_name, bucket * width, (bucket + 1) * width
+        );
+    END LOOP;
+    RETURN cardinality(missing);
+END;
+$$ LANGUAGE plpgsql SET search_path = public;
+
+-- ----- in450a ----- --
+-- The analytics views depend on in450a and are rebuilt at the end
+DROP MATERIALIZED VIEW IF EXISTS in450a_protocol_stats;
+DROP MATERIALIZED VIEW IF EXISTS in450a_source_stats;
+DROP MATERIALIZED VIEW IF EXISTS in450a_destination_stats;
+
+-- Move the old table out of the way, freeing the names of its key and id sequence
+ALTER TABLE in450a RENAME TO in450a_old;
+ALTER TABLE in450a_old RENAME CONSTRAINT in450a_pkey TO in450a_old_pkey;
+ALTER TABLE in450a_old ALTER COLUMN id DROP IDENTITY;
+DROP TRIGGER IF EXISTS in450a_changed ON in450a_old;
+DROP INDEX IF EXISTS in450a_source_idx, in450a_destination_idx, in450a_time_brin,
+    in450a_time_sort_idx, in450a_source_sort_idx, in450a_destination_sort_idx,
+    in450a_protocol_sort_idx, in450a_length_sort_idx;
+
+CREATE TABLE in450a(
+id BIGSERIAL,
+Time NUMERIC(16, 6) NOT NULL,
+Source INET,
+SourceName VARCHAR(32),
+Destination INET,
+DestinationName VARCHAR(32),
+Protocol VARCHAR(10),
+Length INTEGER,
+Info TEXT,
+PRIMARY KEY (id, Time)
+) PARTITION BY RANGE (Time);
+
+SELECT in450a_create_partitions(ARRAY(SELECT DISTINCT floor(Time / 3600)::bigint FROM in450a_old WHERE Time IS NOT NULL));
+
+INSERT INTO in450a (id, Time, Source, SourceName, Destination, DestinationName, Protocol, Length, Info)
+SELECT id, Time,
+       try_inet(Source), CASE WHEN try_inet(Source) IS NULL THEN Source END,
+       try_inet(Destination), CASE WHEN try_inet(Destination) IS NULL THEN Destination END,
+       Protocol, Length, Info
+FROM in450a_old
+WHERE Time IS NOT NULL;
+
+CREATE TABLE in450a_untimed AS SELECT * FROM in450a_old WHERE Time IS NULL;
+
+-- New rows continue after the ids that were copied
+SELECT setval('in450a_id_seq', COALESCE((SELECT MAX(id) FROM in450a_old), 0) + 1, false);
+
+DROP TABLE in450a_old;
+
+-- Creating the indexes after the copy is faster than maintaining them during it
+CREATE INDEX in450a_source_idx ON in450a USING SPGIST (Source inet_ops);
+CREATE INDEX in450a_destination_idx ON in450a USING SPGIST (Destination inet_ops);
+CREATE INDEX in450a_time_brin ON in450a USING BRIN (Time);
+CREATE INDEX in450a_time_sort_idx ON in450a (Time, id);
+CREATE INDEX in450a_source_sort_idx ON in450a (Source, id);
+CREATE INDEX in450a_destination_sort_idx ON in450a (Destination, id);
+CREATE INDEX in450a_protocol_sort_idx ON in450a (Protocol, id);
+CREATE INDEX in450a_length_sort_idx ON in450a (Length, id);
+
+CREATE TRIGGER in450a_changed
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON in450a
+FOR EACH STATEMENT EXECUTE FUNCTION notify_table_changed();
+
+-- ----- in450b and in450c ----- --
+-- These hold IP addresses only, so a value that is not one stops the migration
+DROP INDEX IF EXISTS in450b_source_idx, in450b_destination_idx, in450c_source_idx, in450c_destination_idx;
+
+ALTER TABLE in450b
+    ALTER COLUMN source TYPE INET USING source::inet,
+    ALTER COLUMN destination TYPE INET USING destination::inet;
+
+ALTER TABLE in450c
+    ALTER COLUMN source TYPE INET USING source::inet,
+    ALTER COLUMN destination TYPE INET USING destination::inet;
+
+CREATE INDEX in450b_source_idx ON in450b USING SPGIST (source inet_ops);
+CREATE INDEX in450b_destination_idx ON in450b USING SPGIST (destination inet_ops);
+CREATE INDEX in450c_source_idx ON in450c USING SPGIST (source inet_ops);
+CREATE INDEX in450c_destination_idx ON in450c USING SPGIST (destination inet_ops);
+
+-- ----- Analytics views ----- --
+CREATE MATERIALIZED VIEW in450a_protocol_stats AS
+SELECT Protocol, COUNT(*) AS packets, COALESCE(SUM(Length), 0) AS bytes
+FROM in450a
+GROUP BY Protocol;
+
+CREATE MATERIALIZED VIEW in450a_source_stats AS
+SELECT COALESCE(abbrev(Source), SourceName) AS address, COUNT(*) AS packets, COALESCE(SUM(Length), 0) AS bytes
+FROM in450a
+GROUP BY 1;
+
+CREATE MATERIALIZED VIEW in450a_destination_stats AS
+SELECT COALESCE(abbrev(Destination), DestinationName) AS address, COUNT(*) AS packets, COALESCE(SUM(Length), 0) AS bytes
+FROM in450a
+GROUP BY 1;
+
+CREATE UNIQUE INDEX in450a_protocol_stats_idx ON in450a_protocol_stats (Protocol);
+CREATE UNIQUE INDEX in450a_source_stats_idx ON in450a_source_stats (address);
+CREATE UNIQUE INDEX in450a_destination_stats_idx ON in450a_destination_stats (address);
+CREATE INDEX in450a_source_stats_packets_idx ON in450a_source_stats (packets DESC);
+CREATE INDEX in450a_destination_stats_packets_idx ON in450a_destination_stats (packets DESC);
+
+-- ----- Privileges ----- --
+-- The old table and views took their grants with them
+GRANT SELECT
+ON in450a, in450a_protocol_stats, in450a_source_stats, in450a_destination_stats
+TO IN450a;
+
+COMMIT;
@@ -0,0 +1,17 @@
+-- Adds the Info search to a database whose schema predates it: the pg_trgm extension, the
+-- generated InfoTokens column of in450a and the two GIN indexes serving the info= and
+-- words= filters. Run it once as the owner of in450a:
+--     psql -d <database> -f sql/migrate_info_search.sql
+-- Adding a stored generated column rewrites every in450a partition, so expect it to take
+-- about as long as reloading the capture, and run it outside working hours.
+BEGIN;
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+ALTER TABLE in450a
+    ADD COLUMN InfoTokens TSVECTOR GENERATED ALWAYS AS (to_tsvector('simple', COALESCE(Info, ''))) STORED;
+
+CREATE INDEX in450a_info_trgm_idx ON in450a USING GIN (Info gin_trgm_ops);
+CREATE INDEX in450a_info_tokens_idx ON in450a USING GIN (InfoTokens);
+
+COMMIT;
@@ -0,0 +1,6 @@
+-- Adds the in450c indexes serving BusinessLayer.lookup_in450c() and the lookup_apps command
+-- to a database whose schema predates them. They are built without blocking writes, so
+-- this runs outside a transaction:
+--     psql -d <database> -f sql/migrate_lookup_indexes.sql
+CREATE INDEX CONCURRENTLY IF NOT EXISTS in450c_digsig_idx ON in450c USING HASH (DigSig);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS in450c_app_id_lookup_idx ON in450c (AppID);
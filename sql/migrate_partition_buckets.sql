@@ -0,0 +1,36 @@
+-- Replaces the in450a_create_partitions(low, high) of an earlier schema.sql, which made a
+-- partition for every hour between the two, with the version that is given the hours the
+-- rows fall into and attaches partitions without blocking in450a's readers:
+--     psql -d <database> -f sql/migrate_partition_buckets.sql
+-- Empty partitions left behind by the earlier version can be dropped by hand.
+BEGIN;
+
+DROP FUNCTION IF EXISTS in450a_create_partitions(NUMERIC, NUMERIC, INTEGER);
+
+CREATE OR REPLACE FUNCTION in450a_create_partitions(buckets BIGINT[], width INTEGER DEFAULT 3600, max_new INTEGER DEFAULT 1000)
+RETURNS integer AS $$
+DECLARE
+    missing BIGINT[];
+    bucket BIGINT;
+    part_name TEXT;
+BEGIN
+    SELECT COALESCE(array_agg(DISTINCT b), '{}') INTO missing
+    FROM unnest(buckets) AS b
+    WHERE b IS NOT NULL AND to_regclass(quote_ident(format('in450a_p%s', b * width))) IS NULL;
+    IF cardinality(missing) > max_new THEN
+        RAISE EXCEPTION 'in450a_create_partitions would create % partitions, more than %; check the Time values for outliers',
+            cardinality(missing), max_new;
+    END IF;
+    FOREACH bucket IN ARRAY missing LOOP
+        part_name := format('in450a_p%s', bucket * width);
+        EXECUTE format('CREATE TABLE %I (LIKE in450a INCLUDING DEFAULTS INCLUDING GENERATED)', part_name);
+        EXECUTE format(
+            'ALTER TABLE in450a ATTACH PARTITION %I FOR VALUES FROM (%s) TO (%s)',
+            part_name, bucket * width, (bucket + 1) * width
+        );
+    END LOOP;
+    RETURN cardinality(missing);
+END;
+$$ LANGUAGE plpgsql SET search_path = public;
+
+COMMIT;
@@ -0,0 +1,16 @@
+-- Adds the app_tables registry the application discovers its tables from to a database
+-- whose schema predates it. Until then the application shows the tables it declares.
+--     psql -d <database> -f sql/migrate_table_registry.sql
+CREATE TABLE IF NOT EXISTS app_tables(
+name TEXT PRIMARY KEY,
+label TEXT NOT NULL,
+position INTEGER NOT NULL DEFAULT 0
+);
+
+INSERT INTO app_tables (name, label, position) VALUES
+('in450a', 'IN450a', 1),
+('in450b', 'IN450b', 2),
+('in450c', 'IN450c', 3)
+ON CONFLICT (name) DO NOTHING;
+
+GRANT SELECT ON app_tables TO PUBLIC;
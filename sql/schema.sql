@@ -1,29 +1,309 @@
+DROP MATERIALIZED VIEW IF EXISTS in450a_protocol_stats;
+DROP MATERIALIZED VIEW IF EXISTS in450a_source_stats;
+DROP MATERIALIZED VIEW IF EXISTS in450a_destination_stats;
+DROP TABLE IF EXISTS in450a_host_traffic;
 DROP TABLE IF EXISTS in450a;
 DROP TABLE IF EXISTS in450b;
 DROP TABLE IF EXISTS in450c;
+DROP TABLE IF EXISTS app_tables;
+DROP FUNCTION IF EXISTS in450a_create_partitions(NUMERIC, NUMERIC, INTEGER);
 
+-- Trigram indexes for the info= substring search of in450a's Info
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+-- Addresses are INET so IPv6 fits and CIDR containment (<<=) can use an index. Time is the
+-- capture time in seconds, kept exact to the microsecond as in the capture files.
+-- Link-layer frames such as ARP name their endpoints by vendor and MAC ('Apple_7e:1e:d4',
+-- 'Broadcast') rather than by IP address; those names go to SourceName/DestinationName and
+-- leave the INET column NULL.
+-- in450a is partitioned by Time so that time-window queries only scan the partitions they
+-- overlap; in450a_create_partitions() below adds partitions as data arrives. The primary
+-- key has to include the partition key, but id alone is still unique as every partition
+-- draws it from the same sequence.
+-- InfoTokens holds the words of Info for the words= search. It uses the 'simple'
+-- configuration, which lowercases words but keeps them whole: packet summaries are not
+-- English, and stemming would merge flags and field names that analysts tell apart.
 CREATE TABLE in450a(
-Time DECIMAL,
-Source VARCHAR(17),
-Destination VARCHAR(17),
+id BIGSERIAL,
+Time NUMERIC(16, 6) NOT NULL,
+Source INET,
+SourceName VARCHAR(32),
+Destination INET,
+DestinationName VARCHAR(32),
 Protocol VARCHAR(10),
 Length INTEGER,
-Info TEXT
-);
+Info TEXT,
+InfoTokens TSVECTOR GENERATED ALWAYS AS (to_tsvector('simple', COALESCE(Info, ''))) STORED,
+PRIMARY KEY (id, Time)
+) PARTITION BY RANGE (Time);
 
 CREATE TABLE in450b(
+id BIGINT GENERATED ALWAYS AS IDENTITY PRIMARY KEY,
 first_name VARCHAR(50),
 last_name VARCHAR(50),
 email VARCHAR(100),
-source VARCHAR(17),
-destination VARCHAR(17)
+source INET,
+destination INET
 );
 
 CREATE TABLE in450c(
+id BIGINT GENERATED ALWAYS AS IDENTITY PRIMARY KEY,
 AppID VARCHAR(100),
 AppName VARCHAR(100),
 AppVersion VARCHAR(10),
-source VARCHAR(17),
-destination VARCHAR(17),    
+source INET,
+destination INET,    
 DigSig VARCHAR(64)
 );
+
+-- The tables the application shows, in the order of their buttons. The application finds
+-- their columns and types in information_schema and asks has_table_privilege() which of
+-- them the user may read, so a new capture table only needs an `id` primary key, a row
+-- here and its grants. Tables the application does not know get a search filter per
+-- address, number and text column, named after the column.
+CREATE TABLE app_tables(
+name TEXT PRIMARY KEY,
+label TEXT NOT NULL,
+position INTEGER NOT NULL DEFAULT 0
+);
+
+INSERT INTO app_tables (name, label, position) VALUES
+('in450a', 'IN450a', 1),
+('in450b', 'IN450b', 2),
+('in450c', 'IN450c', 3);
+
+-- Returns `value` as an address, or NULL if it is not one (e.g. a link-layer name).
+-- Used to load and migrate text addresses; see data_and_roles.sql.
+CREATE OR REPLACE FUNCTION try_inet(value TEXT) RETURNS inet AS $$
+BEGIN
+    RETURN value::inet;
+EXCEPTION WHEN invalid_text_representation THEN
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql IMMUTABLE;
+
+-- Creates the missing in450a partitions for the capture time buckets `buckets`: bucket b
+-- covers Time in [b * width, (b + 1) * width) and its partition is named after its start,
+-- e.g. in450a_p3600 for [3600, 7200). Callers pass the distinct floor(Time / width) of the
+-- rows they are about to insert, so only partitions that will hold rows are made; existing
+-- partitions make it a cheap no-op. Rows whose Time has no partition are rejected, so
+-- loaders call this before inserting (bulk_loader.py does so for every chunk).
+-- Each partition is created as a table of its own and then attached, which only needs a
+-- SHARE UPDATE EXCLUSIVE lock on in450a, so queries and a load running on in450a go on.
+-- More than max_new missing partitions are refused, since they point at Time outliers.
+CREATE OR REPLACE FUNCTION in450a_create_partitions(buckets BIGINT[], width INTEGER DEFAULT 3600, max_new INTEGER DEFAULT 1000)
+RETURNS integer AS $$
+DECLARE
+    missing BIGINT[];
+    bucket BIGINT;
+    part_name TEXT;
+BEGIN
+    SELECT COALESCE(array_agg(DISTINCT b), '{}') INTO missing
+    FROM unnest(buckets) AS b
+    WHERE b IS NOT NULL AND to_regclass(quote_ident(format('in450a_p%s', b * width))) IS NULL;
+    IF cardinality(missing) > max_new THEN
+        RAISE EXCEPTION 'in450a_create_partitions would create % partitions, more than %; check the Time values for outliers',
+            cardinality(missing), max_new;
+    END IF;
+    FOREACH bucket IN ARRAY missing LOOP
+        part_name := format('in450a_p%s', bucket * width);
+        EXECUTE format('CREATE TABLE %I (LIKE in450a INCLUDING DEFAULTS INCLUDING GENERATED)', part_name);
+        EXECUTE format(
+            'ALTER TABLE in450a ATTACH PARTITION %I FOR VALUES FROM (%s) TO (%s)',
+            part_name, bucket * width, (bucket + 1) * width
+        );
+    END LOOP;
+    RETURN cardinality(missing);
+END;
+$$ LANGUAGE plpgsql SET search_path = public;
+
+-- Indexes serving the search bar's filters. SP-GiST indexes answer both the exact address
+-- and the CIDR containment (<<=) searches; the lower() pattern_ops B-trees answer the
+-- LIKE 'prefix%' name searches. BRIN suits Time since captures are appended in time order,
+-- so each partition's index stays tiny while still skipping most blocks of a time window.
+CREATE INDEX in450a_source_idx ON in450a USING SPGIST (Source inet_ops);
+CREATE INDEX in450a_destination_idx ON in450a USING SPGIST (Destination inet_ops);
+CREATE INDEX in450a_time_brin ON in450a USING BRIN (Time);
+
+-- Indexes serving the Info searches. The trigram index answers info= (ILIKE '%...%') for
+-- values of three or more characters; the tsvector index answers words= (@@).
+CREATE INDEX in450a_info_trgm_idx ON in450a USING GIN (Info gin_trgm_ops);
+CREATE INDEX in450a_info_tokens_idx ON in450a USING GIN (InfoTokens);
+
+-- Indexes serving click-to-sort. Keyset pagination seeks on (sort column, id), so each
+-- sortable column of the large capture table gets an index ending in the primary key.
+-- The Protocol one also serves the protocol= search filter.
+CREATE INDEX in450a_time_sort_idx ON in450a (Time, id);
+CREATE INDEX in450a_source_sort_idx ON in450a (Source, id);
+CREATE INDEX in450a_destination_sort_idx ON in450a (Destination, id);
+CREATE INDEX in450a_protocol_sort_idx ON in450a (Protocol, id);
+CREATE INDEX in450a_length_sort_idx ON in450a (Length, id);
+
+CREATE INDEX in450b_first_name_idx ON in450b (lower(first_name) text_pattern_ops);
+CREATE INDEX in450b_last_name_idx ON in450b (lower(last_name) text_pattern_ops);
+CREATE INDEX in450b_email_idx ON in450b (lower(email) text_pattern_ops);
+CREATE INDEX in450b_source_idx ON in450b USING SPGIST (source inet_ops);
+CREATE INDEX in450b_destination_idx ON in450b USING SPGIST (destination inet_ops);
+
+CREATE INDEX in450c_app_id_idx ON in450c (lower(AppID) text_pattern_ops);
+CREATE INDEX in450c_app_name_idx ON in450c (lower(AppName) text_pattern_ops);
+CREATE INDEX in450c_source_idx ON in450c USING SPGIST (source inet_ops);
+CREATE INDEX in450c_destination_idx ON in450c USING SPGIST (destination inet_ops);
+
+-- Indexes serving the batch lookups of lookup_in450c(), which probe them once per value.
+-- DigSig is only ever compared whole, and a hash index stores a 4-byte hash of each
+-- 64-character signature instead of the signature itself. AppID keeps a B-tree, as the
+-- lower() index above cannot answer case-sensitive equality.
+CREATE INDEX in450c_digsig_idx ON in450c USING HASH (DigSig);
+CREATE INDEX in450c_app_id_lookup_idx ON in450c (AppID);
+
+-- Traffic analytics for in450a, aggregated once and read by the analytics panel instead of
+-- pulling every packet to the client. The unique indexes allow REFRESH ... CONCURRENTLY,
+-- so the views stay readable while they are being refreshed.
+CREATE MATERIALIZED VIEW in450a_protocol_stats AS
+SELECT Protocol, COUNT(*) AS packets, COALESCE(SUM(Length), 0) AS bytes
+FROM in450a
+GROUP BY Protocol;
+
+CREATE MATERIALIZED VIEW in450a_source_stats AS
+SELECT COALESCE(abbrev(Source), SourceName) AS address, COUNT(*) AS packets, COALESCE(SUM(Length), 0) AS bytes
+FROM in450a
+GROUP BY 1;
+
+CREATE MATERIALIZED VIEW in450a_destination_stats AS
+SELECT COALESCE(abbrev(Destination), DestinationName) AS address, COUNT(*) AS packets, COALESCE(SUM(Length), 0) AS bytes
+FROM in450a
+GROUP BY 1;
+
+CREATE UNIQUE INDEX in450a_protocol_stats_idx ON in450a_protocol_stats (Protocol);
+CREATE UNIQUE INDEX in450a_source_stats_idx ON in450a_source_stats (address);
+CREATE UNIQUE INDEX in450a_destination_stats_idx ON in450a_destination_stats (address);
+CREATE INDEX in450a_source_stats_packets_idx ON in450a_source_stats (packets DESC);
+CREATE INDEX in450a_destination_stats_packets_idx ON in450a_destination_stats (packets DESC);
+
+-- Refreshes the analytics views without blocking readers, then tells listening
+-- applications to drop their cached copies. Runs with the owner's rights so analysts can
+-- call it (see data_and_roles.sql); schedule it with pg_cron or let the app refresh it.
+CREATE OR REPLACE FUNCTION refresh_in450a_analytics() RETURNS void AS $$
+BEGIN
+    REFRESH MATERIALIZED VIEW CONCURRENTLY in450a_protocol_stats;
+    REFRESH MATERIALIZED VIEW CONCURRENTLY in450a_source_stats;
+    REFRESH MATERIALIZED VIEW CONCURRENTLY in450a_destination_stats;
+    PERFORM pg_notify('table_changed', 'in450a_analytics');
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+-- Packets and bytes sent or received by each address seen in in450a, and when it was first
+-- and last seen. The traffic report of in450b and in450c reads these totals instead of
+-- aggregating the capture per row. The triggers below keep them up to date: inserted
+-- packets are added to the totals of their addresses, while updated and deleted ones make
+-- the totals of the addresses they touch be counted again from in450a, as first and last
+-- seen cannot be taken back. A packet between an address and itself counts once.
+CREATE TABLE in450a_host_traffic(
+address INET PRIMARY KEY,
+packets BIGINT NOT NULL,
+bytes BIGINT NOT NULL,
+first_seen NUMERIC(16, 6),
+last_seen NUMERIC(16, 6)
+);
+
+CREATE OR REPLACE FUNCTION in450a_host_traffic_add() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO in450a_host_traffic AS total (address, packets, bytes, first_seen, last_seen)
+    SELECT endpoint.address, COUNT(*), COALESCE(SUM(added.Length), 0), MIN(added.Time), MAX(added.Time)
+    FROM added_rows added
+    CROSS JOIN LATERAL (VALUES (added.Source), (NULLIF(added.Destination, added.Source))) AS endpoint(address)
+    WHERE endpoint.address IS NOT NULL
+    GROUP BY endpoint.address
+    ON CONFLICT (address) DO UPDATE SET
+        packets = total.packets + EXCLUDED.packets,
+        bytes = total.bytes + EXCLUDED.bytes,
+        first_seen = LEAST(total.first_seen, EXCLUDED.first_seen),
+        last_seen = GREATEST(total.last_seen, EXCLUDED.last_seen);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+CREATE OR REPLACE FUNCTION in450a_host_traffic_recount(addresses INET[]) RETURNS void AS $$
+    DELETE FROM in450a_host_traffic WHERE address = ANY(addresses);
+    INSERT INTO in450a_host_traffic (address, packets, bytes, first_seen, last_seen)
+    SELECT wanted.address, total.packets, total.bytes, total.first_seen, total.last_seen
+    FROM unnest(addresses) AS wanted(address)
+    CROSS JOIN LATERAL (
+        SELECT COUNT(*) AS packets, COALESCE(SUM(Length), 0) AS bytes, MIN(Time) AS first_seen, MAX(Time) AS last_seen
+        FROM in450a
+        WHERE Source = wanted.address OR Destination = wanted.address
+    ) AS total
+    WHERE wanted.address IS NOT NULL AND total.packets > 0;
+$$ LANGUAGE sql SECURITY DEFINER SET search_path = public;
+
+CREATE OR REPLACE FUNCTION in450a_host_traffic_remove() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'UPDATE' THEN
+        PERFORM in450a_host_traffic_recount(ARRAY(
+            SELECT Source FROM removed_rows UNION SELECT Destination FROM removed_rows
+            UNION SELECT Source FROM added_rows UNION SELECT Destination FROM added_rows
+        ));
+    ELSE
+        PERFORM in450a_host_traffic_recount(ARRAY(
+            SELECT Source FROM removed_rows UNION SELECT Destination FROM removed_rows
+        ));
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+CREATE OR REPLACE FUNCTION in450a_host_traffic_clear() RETURNS trigger AS $$
+BEGIN
+    TRUNCATE in450a_host_traffic;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+-- Counts every total again from in450a, e.g. after loading with the triggers disabled
+CREATE OR REPLACE FUNCTION rebuild_in450a_host_traffic() RETURNS void AS $$
+    TRUNCATE in450a_host_traffic;
+    INSERT INTO in450a_host_traffic (address, packets, bytes, first_seen, last_seen)
+    SELECT endpoint.address, COUNT(*), COALESCE(SUM(in450a.Length), 0), MIN(in450a.Time), MAX(in450a.Time)
+    FROM in450a
+    CROSS JOIN LATERAL (VALUES (in450a.Source), (NULLIF(in450a.Destination, in450a.Source))) AS endpoint(address)
+    WHERE endpoint.address IS NOT NULL
+    GROUP BY endpoint.address;
+$$ LANGUAGE sql SECURITY DEFINER SET search_path = public;
+
+-- A trigger with transition tables can only fire on one kind of statement
+CREATE TRIGGER in450a_host_traffic_insert
+AFTER INSERT ON in450a REFERENCING NEW TABLE AS added_rows
+FOR EACH STATEMENT EXECUTE FUNCTION in450a_host_traffic_add();
+
+CREATE TRIGGER in450a_host_traffic_update
+AFTER UPDATE ON in450a REFERENCING OLD TABLE AS removed_rows NEW TABLE AS added_rows
+FOR EACH STATEMENT EXECUTE FUNCTION in450a_host_traffic_remove();
+
+CREATE TRIGGER in450a_host_traffic_delete
+AFTER DELETE ON in450a REFERENCING OLD TABLE AS removed_rows
+FOR EACH STATEMENT EXECUTE FUNCTION in450a_host_traffic_remove();
+
+CREATE TRIGGER in450a_host_traffic_truncate
+AFTER TRUNCATE ON in450a
+FOR EACH STATEMENT EXECUTE FUNCTION in450a_host_traffic_clear();
+
+-- Tell listening applications which table changed so they can drop cached results
+CREATE OR REPLACE FUNCTION notify_table_changed() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('table_changed', TG_TABLE_NAME);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER in450a_changed
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON in450a
+FOR EACH STATEMENT EXECUTE FUNCTION notify_table_changed();
+
+CREATE TRIGGER in450b_changed
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON in450b
+FOR EACH STATEMENT EXECUTE FUNCTION notify_table_changed();
+
+CREATE TRIGGER in450c_changed
+AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON in450c
+FOR EACH STATEMENT EXECUTE FUNCTION notify_table_changed();
@@ -0,0 +1,11 @@
+# tests/__init__.py
+"""
+Author          :   Alexander Shelton
+Date            :   October 2024
+Name            :   Database Application
+Description     :   Unit tests of the application's modules.
+
+Run them with `python -m pytest -q` from the repository root. The tests that need a
+PostgreSQL server read its location from the DB_* environment variables, like the
+application, and are skipped when none answers.
+"""
@@ -0,0 +1,49 @@
+# tests/conftest.py
+"""
+Author          :   Alexander Shelton
+Date            :   October 2024
+Name            :   Database Application
+Description     :   Fixtures shared by the tests.
+"""
+# ----- Imports ----- #
+import os
+import sys
+import pytest
+
+# The application's modules live in the repository root, next to this package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Seconds to wait for a server before the tests that need one are skipped
+CONNECT_TIMEOUT = 2
+
+def database_credentials():
+    """
+    Returns the (user, password) the tests log in with, from DB_USER and DB_PASSWORD.
+    """
+    return os.getenv('DB_USER', 'postgres'), os.getenv('DB_PASSWORD', '')
+
+@pytest.fixture
+def credentials():
+    """
+    The (user, password) the tests log in with, see `database_credentials`.
+    """
+    return database_credentials()
+
+@pytest.fixture
+def database():
+    """
+    Yields a psycopg2 connection to the server of the DB_* environment variables, inside
+    a transaction that is rolled back afterwards. Skips the test when no server answers.
+    """
+    import psycopg2
+    from business_layer import connection_args
+
+    try:
+        conn = psycopg2.connect(connect_timeout=CONNECT_TIMEOUT, **connection_args(*database_credentials()))
+    except psycopg2.OperationalError as e:
+        pytest.skip(f"No PostgreSQL server: {str(e).strip()}")
+    try:
+        yield conn
+    finally:
+        conn.rollback()
+        conn.close()
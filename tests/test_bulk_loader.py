@@ -0,0 +1,127 @@
+# tests/test_bulk_loader.py
+"""
+Author          :   Alexander Shelton
+Date            :   October 2024
+Name            :   Database Application
+Description     :   Tests of the validation and chunked COPY of the bulk loader.
+"""
+# ----- Imports ----- #
+import io
+import csv
+import psycopg2
+from concurrent.futures import ThreadPoolExecutor
+import bulk_loader
+from bulk_loader import MAX_CAPTURE_TIME, TABLE_SPECS, RejectFile, copy_chunk, read_chunks
+
+IN450B = """first_name,last_name,email,source,destination
+Ann,Lee,ann@example.com,10.0.0.1,10.0.0.2
+Bob,Ray,bob@example.com,10.0.0.3
+
+Cy,Oh,cy@example.com,10.0.0.4,not-an-ip
+Di,Wu,di@example.com,,10.0.0.5
+Ed,Ng,ed@example.com,fe80::1,10.0.0.6
+"""
+
+class FakeCursor:
+    """
+    A cursor whose COPY fails with a DataError when the data holds a row with 'bad' in it,
+    and which records the statements it is given.
+    """
+    def __init__(self):
+        self.statements = []
+        self.copied = []
+
+    def execute(self, statement, params=None):
+        self.statements.append(statement)
+
+    def copy_expert(self, statement, buffer):
+        rows = list(csv.reader(buffer))
+        if any('bad' in field for row in rows for field in row):
+            raise psycopg2.DataError("invalid input syntax for type integer: \"bad\"\nCONTEXT: COPY t")
+        self.copied += rows
+
+def read_rejects(rejects):
+    rejects.close()
+    with open(rejects.path, newline='', encoding='utf-8') as file:
+        return list(csv.reader(file))[1:]
+
+# ----- read_chunks ----- #
+def test_read_chunks(tmp_path):
+    reader = csv.reader(io.StringIO(IN450B))
+    next(reader)
+    rejects = RejectFile(str(tmp_path / 'rejects.csv'))
+    chunks = list(read_chunks(reader, TABLE_SPECS['in450b'], rejects, chunk_size=2))
+    assert [[line for line, _ in chunk] for chunk in chunks] == [[2, 6], [7]]
+    assert chunks[0][1][1] == ['Di', 'Wu', 'di@example.com', '', '10.0.0.5']
+    assert read_rejects(rejects) == [
+        ['3', 'expected 5 fields, got 4', 'Bob', 'Ray', 'bob@example.com', '10.0.0.3'],
+        ['5', "not an IP address: 'not-an-ip'", 'Cy', 'Oh', 'cy@example.com', '10.0.0.4', 'not-an-ip'],
+    ]
+
+def test_read_chunks_rejects_capture_times(tmp_path):
+    rows = [['NaN', '10.0.0.1', '10.0.0.2', 'TCP', '60', ''], ['1e100', '10.0.0.1', '10.0.0.2', 'TCP', '60', ''],
+            ['-1', '10.0.0.1', '10.0.0.2', 'TCP', '60', ''], ['0.5', 'Broadcast', '10.0.0.2', 'ARP', '42', '']]
+    reader = csv.reader(io.StringIO(''.join(','.join(row) + '\n' for row in rows)))
+    rejects = RejectFile(str(tmp_path / 'rejects.csv'))
+    chunks = list(read_chunks(reader, TABLE_SPECS['in450a'], rejects, chunk_size=10))
+    assert [line for line, _ in chunks[0]] == [4]
+    assert [row[1].split(':')[0] for row in read_rejects(rejects)] == [
+        'not a finite number', 'too large for NUMERIC(16, 6)', f'outside the capture window 0..{MAX_CAPTURE_TIME}',
+    ]
+
+# ----- copy_chunk ----- #
+def test_copy_chunk_loads_good_chunk(tmp_path):
+    cursor = FakeCursor()
+    rejects = RejectFile(str(tmp_path / 'rejects.csv'))
+    chunk = [(line, [str(line)]) for line in range(1, 5)]
+    assert copy_chunk(cursor, 'COPY t FROM STDIN', chunk, rejects) == 4
+    assert cursor.statements == ["SAVEPOINT chunk;", "RELEASE SAVEPOINT chunk;"]
+    assert rejects.count == 0
+
+def test_copy_chunk_bisects_to_the_bad_rows(tmp_path):
+    cursor = FakeCursor()
+    rejects = RejectFile(str(tmp_path / 'rejects.csv'))
+    chunk = [(line, ['bad' if line in (3, 8) else str(line)]) for line in range(1, 9)]
+    assert copy_chunk(cursor, 'COPY t FROM STDIN', chunk, rejects) == 6
+    assert cursor.copied == [[str(line)] for line in (1, 2, 4, 5, 6, 7)]
+    assert read_rejects(rejects) == [
+        ['3', 'invalid input syntax for type integer: "bad"', 'bad'],
+        ['8', 'invalid input syntax for type integer: "bad"', 'bad'],
+    ]
+    # Every failed COPY is rolled back to its own savepoint
+    assert cursor.statements.count("SAVEPOINT chunk;") == 11
+    assert cursor.statements.count("ROLLBACK TO SAVEPOINT chunk;") == 7
+
+def test_copy_chunk_rejects_rows_as_read(tmp_path):
+    cursor = FakeCursor()
+    rejects = RejectFile(str(tmp_path / 'rejects.csv'))
+    chunk = [(1, ['a']), (2, ['b'])]
+    def transform(fields):
+        return [fields[0] * 2, 'bad' if fields[0] == 'b' else '']
+
+    assert copy_chunk(cursor, 'COPY t FROM STDIN', chunk, rejects, transform) == 1
+    assert cursor.copied == [['aa', '']]
+    assert [row[2:] for row in read_rejects(rejects)] == [['b']]
+
+def test_copy_chunk_on_the_server(database, tmp_path):
+    rejects = RejectFile(str(tmp_path / 'rejects.csv'))
+    chunk = [(1, ['1']), (2, ['x']), (3, ['3']), (4, ['99999999999'])]
+    with database.cursor() as cursor:
+        cursor.execute("CREATE TEMPORARY TABLE copied (n integer);")
+        assert copy_chunk(cursor, "COPY copied (n) FROM STDIN WITH (FORMAT csv);", chunk, rejects) == 2
+        cursor.execute("SELECT n FROM copied ORDER BY n;")
+        assert cursor.fetchall() == [(1,), (3,)]
+    assert [row[0] for row in read_rejects(rejects)] == ['2', '4']
+
+def test_main_splits_table_from_path_at_the_first_equals_sign(monkeypatch):
+    loaded = []
+
+    def load_table(table, path, *args):
+        loaded.append((table, path))
+        return {'table': table, 'loaded': 0, 'rejected': 0, 'seconds': 0, 'rejects': None}
+
+    monkeypatch.setattr(bulk_loader, 'ProcessPoolExecutor', ThreadPoolExecutor)
+    monkeypatch.setattr(bulk_loader, 'load_table', load_table)
+    monkeypatch.setenv('DB_PASSWORD', 'secret')
+    assert bulk_loader.main(['--user', 'IN450a', 'in450a=runs/a=1/IN450A.csv']) == 0
+    assert loaded == [('in450a', 'runs/a=1/IN450A.csv')]
@@ -0,0 +1,148 @@
+# tests/test_columnar.py
+"""
+Author          :   Alexander Shelton
+Date            :   October 2024
+Name            :   Database Application
+Description     :   Tests of the columnar result container.
+"""
+# ----- Imports ----- #
+import ipaddress
+import pytest
+from decimal import Decimal
+from columnar import AddressColumn, CategoryColumn, ColumnarResult, TextColumn
+
+ROWS = [
+    (Decimal('0.500000'), '10.0.0.1', '10.0.0.2', 'TCP', 60, 'SYN'),
+    (Decimal('1.250000'), '10.0.0.2', '10.0.0.1', 'TCP', None, 'SYN, ACK'),
+    (Decimal('2.000000'), 'fe80::1', 'ff02::1', 'ICMPv6', 86, 'Neighbor Solicitation'),
+    (Decimal('3.000000'), 'Apple_7e:1e:d4', 'Broadcast', 'ARP', 42, 'Who has 10.0.0.1?'),
+    (None, '192.168.1.5', '10.0.0.1', 'UDP', 1500, None),
+]
+
+def in450a(rows=ROWS, batch=2):
+    """
+    Returns a ColumnarResult of in450a rows, built in batches like a stream.
+    """
+    return ColumnarResult.from_batches('in450a', [rows[start:start + batch] for start in range(0, len(rows), batch)])
+
+def test_rows_round_trip():
+    result = in450a()
+    assert len(result) == len(ROWS)
+    assert list(result) == ROWS
+    assert result[1] == ROWS[1]
+    assert result[1:3] == ROWS[1:3]
+
+def test_column_types():
+    result = in450a()
+    assert isinstance(result.columns['protocol'], CategoryColumn)
+    assert isinstance(result.columns['source'], AddressColumn)
+    assert isinstance(result.columns['info'], TextColumn)
+
+def test_category_dictionary_codes():
+    column = CategoryColumn()
+    for value in ['TCP', 'UDP', 'TCP', None, 'UDP']:
+        column.append(value)
+    column.finish()
+    assert column.entries == ['TCP', 'UDP', None]
+    assert column.codes.typecode == 'B'
+    assert list(column.codes) == [0, 1, 0, 2, 1]
+    assert [column.value(position) for position in range(5)] == ['TCP', 'UDP', 'TCP', None, 'UDP']
+
+def test_category_codes_widen():
+    column = CategoryColumn()
+    for value in range(300):
+        column.append(str(value))
+    assert column.codes.typecode == 'H'
+    assert column.value(0) == '0'
+    assert column.value(299) == '299'
+
+def test_address_packing_ipv4():
+    column = AddressColumn()
+    for value in ['10.0.0.1', '192.168.1.5', '10.0.0.1']:
+        column.append(value)
+    assert column.width == 4
+    assert bytes(column.packed) == ipaddress.ip_address('10.0.0.1').packed + ipaddress.ip_address('192.168.1.5').packed
+    assert list(column.codes) == [0, 1, 0]
+    assert column.value(2) == '10.0.0.1'
+
+def test_address_packing_widens_for_ipv6():
+    column = AddressColumn()
+    for value in ['10.0.0.1', 'fe80::1']:
+        column.append(value)
+    assert column.width == 16
+    assert bytes(column.packed[:16]) == bytes(12) + ipaddress.ip_address('10.0.0.1').packed
+    assert bytes(column.packed[16:]) == ipaddress.ip_address('fe80::1').packed
+    assert [column.value(position) for position in range(2)] == ['10.0.0.1', 'fe80::1']
+
+def test_address_names_kept_as_text():
+    column = AddressColumn()
+    for value in ['Broadcast', '10.0.0.1', None]:
+        column.append(value)
+    assert list(column.versions) == [0, 4, 0]
+    assert column.labels == {0: 'Broadcast', 2: None}
+    assert [column.value(position) for position in range(3)] == ['Broadcast', '10.0.0.1', None]
+
+def test_sort_addresses_ipv4_before_ipv6_then_names():
+    sources = [row[1] for row in in450a().sort('source')]
+    assert sources == ['10.0.0.1', '10.0.0.2', '192.168.1.5', 'fe80::1', 'Apple_7e:1e:d4']
+
+def test_sort_nulls_last_ascending_first_descending():
+    result = in450a()
+    assert [row[4] for row in result.sort('length')] == [42, 60, 86, 1500, None]
+    assert [row[4] for row in result.sort('length', descending=True)] == [None, 1500, 86, 60, 42]
+    assert [row[0] for row in result.sort('time')][-1] is None
+    assert [row[5] for row in result.sort('info')] == ['Neighbor Solicitation', 'SYN', 'SYN, ACK', 'Who has 10.0.0.1?', None]
+
+def test_sort_ties_keep_load_order():
+    protocols = [(row[3], row[5]) for row in in450a().sort('protocol')]
+    assert protocols[2:4] == [('TCP', 'SYN'), ('TCP', 'SYN, ACK')]
+
+def test_sort_unknown_column():
+    with pytest.raises(ValueError):
+        in450a().sort('nope')
+
+def test_filter():
+    result = in450a()
+    assert [row[4] for row in result.filter({'protocol': 'TCP'})] == [60, None]
+    assert [row[4] for row in result.filter({'length': ('50', '100')})] == [60, 86]
+    assert [row[4] for row in result.filter({'length': (None, '60')})] == [60, 42]
+    assert [row[1] for row in result.filter({'source': '10.0.0.0/8'})] == ['10.0.0.1', '10.0.0.2']
+    assert [row[1] for row in result.filter({'source': 'fe80::/10'})] == ['fe80::1']
+    assert [row[0] for row in result.filter({'time': ('1', '2')})] == [Decimal('1.25'), Decimal('2')]
+    assert [row[4] for row in result.filter({'info': 'syn'})] == [60, None]
+    assert [row[4] for row in result.filter({'host': '10.0.0.1'})] == [60, None, 1500]
+
+def test_filter_then_sort_shares_columns():
+    result = in450a()
+    tcp = result.filter({'protocol': 'TCP'})
+    ordered = tcp.sort('info', descending=True)
+    assert tcp.columns is result.columns
+    assert [row[5] for row in ordered] == ['SYN, ACK', 'SYN']
+
+def test_filter_unknown():
+    with pytest.raises(ValueError):
+        in450a().filter({'nope': 'x'})
+    with pytest.raises(ValueError):
+        in450a().filter({'time': ('abc', None)})
+
+def test_filter_host_without_addresses():
+    assert [row[4] for row in in450a().filter({'host': ' ,10.0.0.1,'})] == [60, None, 1500]
+    with pytest.raises(ValueError, match="The host filter needs an address"):
+        in450a().filter({'host': ',,'})
+
+def test_memory_report():
+    result = in450a()
+    report = result.memory_report()
+    assert report['rows'] == len(ROWS)
+    assert report['columns'] == {name: column.nbytes() for name, column in result.columns.items()}
+    assert report['columnar_bytes'] == sum(report['columns'].values())
+    assert report['tuple_bytes'] > 0
+    assert report['ratio'] == report['tuple_bytes'] / report['columnar_bytes']
+
+def test_memory_report_counts_positions():
+    result = in450a()
+    tcp = result.filter({'protocol': 'TCP'})
+    report = tcp.memory_report()
+    assert report['rows'] == 2
+    assert report['columnar_bytes'] == result.memory_report()['columnar_bytes'] + tcp.positions.itemsize * 2
+    assert report['tuple_bytes'] == result.tuple_bytes * 2 // len(ROWS)
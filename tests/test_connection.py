@@ -0,0 +1,59 @@
+# tests/test_connection.py
+"""
+Author          :   Alexander Shelton
+Date            :   October 2024
+Name            :   Database Application
+Description     :   Tests of the connection arguments built for the database roles.
+"""
+# ----- Imports ----- #
+import types
+import pytest
+import business_layer
+from business_layer import BusinessLayer, QueryCache, QueryStats, connection_args
+
+class FakeConnection:
+    def __init__(self, **args):
+        self.args = args
+        self.closed = 0
+        self.info = types.SimpleNamespace(transaction_status=business_layer.extensions.TRANSACTION_STATUS_IDLE)
+
+    def close(self):
+        self.closed = 1
+
+@pytest.fixture
+def resolved(monkeypatch):
+    monkeypatch.setenv('DB_HOST', 'db.example.com')
+    monkeypatch.setenv('DB_PORT', '5433')
+    monkeypatch.setattr(business_layer, '_resolved', {('db.example.com', '5433'): '192.0.2.7'})
+
+def test_connection_args_from_environment(resolved, monkeypatch):
+    monkeypatch.setenv('DB_NAME', 'captures')
+    assert connection_args('IN450a', 'secret') == dict(
+        user='IN450a', password='secret', host='db.example.com', port='5433', database='captures',
+    )
+
+def test_only_the_login_uses_the_preresolved_address(resolved):
+    assert connection_args('IN450a', 'secret', preresolved=True)['hostaddr'] == '192.0.2.7'
+    assert 'hostaddr' not in connection_args('IN450a', 'secret')
+
+def test_preresolved_address_of_another_server_is_ignored(resolved, monkeypatch):
+    monkeypatch.setenv('DB_PORT', '5432')
+    assert 'hostaddr' not in connection_args('IN450a', 'secret', preresolved=True)
+
+def test_login_connects_to_the_preresolved_address_and_the_pool_does_not(resolved, monkeypatch):
+    connections = []
+
+    def connect(*args, **kwargs):
+        connections.append(FakeConnection(**kwargs))
+        return connections[-1]
+
+    monkeypatch.setattr(business_layer.psycopg2, 'connect', connect)
+    layer = BusinessLayer('IN450a', 'secret', pool_size=3, cache=QueryCache(max_bytes=0),
+                          stats=QueryStats(log_path=None))
+    login, *pooled = connections
+    assert login.args['hostaddr'] == '192.0.2.7' and login.closed
+    assert len(pooled) == 3 and all('hostaddr' not in conn.args for conn in pooled)
+
+    conn = layer.pool.getconn()
+    layer.pool.putconn(conn)
+    assert len(connections) == 4 and not conn.closed       # Returned connections are kept
@@ -0,0 +1,238 @@
+# tests/test_data_service.py
+"""
+Author          :   Alexander Shelton
+Date            :   October 2024
+Name            :   Database Application
+Description     :   Tests of the HTTP data service, served on a local port by aiohttp's test server.
+"""
+# ----- Imports ----- #
+import json
+import base64
+import asyncio
+import contextlib
+import pytest
+
+pytest.importorskip('aiohttp')
+pytest.importorskip('aiopg')
+
+from aiohttp import test_utils
+from business_layer import discover_tables
+import data_service
+from data_service import FETCH_ERROR, DataService, RolePools
+
+# Largest table whose rows are all streamed to compare them with its count
+MAX_STREAMED_ROWS = 50000
+
+class FakeCursor:
+    """
+    An aiopg cursor returning `batches` one FETCH at a time and failing the FETCH after
+    them, or the DECLARE when `fail_declare` is set.
+    """
+    def __init__(self, batches, fail_declare=False):
+        self.batches = list(batches)
+        self.fail_declare = fail_declare
+        self.statements = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def execute(self, statement, params=None):
+        text = statement if isinstance(statement, str) else repr(statement)
+        self.statements.append(text)
+        if 'DECLARE' in text and self.fail_declare:
+            raise RuntimeError("declare failed")
+        if 'FETCH' in text and not self.batches:
+            raise RuntimeError("server closed the connection unexpectedly")
+
+    async def fetchall(self):
+        return self.batches.pop(0)
+
+class FakeConnection:
+    def __init__(self, cursor):
+        self.closed = False
+        self._cursor = cursor
+
+    def cursor(self):
+        return self._cursor
+
+class FakePool:
+    def __init__(self, cursor):
+        self.conn = FakeConnection(cursor)
+
+    @contextlib.asynccontextmanager
+    async def acquire(self):
+        yield self.conn
+
+class FakePools:
+    """
+    Stands in for RolePools, letting every role in with the same pool and registry.
+    """
+    def __init__(self, pool):
+        self.pool = pool
+        self.registry = discover_tables([('in450b', 'IN450b', True, [])])
+
+    @contextlib.asynccontextmanager
+    async def use(self, user, password):
+        yield self.pool, self.registry
+
+    async def close(self):
+        pass
+
+class ClosablePool:
+    """
+    Stands in for the aiopg pool RolePools opens, recording whether it was closed.
+    """
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+    async def wait_closed(self):
+        pass
+
+@pytest.fixture
+def role_pools(monkeypatch):
+    """
+    RolePools whose pools are ClosablePools, closed as soon as they are idle.
+    """
+    async def create_pool(**args):
+        return ClosablePool()
+
+    async def registry(pool):
+        return {}
+
+    monkeypatch.setattr(data_service.aiopg, 'create_pool', create_pool)
+    monkeypatch.setattr(RolePools, '_registry', staticmethod(registry))
+    monkeypatch.setattr(data_service, 'SERVICE_IDLE_TIMEOUT', 0)
+    return RolePools()
+
+def basic_auth(user, password):
+    return {'Authorization': 'Basic ' + base64.b64encode(f'{user}:{password}'.encode()).decode()}
+
+async def fetch(service, path, headers=None):
+    """
+    Serves `service` on a local port, requests `path` and returns the status and body.
+    """
+    client = test_utils.TestClient(test_utils.TestServer(service.app()))
+    await client.start_server()
+    try:
+        response = await client.get(path, headers=headers or {})
+        return response.status, await response.text()
+    finally:
+        await client.close()
+
+def test_health():
+    assert asyncio.run(fetch(DataService(), '/health')) == (200, '{"status": "ok"}')
+
+def test_missing_credentials():
+    status, body = asyncio.run(fetch(DataService(), '/tables'))
+    assert status == 401
+    assert json.loads(body) == {'error': 'Login failed'}
+
+def test_failed_login_leaves_no_lock():
+    service = DataService()
+
+    async def attempts():
+        return await asyncio.gather(*(
+            fetch(service, '/tables', basic_auth('no_such_role_in450', 'wrong')) for _ in range(3)
+        ))
+
+    assert [status for status, _ in asyncio.run(attempts())] == [401, 401, 401]
+    assert service.pools.pools == {}
+    assert service.pools._locks == {}
+    assert service.pools._waiting == {}
+
+def test_pool_in_use_is_not_closed_as_idle(role_pools):
+    async def requests():
+        async with role_pools.use('IN450a', 'x') as (pool, _):
+            await role_pools.close_idle()               # e.g. during a long stream
+            assert not pool.closed and 'IN450a' in role_pools.pools
+        assert role_pools.in_use == {}
+        await role_pools.close_idle()
+        return pool
+
+    assert asyncio.run(requests()).closed
+    assert role_pools.pools == {} and role_pools.last_used == {} and role_pools._locks == {}
+
+def test_pool_taken_while_the_reaper_waits_is_kept(role_pools):
+    async def requests():
+        pool, _ = await role_pools.get('IN450a', 'x')
+        role_pools.release('IN450a')
+        async with role_pools._role_lock('IN450a'):
+            # The request is first in line for the lock, the reaper next
+            request = asyncio.ensure_future(role_pools.get('IN450a', 'x'))
+            await asyncio.sleep(0)
+            reaper = asyncio.ensure_future(role_pools.close_idle())
+            await asyncio.sleep(0)
+        await asyncio.gather(request, reaper)
+        return pool
+
+    assert not asyncio.run(requests()).closed
+    assert role_pools.in_use == {'IN450a': 1}
+
+def test_stream_error_after_rows_ends_with_error_line():
+    cursor = FakeCursor([[('Ann', 'Lee', 'ann@example.com', '10.0.0.1', '10.0.0.2')]])
+    service = DataService()
+    service.pools = FakePools(FakePool(cursor))
+    status, body = asyncio.run(fetch(service, '/tables/in450b/rows', basic_auth('IN450b', 'x')))
+    assert status == 200
+    assert [json.loads(line) for line in body.splitlines()] == [
+        {'first_name': 'Ann', 'last_name': 'Lee', 'email': 'ann@example.com', 'source': '10.0.0.1', 'destination': '10.0.0.2'},
+        {'error': FETCH_ERROR},
+    ]
+    assert cursor.statements[-1] == "ROLLBACK;"
+
+def test_stream_error_before_rows_sets_the_status():
+    cursor = FakeCursor([], fail_declare=True)
+    service = DataService()
+    service.pools = FakePools(FakePool(cursor))
+    status, body = asyncio.run(fetch(service, '/tables/in450b/rows', basic_auth('IN450b', 'x')))
+    assert status == 500
+    assert json.loads(body) == {'error': FETCH_ERROR}
+    assert cursor.statements[-1] == "ROLLBACK;"
+
+def test_unknown_table_and_filter():
+    service = DataService()
+    service.pools = FakePools(FakePool(FakeCursor([])))
+    status, _ = asyncio.run(fetch(service, '/tables/nope/rows', basic_auth('IN450b', 'x')))
+    assert status == 404
+    status, body = asyncio.run(fetch(service, '/tables/in450b/count?protocol=TCP', basic_auth('IN450b', 'x')))
+    assert status == 400
+    assert json.loads(body)['error'].startswith("in450b can be filtered by")
+
+def test_rows_match_count_on_the_server(database, credentials):
+    service = DataService()
+    headers = basic_auth(*credentials)
+
+    async def requests():
+        client = test_utils.TestClient(test_utils.TestServer(service.app()))
+        await client.start_server()
+        try:
+            response = await client.get('/tables', headers=headers)
+            assert response.status == 200
+            tables = await response.json()
+            if not tables:
+                return None
+            table, columns = next(iter(tables.items()))
+            response = await client.get(f'/tables/{table}/count', headers=headers)
+            count = (await response.json())['count']
+            if count > MAX_STREAMED_ROWS:
+                return None
+            response = await client.get(f'/tables/{table}/rows?sort={columns[0]}', headers=headers)
+            assert response.status == 200
+            assert response.headers['Content-Type'].startswith('application/x-ndjson')
+            lines = [json.loads(line) for line in (await response.text()).splitlines()]
+            return columns, count, lines
+        finally:
+            await client.close()
+
+    result = asyncio.run(requests())
+    if result is None:
+        pytest.skip("The server has no small table the role may read")
+    columns, count, lines = result
+    assert len(lines) == count
+    assert all(list(line) == columns for line in lines)
@@ -0,0 +1,127 @@
+# tests/test_export.py
+"""
+Author          :   Alexander Shelton
+Date            :   October 2024
+Name            :   Database Application
+Description     :   Tests of the streaming export of the BusinessLayer.
+"""
+# ----- Imports ----- #
+import io
+import gzip
+import contextlib
+import pytest
+import business_layer
+from business_layer import BusinessLayer, ExportWriter, QueryStats
+
+CSV = b'protocol,length\nTCP,60\nUDP,1500\n'
+
+class Clock:
+    """
+    A monotonic clock the tests move forward by hand.
+    """
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+class FakeCursor:
+    """
+    A cursor whose COPY writes `data` to the file it is given in chunks of `chunk` bytes,
+    and fails after them when `fail` is set.
+    """
+    def __init__(self, data, chunk=10, fail=False):
+        self.data = data
+        self.chunk = chunk
+        self.fail = fail
+        self.copies = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def mogrify(self, query, params=None):
+        return b'SELECT protocol, length FROM in450a'
+
+    def copy_expert(self, statement, file):
+        self.copies.append(statement)
+        for start in range(0, len(self.data), self.chunk):
+            file.write(self.data[start:start + self.chunk])
+        if self.fail:
+            raise RuntimeError("connection lost")
+
+class FakeConnection:
+    encoding_name = 'utf-8'
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def cursor(self):
+        return self._cursor
+
+def layer(cursor):
+    """
+    Returns a BusinessLayer whose only connection hands out `cursor`.
+    """
+    layer = BusinessLayer.__new__(BusinessLayer)
+    layer.user = 'IN450a'
+    layer.registry = None
+    layer.stats = QueryStats(log_path=None)
+
+    @contextlib.contextmanager
+    def connection():
+        yield FakeConnection(cursor)
+
+    layer._connection = connection
+    return layer
+
+# ----- ExportWriter ----- #
+def test_writer_counts_bytes_and_lines():
+    target = io.BytesIO()
+    writer = ExportWriter(target)
+    assert writer.write(b'a,b\n1,') == 6
+    writer.write(b'2\n')
+    assert target.getvalue() == b'a,b\n1,2\n'
+    assert (writer.bytes, writer.rows) == (8, 2)
+
+def test_writer_reports_progress_at_intervals(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(business_layer.time, 'monotonic', clock)
+    reports = []
+    writer = ExportWriter(io.BytesIO(), lambda nbytes, rows: reports.append((nbytes, rows)))
+    writer.write(b'a\n')
+    clock.now += business_layer.EXPORT_PROGRESS_INTERVAL
+    writer.write(b'b\n')
+    writer.write(b'c\n')
+    assert reports == [(4, 2)]
+
+# ----- export ----- #
+def test_export_csv(tmp_path):
+    cursor = FakeCursor(CSV)
+    path = tmp_path / 'in450a.csv'
+    assert layer(cursor).export('in450a', str(path)) == {'rows': 2, 'bytes': len(CSV)}
+    assert path.read_bytes() == CSV
+    assert cursor.copies == ["COPY (SELECT protocol, length FROM in450a) TO STDOUT WITH (FORMAT csv, HEADER)"]
+
+def test_export_is_recorded(tmp_path):
+    exporter = layer(FakeCursor(CSV))
+    exporter.export('in450a', str(tmp_path / 'in450a.csv'))
+    (entry,), _ = exporter.stats.snapshot()
+    assert (entry['name'], entry['rows'], entry['bytes']) == ('export[in450a]', 2, len(CSV))
+
+def test_export_gzip(tmp_path):
+    path = tmp_path / 'in450a.csv.gz'
+    layer(FakeCursor(CSV)).export('in450a', str(path), compress=True)
+    assert gzip.decompress(path.read_bytes()) == CSV
+
+def test_failed_export_removes_the_file(tmp_path):
+    path = tmp_path / 'in450a.csv'
+    with pytest.raises(Exception, match="An error occurred while exporting data"):
+        layer(FakeCursor(CSV, fail=True)).export('in450a', str(path))
+    assert not path.exists()
+
+def test_export_unknown_format(tmp_path):
+    with pytest.raises(ValueError, match="Unknown export format"):
+        layer(FakeCursor(CSV)).export('in450a', str(tmp_path / 'in450a.xlsx'), fmt='xlsx')
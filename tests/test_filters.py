@@ -0,0 +1,110 @@
+# tests/test_filters.py
+"""
+Author          :   Alexander Shelton
+Date            :   October 2024
+Name            :   Database Application
+Description     :   Tests of the search filters and of the conditions they become.
+"""
+# ----- Imports ----- #
+import pytest
+from decimal import Decimal
+from psycopg2 import sql
+from business_layer import BusinessLayer, escape_like, make_filters
+
+def render(composable):
+    """
+    Returns the text of a sql.Composable without a connection, quoting identifiers with
+    double quotes.
+    """
+    if isinstance(composable, sql.Composed):
+        return ''.join(render(part) for part in composable.seq)
+    if isinstance(composable, sql.Identifier):
+        return '.'.join(f'"{string}"' for string in composable.strings)
+    if isinstance(composable, sql.Literal):
+        return repr(composable.wrapped)
+    return composable.string
+
+def conditions(table, filters):
+    """
+    Returns the rendered conditions of `filters` and their parameters.
+    """
+    composed, params = BusinessLayer._conditions(table, filters)
+    return [render(condition) for condition in composed], params
+
+# ----- make_filters ----- #
+def test_make_filters_ranges():
+    filters = make_filters('in450a', [('length', '100..1500'), ('time', '..30'), ('protocol', 'TCP')])
+    assert filters == {'length': (100, 1500), 'time': (None, Decimal('30')), 'protocol': 'TCP'}
+    assert make_filters('in450a', [('length', '60')]) == {'length': (60, 60)}
+    assert make_filters('in450a', [('length', '60..')]) == {'length': (60, None)}
+
+@pytest.mark.parametrize('name, value', [
+    ('time', 'abc'), ('time', '1..x'), ('time', 'NaN'), ('time', '..Infinity'), ('length', '1.5'), ('length', 'ten..'),
+])
+def test_make_filters_rejects_bad_bounds(name, value):
+    with pytest.raises(ValueError, match=f"The {name} filter needs"):
+        make_filters('in450a', [(name, value)])
+
+def test_make_filters_unknown_filter():
+    with pytest.raises(ValueError, match="in450b can be filtered by: first_name, last_name"):
+        make_filters('in450b', [('protocol', 'TCP')])
+
+def test_make_filters_needs_a_value():
+    with pytest.raises(ValueError, match="needs a value"):
+        make_filters('in450a', [('protocol', '')])
+
+def test_make_filters_unknown_table():
+    with pytest.raises(ValueError, match="Unknown table"):
+        make_filters('nope', [])
+
+# ----- _conditions ----- #
+def test_conditions():
+    rendered, params = conditions('in450a', {
+        'protocol': 'TCP', 'length': ('100', None), 'time': ('0.5', '30'), 'source': '10.0.0.0/8',
+        'destination': '10.0.0.1', 'info': '100%_done', 'words': 'ack -syn',
+    })
+    assert rendered == [
+        '"protocol" = %s', '"length" >= %s', '"time" >= %s', '"time" <= %s', '"source" <<= %s::inet',
+        '"destination" = %s::inet', '"info" ILIKE %s', '"infotokens" @@ websearch_to_tsquery(\'simple\', %s)',
+    ]
+    assert params == ['TCP', 100, Decimal('0.5'), Decimal('30'), '10.0.0.0/8', '10.0.0.1', '%100\\%\\_done%', 'ack -syn']
+
+def test_conditions_prefix_ignores_case():
+    assert conditions('in450b', {'last_name': 'O_Br'}) == (['lower("last_name") LIKE %s'], ['o\\_br%'])
+
+def test_conditions_endpoint():
+    rendered, params = conditions('in450a', {'host': '10.0.0.1, fe80::/10'})
+    assert rendered == ['("source" = %s::inet OR "destination" = %s::inet'
+                        ' OR "source" <<= %s::inet OR "destination" <<= %s::inet)']
+    assert params == ['10.0.0.1', '10.0.0.1', 'fe80::/10', 'fe80::/10']
+
+def test_conditions_rejects_bad_values():
+    with pytest.raises(ValueError):
+        conditions('in450a', {'source': 'not-an-address'})
+    with pytest.raises(ValueError):
+        conditions('in450a', {'host': ' , '})
+    with pytest.raises(ValueError):
+        conditions('in450a', {'length': ('x', None)})
+    with pytest.raises(ValueError):
+        conditions('in450a', {'time': (None, 'abc')})
+
+def test_conditions_unknown():
+    with pytest.raises(ValueError, match="cannot be filtered by"):
+        conditions('in450a', {'nope': 'x'})
+    with pytest.raises(ValueError, match="Unknown table"):
+        conditions('nope', {})
+
+# ----- escape_like ----- #
+def test_escape_like():
+    assert escape_like('100%') == '100\\%'
+    assert escape_like('a_b') == 'a\\_b'
+    assert escape_like('C:\\temp') == 'C:\\\\temp'
+    assert escape_like('plain') == 'plain'
+
+def test_escape_like_on_the_server(database):
+    with database.cursor() as cursor:
+        cursor.execute(
+            "SELECT %s LIKE %s, %s LIKE %s, %s LIKE %s;",
+            ('100%', escape_like('100%'), '1000', escape_like('100%'), 'a\\b', escape_like('a\\b')),
+        )
+        assert cursor.fetchone() == (True, False, True)
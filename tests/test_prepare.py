@@ -0,0 +1,75 @@
+# tests/test_prepare.py
+"""
+Author          :   Alexander Shelton
+Date            :   October 2024
+Name            :   Database Application
+Description     :   Tests of the prepared statements of the BusinessLayer.
+"""
+# ----- Imports ----- #
+import weakref
+import hashlib
+import business_layer
+from business_layer import BusinessLayer
+
+class FakeConnection:
+    """
+    Stands in for a psycopg2 connection, which `_prepare` only uses as a key.
+    """
+
+class FakeCursor:
+    """
+    Records the statements it is given.
+    """
+    def __init__(self):
+        self.statements = []
+
+    def execute(self, statement, params=None):
+        self.statements.append(statement)
+
+def layer():
+    """
+    Returns a BusinessLayer without connections, enough for `_prepare`.
+    """
+    layer = BusinessLayer.__new__(BusinessLayer)
+    layer._statements = weakref.WeakKeyDictionary()
+    return layer
+
+def statement_name(query):
+    return f"app_{hashlib.md5(query.encode()).hexdigest()}"
+
+def test_placeholders_become_numbered_parameters():
+    query = "SELECT * FROM t WHERE a = %s AND b LIKE '10%%' AND c = %s;"
+    conn, cursor = FakeConnection(), FakeCursor()
+    execute = layer()._prepare(conn, cursor, query, ('x', 2))
+    name = statement_name(query)
+    assert cursor.statements == [f"PREPARE {name} AS SELECT * FROM t WHERE a = $1 AND b LIKE '10%' AND c = $2;"]
+    assert execute == (f"EXECUTE {name} (%s, %s);", ('x', 2))
+
+def test_statement_is_prepared_once_per_connection():
+    query = "SELECT count(*) FROM t;"
+    prepared, cursor = layer(), FakeCursor()
+    first, second = FakeConnection(), FakeConnection()
+    assert prepared._prepare(first, cursor, query, None) == (f"EXECUTE {statement_name(query)};", None)
+    prepared._prepare(first, cursor, query, ())
+    prepared._prepare(second, cursor, query, ())
+    assert len(cursor.statements) == 2
+
+def test_statements_are_deallocated_at_the_cap(monkeypatch):
+    monkeypatch.setattr(business_layer, 'PREPARED_MAX', 2)
+    prepared, conn, cursor = layer(), FakeConnection(), FakeCursor()
+    for number in range(3):
+        prepared._prepare(conn, cursor, f"SELECT {number};", None)
+    assert [statement.split(' AS ')[0] for statement in cursor.statements] == [
+        f"PREPARE {statement_name('SELECT 0;')}", f"PREPARE {statement_name('SELECT 1;')}", "DEALLOCATE ALL;",
+        f"PREPARE {statement_name('SELECT 2;')}",
+    ]
+    assert prepared._statements[conn] == {statement_name("SELECT 2;")}
+
+def test_prepared_statement_on_the_server(database):
+    prepared = layer()
+    query = "SELECT %s::int + %s::int, '100%%', %s::text;"
+    with database.cursor() as cursor:
+        cursor.execute(*prepared._prepare(database, cursor, query, (1, 2, '%s')))
+        assert cursor.fetchone() == (3, '100%', '%s')
+        cursor.execute(*prepared._prepare(database, cursor, query, (5, 5, 'again')))
+        assert cursor.fetchone() == (10, '100%', 'again')
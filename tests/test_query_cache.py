@@ -0,0 +1,101 @@
+# tests/test_query_cache.py
+"""
+Author          :   Alexander Shelton
+Date            :   October 2024
+Name            :   Database Application
+Description     :   Tests of the BusinessLayer's query result cache.
+"""
+# ----- Imports ----- #
+import pytest
+import business_layer
+from business_layer import QueryCache
+
+ROWS = [(1, 'a'), (2, 'b')]
+
+class Clock:
+    """
+    A monotonic clock the tests move forward by hand.
+    """
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(business_layer.time, 'monotonic', clock)
+    return clock
+
+def cache_for(entries, ttl=60):
+    """
+    Returns a cache whose budget holds `entries` results the size of ROWS, and a half more.
+    """
+    size = QueryCache.result_size(ROWS)
+    return QueryCache(max_bytes=entries * size + size // 2, ttl=ttl)
+
+def put(cache, key, value=ROWS, tables=('in450a',)):
+    cache.put(key, value, tables, cache.version(tables))
+
+def test_hit_and_miss(clock):
+    cache = cache_for(2)
+    assert cache.get('a') == (False, None)
+    put(cache, 'a')
+    assert cache.get('a') == (True, ROWS)
+    statistics = cache.statistics()
+    assert (statistics['hits'], statistics['misses'], statistics['entries']) == (1, 1, 1)
+    assert statistics['hit_rate'] == 0.5
+    assert statistics['bytes'] == QueryCache.result_size(ROWS)
+
+def test_least_recently_used_is_evicted(clock):
+    cache = cache_for(2)
+    put(cache, 'a')
+    put(cache, 'b')
+    cache.get('a')                                          # b is now the oldest use
+    put(cache, 'c')
+    assert list(cache.entries) == ['a', 'c']
+    assert cache.get('b') == (False, None)
+    assert cache.statistics()['evictions'] == 1
+
+def test_entries_expire(clock):
+    cache = cache_for(2, ttl=10)
+    put(cache, 'a')
+    clock.now += 9.9
+    assert cache.get('a') == (True, ROWS)
+    clock.now += 0.2
+    assert cache.get('a') == (False, None)
+    assert cache.statistics()['expirations'] == 1
+    assert cache.size == 0
+
+def test_byte_cap(clock):
+    cache = cache_for(3)
+    for key in range(10):
+        put(cache, key)
+        assert cache.size <= cache.max_bytes
+    assert list(cache.entries) == [7, 8, 9]
+    assert cache.size == 3 * QueryCache.result_size(ROWS)
+
+def test_result_larger_than_budget_is_not_cached(clock):
+    cache = cache_for(1)
+    put(cache, 'a')
+    put(cache, 'big', ROWS * 10)
+    assert cache.get('big') == (False, None)
+    assert cache.get('a') == (True, ROWS)
+
+def test_invalidate_table(clock):
+    cache = cache_for(3)
+    put(cache, 'a', tables=('in450a',))
+    put(cache, 'b', tables=('in450b',))
+    cache.invalidate('in450a')
+    assert list(cache.entries) == ['b']
+    cache.invalidate()
+    assert not cache.entries
+    assert cache.statistics()['invalidations'] == 2
+
+def test_result_read_during_a_change_is_refused(clock):
+    cache = cache_for(2)
+    version = cache.version(('in450a',))
+    cache.invalidate('in450a')                              # The table changed while the query ran
+    cache.put('a', ROWS, ('in450a',), version)
+    assert cache.get('a') == (False, None)
@@ -0,0 +1,80 @@
+# tests/test_query_stats.py
+"""
+Author          :   Alexander Shelton
+Date            :   October 2024
+Name            :   Database Application
+Description     :   Tests of the query timings and the slow query log.
+"""
+# ----- Imports ----- #
+import json
+import business_layer
+from business_layer import LATENCY_BUCKETS, BusinessLayer, QueryStats
+
+def layer(stats):
+    """
+    Returns a BusinessLayer without connections, enough for `_observe`.
+    """
+    layer = BusinessLayer.__new__(BusinessLayer)
+    layer.user = 'IN450a'
+    layer.stats = stats
+    return layer
+
+def read_log(path):
+    with open(path, encoding='utf-8') as log:
+        return [json.loads(line) for line in log]
+
+# ----- result_bytes ----- #
+def test_result_bytes():
+    assert QueryStats.result_bytes([]) == 0
+    assert QueryStats.result_bytes([('TCP', 60, None), ('UDP', 1500, 'x')]) == 3 + 2 + 3 + 4 + 1
+
+def test_result_bytes_scales_the_sample(monkeypatch):
+    monkeypatch.setattr(business_layer, 'SIZE_SAMPLE', 2)
+    rows = [('ab',), ('cd',), ('efghij',)]
+    assert QueryStats.result_bytes(rows) == 6
+    assert QueryStats.result_bytes(rows[:2], count=10) == 20
+
+# ----- record ----- #
+def test_record_fills_the_histogram():
+    stats = QueryStats(log_path=None)
+    entry = stats.record('get_count', 0.003, 0.001, 1, 8)
+    stats.record('get_count', 0.0005, 0, 1, 8)
+    stats.record('get_page', 10.0, 0, 50, 4000)
+    assert entry['total_ms'] == 4.0
+    recent, histograms = stats.snapshot()
+    assert [call['name'] for call in recent] == ['get_count', 'get_count', 'get_page']
+    assert histograms['get_count'][:3] == [1, 0, 1]
+    assert histograms['get_page'][LATENCY_BUCKETS.index(float('inf'))] == 1
+
+def test_history_is_bounded():
+    stats = QueryStats(log_path=None, history=2)
+    for number in range(3):
+        stats.record(f"q{number}", 0, 0, 0, 0)
+    assert [call['name'] for call in stats.snapshot()[0]] == ['q1', 'q2']
+    stats.clear()
+    assert stats.snapshot() == ([], {})
+
+def test_is_slow(tmp_path):
+    stats = QueryStats(slow_ms=100, log_path=str(tmp_path / 'slow.jsonl'))
+    assert stats.is_slow(stats.record('a', 0.1, 0, 0, 0))
+    assert not stats.is_slow(stats.record('b', 0.05, 0, 0, 0))
+    assert not stats.is_slow(stats.record('c', 0.2, 0, 0, 0, cached=True))
+    assert not QueryStats(slow_ms=0, log_path=None).is_slow(stats.record('d', 1, 0, 0, 0))
+
+# ----- Slow query log ----- #
+def test_slow_call_is_logged(tmp_path):
+    path = tmp_path / 'slow.jsonl'
+    observed = layer(QueryStats(slow_ms=100, log_path=str(path), explain=False))
+    observed._observe('get_page', 0.2, 0.05, 50, 4000, b'SELECT * FROM in450a LIMIT 50;')
+    observed._observe('get_count', 0.001, 0, 1, 8, 'SELECT count(*) FROM in450a;')
+    (record,) = read_log(path)
+    assert record['name'] == 'get_page'
+    assert (record['execute_ms'], record['fetch_ms'], record['rows']) == (200.0, 50.0, 50)
+    assert (record['user'], record['query']) == ('IN450a', 'SELECT * FROM in450a LIMIT 50;')
+    assert 'time' not in record and 'plan' not in record and 'timestamp' in record
+
+def test_slow_call_is_logged_with_its_plan(tmp_path):
+    path = tmp_path / 'slow.jsonl'
+    stats = QueryStats(slow_ms=0, log_path=str(path))
+    stats.log_slow(stats.record('get_page', 1, 0, 0, 0), 'SELECT 1;', 'IN450a', [{'Plan': {}}])
+    assert read_log(path)[0]['plan'] == [{'Plan': {}}]
@@ -0,0 +1,103 @@
+# tests/test_traffic.py
+"""
+Author          :   Alexander Shelton
+Date            :   October 2024
+Name            :   Database Application
+Description     :   Tests of the in450a traffic analytics of the BusinessLayer.
+"""
+# ----- Imports ----- #
+import queue
+import threading
+import types
+from decimal import Decimal
+import business_layer
+from business_layer import BusinessLayer, QueryCache
+
+BUCKETS = [(0, 10, 600), (1, 5, 300)]
+
+class FakeCursor:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, statement, params=None):
+        pass
+
+class FakeConnection:
+    """
+    A LISTENing psycopg2 connection that receives the notifications passed to `notify`.
+    """
+    def __init__(self):
+        self.autocommit = False
+        self.notifies = []
+        self._pending = queue.Queue()
+        self._ready = threading.Event()
+
+    def cursor(self):
+        return FakeCursor()
+
+    def notify(self, payload):
+        self._pending.put(types.SimpleNamespace(payload=payload))
+        self._ready.set()
+
+    def wait(self, timeout):
+        """
+        Stands in for select.select on the connection.
+        """
+        if self._ready.wait(timeout):
+            self._ready.clear()
+            return [self], [], []
+        return [], [], []
+
+    def poll(self):
+        while not self._pending.empty():
+            self.notifies.append(self._pending.get())
+
+    def close(self):
+        pass
+
+def layer():
+    """
+    Returns a BusinessLayer without a pool whose queries return BUCKETS and are recorded
+    in its `queries`.
+    """
+    layer = BusinessLayer.__new__(BusinessLayer)
+    layer.cache = QueryCache()
+    layer._connect_args = {}
+    layer._stop = threading.Event()
+    layer._series = {}
+    layer._series_lock = threading.Lock()
+    layer._watchers = {}
+    layer._listener = None
+    layer._listener_lock = threading.Lock()
+    layer.queries = []
+
+    def query(statement, params=None, one=False, tables=None, prepared=False, *, name):
+        layer.queries.append(params)
+        return BUCKETS
+
+    layer._query = query
+    return layer
+
+def test_buckets_are_recomputed_after_a_change(monkeypatch):
+    conn = FakeConnection()
+    monkeypatch.setattr(business_layer.psycopg2, 'connect', lambda **args: conn)
+    monkeypatch.setattr(business_layer.select, 'select', lambda read, write, error, timeout: conn.wait(timeout))
+    traffic = layer()
+    changes = queue.Queue()
+    traffic.watch('in450a', changes.put)
+    try:
+        changes.get(timeout=5)                              # The listener connected
+        assert traffic.get_traffic_over_time(1) == [(0, 10, 600), (1, 5, 300)]
+        traffic.get_traffic_over_time(1)
+        assert traffic.queries == [(Decimal(1),), (Decimal(1), Decimal(1))]
+
+        conn.notify('in450a')
+        changes.get(timeout=5)
+        traffic.get_traffic_over_time(1)
+        assert traffic.queries[-1] == (Decimal(1),)
+    finally:
+        traffic._stop.set()
+        traffic._listener.join(5)
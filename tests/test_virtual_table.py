@@ -0,0 +1,87 @@
+# tests/test_virtual_table.py
+"""
+Author          :   Alexander Shelton
+Date            :   October 2024
+Name            :   Database Application
+Description     :   Tests of the page fetching of the VirtualTable.
+"""
+# ----- Imports ----- #
+from presentation_layer import VirtualTable
+
+class FakeTree:
+    """
+    Stands in for the ttk.Treeview, holding the values of its items in a list.
+    """
+    def __init__(self):
+        self.items = []
+
+    def bind(self, sequence, callback, add=None):
+        pass
+
+    def config(self, **options):
+        pass
+
+    def get_children(self):
+        return tuple(range(len(self.items)))
+
+    def item(self, item, values):
+        self.items[item] = values
+
+    def insert(self, parent, index, values):
+        self.items.append(values)
+
+    def delete(self, *items):
+        del self.items[min(items, default=len(self.items)):]
+
+    def selection(self):
+        return ()
+
+    def selection_remove(self, *items):
+        pass
+
+    def bbox(self, item):
+        return ''                                           # Keeps the number of visible rows as set
+
+class FakeWidget:
+    def set(self, *args):
+        pass
+
+    def config(self, **options):
+        pass
+
+class FakeRunner:
+    """
+    Stands in for the QueryRunner, recording the keys of the jobs instead of running them.
+    """
+    def __init__(self):
+        self.submitted = []
+
+    def submit(self, key, job, on_done, on_error=None):
+        self.submitted.append(key)
+
+    def cancel(self, key):
+        pass
+
+def table(total, visible, page_size):
+    runner = FakeRunner()
+    virtual = VirtualTable(FakeTree(), FakeWidget(), FakeWidget(), runner, page_size=page_size)
+    virtual.visible = visible
+    virtual.load(total, lambda offset, limit: [])
+    return virtual, runner
+
+def test_next_page_is_fetched_when_the_window_ends_on_a_page_boundary():
+    virtual, runner = table(total=200, visible=10, page_size=50)
+    virtual.scroll_to(40)                                   # Rows 40-49, the end of page 0
+    assert runner.submitted == ['page-0', 'page-1']
+
+def test_next_page_is_fetched_within_a_window_of_its_start():
+    virtual, runner = table(total=200, visible=10, page_size=50)
+    virtual.scroll_to(30)
+    assert runner.submitted == ['page-0', 'page-1']
+    virtual.scroll_to(20)
+    assert virtual.pending == {0}
+
+def test_no_page_is_fetched_past_the_end():
+    virtual, runner = table(total=50, visible=10, page_size=50)
+    virtual.scroll_to(40)
+    assert runner.submitted == ['page-0']